@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the cache classes against a local redis-server
+
+This starts its own redis-server (over TCP or a unix socket) so results don't
+depend on whatever else is running, every benchmark is timed op by op so we
+get ops/s and p50/p99 latency for each payload size, and the results are
+written as a JSON report that can be diffed between versions
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --unix-socket --sizes 10,1000 --filter dict
+    python benchmarks/run.py --dsn redis://localhost/15 # FLUSHDB's db 15!
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import sys
+import json
+import logging
+import time
+import shutil
+import argparse
+import platform
+import datetime
+
+# benchmark the working tree, not whatever caches is installed, this also
+# makes the tests package (and its RedisServer) importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import caches
+from caches import (
+    Cache,
+    DictCache,
+    SetCache,
+    SortedSetCache,
+    SentinelCache,
+    cached,
+)
+from tests import RedisServer
+
+
+# the tests package logs every command, which would be timed too
+logging.getLogger().setLevel(logging.WARNING)
+
+
+benchmarks = []
+"""holds (name, sized, factory) tuples in the order they were defined"""
+
+
+def benchmark(name, sized=True):
+    """register a benchmark
+
+    The decorated factory receives the payload and the iteration count, does
+    any setup it needs and returns the callable that will be timed, the
+    callable is passed the iteration index
+
+    :param name: str, the benchmark name (eg, cache.get)
+    :param sized: bool, False if the payload size doesn't matter, these only
+        run with the smallest size
+    """
+    def decorator(factory):
+        benchmarks.append((name, sized, factory))
+        return factory
+    return decorator
+
+
+@benchmark("cache.set")
+def cache_set(payload, n):
+    def op(i):
+        Cache(["bench", i]).data = payload
+    return op
+
+
+@benchmark("cache.get")
+def cache_get(payload, n):
+    for i in range(n):
+        Cache(["bench", i]).data = payload
+
+    def op(i):
+        Cache(["bench", i]).data
+    return op
+
+
+@benchmark("cache.increment", sized=False)
+def cache_increment(payload, n):
+    def op(i):
+        Cache("bench", serialize=False).increment(1)
+    return op
+
+
+@benchmark("dict.set")
+def dict_set(payload, n):
+    def op(i):
+        DictCache("bench")[i] = payload
+    return op
+
+
+@benchmark("dict.get")
+def dict_get(payload, n):
+    d = DictCache("bench")
+    for i in range(n):
+        d[i] = payload
+
+    def op(i):
+        DictCache("bench")[i]
+    return op
+
+
+@benchmark("dict.items")
+def dict_items(payload, n):
+    DictCache("bench", {i: payload for i in range(10)})
+
+    def op(i):
+        list(DictCache("bench").items())
+    return op
+
+
+@benchmark("set.add")
+def set_add(payload, n):
+    def op(i):
+        SetCache("bench").add(payload + str(i).encode())
+    return op
+
+
+@benchmark("set.contains")
+def set_contains(payload, n):
+    SetCache("bench").update(payload + str(i).encode() for i in range(n))
+
+    def op(i):
+        (payload + str(i).encode()) in SetCache("bench")
+    return op
+
+
+@benchmark("set.iter")
+def set_iter(payload, n):
+    SetCache("bench").update(payload + str(i).encode() for i in range(10))
+
+    def op(i):
+        list(SetCache("bench"))
+    return op
+
+
+@benchmark("sortedset.add")
+def sortedset_add(payload, n):
+    def op(i):
+        SortedSetCache("bench").add((i, payload + str(i).encode()))
+    return op
+
+
+@benchmark("sortedset.pop")
+def sortedset_pop(payload, n):
+    SortedSetCache("bench").update(
+        (i, payload + str(i).encode()) for i in range(n)
+    )
+
+    def op(i):
+        SortedSetCache("bench").pop()
+    return op
+
+
+@benchmark("sortedset.chunk")
+def sortedset_chunk(payload, n):
+    SortedSetCache("bench").update(
+        (i, payload + str(i).encode()) for i in range(10)
+    )
+
+    def op(i):
+        list(SortedSetCache("bench").chunk(chunk=5))
+    return op
+
+
+@benchmark("sentinel.acquire", sized=False)
+def sentinel_acquire(payload, n):
+    def op(i):
+        SentinelCache(["bench", i]).acquire()
+    return op
+
+
+@benchmark("cached.hit")
+def cached_hit(payload, n):
+    @cached(Cache, key="bench")
+    def foo():
+        return payload
+
+    foo()
+    def op(i):
+        foo()
+    return op
+
+
+@benchmark("cached.miss")
+def cached_miss(payload, n):
+    @cached(Cache, key=lambda i: ["bench", i])
+    def foo(i):
+        return payload
+
+    def op(i):
+        foo(i)
+    return op
+
+
+def percentile(latencies, p):
+    """return the pth percentile of sorted latencies"""
+    i = min(int(round(p / 100.0 * (len(latencies) - 1))), len(latencies) - 1)
+    return latencies[i]
+
+
+def run(name, factory, size, n):
+    """run one benchmark and return its result dict"""
+    interface = caches.get_interface()
+    interface.flushdb()
+
+    payload = b"x" * size
+    op = factory(payload, n)
+
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for i in range(n):
+        s = clock()
+        op(i)
+        latencies.append(clock() - s)
+    total = clock() - start
+
+    latencies.sort()
+    return {
+        "name": name,
+        "size": size,
+        "iterations": n,
+        "ops_per_sec": round(n / total, 2),
+        "mean_ms": round(total / n * 1000, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--dsn",
+        help="use this server instead of starting one, its db gets FLUSHDB'd",
+    )
+    parser.add_argument(
+        "--unix-socket",
+        action="store_true",
+        help="connect to the started redis-server over a unix socket",
+    )
+    parser.add_argument(
+        "--redis-server",
+        default=shutil.which("redis-server"),
+        help="path to the redis-server binary",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10,1000,100000,1000000",
+        help="comma separated payload sizes in bytes",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=2000,
+        help="how many times each op runs",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="large payloads run fewer iterations so each benchmark moves at most this many bytes",
+    )
+    parser.add_argument(
+        "--filter",
+        default="",
+        help="only run benchmarks whose name contains this",
+    )
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    server = None
+    dsn = args.dsn
+    if not dsn:
+        if not args.redis_server:
+            parser.error("redis-server was not found, pass --redis-server or --dsn")
+        server = RedisServer(
+            path=args.redis_server,
+            unix_socket=args.unix_socket,
+        ).start()
+        dsn = server.dsn
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    try:
+        caches.configure(dsn)
+        interface = caches.get_interface()
+        info = interface.info("server")
+
+        results = []
+        print("{:<20} {:>9} {:>7} {:>12} {:>10} {:>10}".format(
+            "benchmark", "size", "n", "ops/s", "p50 ms", "p99 ms",
+        ))
+        for name, sized, factory in benchmarks:
+            if args.filter not in name:
+                continue
+
+            for size in (sizes if sized else sizes[:1]):
+                n = max(min(args.iterations, args.max_bytes // size), 10)
+                result = run(name, factory, size, n)
+                results.append(result)
+                print("{name:<20} {size:>9} {iterations:>7} {ops_per_sec:>12} {p50_ms:>10} {p99_ms:>10}".format(
+                    **result
+                ))
+
+        interface.flushdb()
+
+    finally:
+        if server:
+            server.stop()
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "caches_version": caches.__version__,
+        "python_version": platform.python_version(),
+        "redis_version": info.get("redis_version"),
+        "transport": "unix" if args.unix_socket and not args.dsn else "tcp",
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
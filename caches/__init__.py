@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 from caches.compat import *
 from caches.core import (
@@ -8,9 +10,32 @@ from caches.core import (
     DictCache,
     SetCache,
     SortedSetCache,
+    ListCache,
     SentinelCache,
+    RateLimitCache,
+    LockCache,
+    HyperLogLogCache,
+    BloomCache,
+    BitmapCache,
+    StreamCache,
 )
-from .interface import get_interfaces, get_interface, set_interface
+from .interface import (
+    get_interfaces,
+    get_interface,
+    set_interface,
+    set_interface_factory,
+    read_your_writes,
+)
+from .metrics import (
+    set_metrics,
+    get_metrics,
+    enable_stats,
+    stats,
+    reset_stats,
+    enable_hotkeys,
+    hotkeys,
+)
+from .tracing import set_tracer
 from .dsn import configure, configure_environ
 from .decorators import cached
 
@@ -21,27 +46,63 @@ __version__ = '3.0.0'
 logger = logging.getLogger(__name__)
 
 
-def unsafe_clear(pattern):
+def unsafe_clear(pattern, count=500, dry_run=False, callback=None, max_workers=None):
     """Clear the keys matching pattern
 
-    This uses scan to find keys matching pattern (eg, foo*) and delets them one
-    at a time
+    This uses scan to find keys matching pattern (eg, foo*) and deletes them
+    with UNLINK in pipelines of count keys, every primary server of every
+    interface is scanned in its own thread
 
     https://github.com/redis/redis/issues/2042
     https://stackoverflow.com/a/4006575/5006
+    https://redis.io/commands/unlink/
 
     :param pattern: str, something like foo* or *bar*
-    :returns: int, how many keys were deleted
+    :param count: int, how many keys to scan and unlink per round trip
+    :param dry_run: bool, True to only count the matching keys
+    :param callback: callable[str, int], called after every batch with the
+        connection name and how many keys were in the batch
+    :param max_workers: int, how many servers to clear at the same time,
+        defaults to all of them
+    :returns: int, how many keys were deleted (or matched if dry_run)
     """
-    count = 0
+    nodes = {}
     for connection_name, inter in get_interfaces().items():
+        for node in inter.get_primary_nodes():
+            # connection names that point to the same server can share a pool
+            pool = getattr(node, "connection_pool", node)
+            nodes.setdefault(id(pool), (connection_name, node))
+
+    def clear(connection_name, node):
+        total = 0
         # https://redis.io/commands/scan
         # https://stackoverflow.com/a/34166690/5006
-        for key in inter.scan_iter(match=pattern, count=500):
-            inter.delete(String(key))
-            count += 1
+        scan = node.scan_iter(match=pattern, count=count)
+        keys = list(itertools.islice(scan, count))
+        while keys:
+            if dry_run:
+                total += len(keys)
+
+            else:
+                with node.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.unlink(key)
+                    total += sum(pipe.execute())
+
+            if callback:
+                callback(connection_name, len(keys))
+
+            keys = list(itertools.islice(scan, count))
+
+        return total
+
+    if not nodes:
+        return 0
 
-    return count
+    max_workers = max_workers or len(nodes)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(clear, *v) for v in nodes.values()]
+        return sum(future.result() for future in futures)
 
 
 configure_environ()
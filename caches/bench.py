@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Load test a redis server with worker processes running a mix of cache operations
+
+    python -m caches.bench --dsn redis://localhost/0 --workers 8 --seconds 30
+
+Every worker process (and every thread in it) runs the operations of the mix
+as fast as it can, so comparing runs with more workers or threads shows where
+throughput stops scaling: per call overhead shows up as client cpu per op, the
+GIL as throughput that doesn't grow with threads, and pool contention as tail
+latency that grows with threads while throughput stays flat
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import sys
+import time
+import random
+import itertools
+import threading
+import argparse
+import multiprocessing
+from queue import Empty
+
+import redis
+
+import caches
+from .compat import *
+from .core import Cache, DictCache, SetCache, SortedSetCache
+from .decorators import cached
+from .dsn import DSN
+from .metrics import Histogram
+
+
+class BenchCache(Cache):
+    prefix = "caches.bench.Cache"
+    ttl = 600
+
+
+class BenchDictCache(DictCache):
+    prefix = "caches.bench.DictCache"
+    ttl = 600
+
+
+class BenchSetCache(SetCache):
+    prefix = "caches.bench.SetCache"
+    ttl = 600
+
+
+class BenchSortedSetCache(SortedSetCache):
+    prefix = "caches.bench.SortedSetCache"
+    ttl = 600
+
+
+@cached(BenchCache, key=lambda k, value: ["cached", k])
+def bench_cached(k, value):
+    return value
+
+
+def op_cache(k, value, write):
+    if write:
+        BenchCache(k).data = value
+    else:
+        BenchCache(k).data
+
+
+def op_dict(k, value, write):
+    d = BenchDictCache(k % 16)
+    if write:
+        d[String(k)] = value
+    else:
+        d.get(String(k))
+
+
+def op_set(k, value, write):
+    s = BenchSetCache(k % 16)
+    if write:
+        s.add(k)
+    else:
+        k in s
+
+
+def op_sortedset(k, value, write):
+    s = BenchSortedSetCache(k % 16)
+    if write:
+        s.increment(k, 1)
+    else:
+        k in s
+
+
+def op_cached(k, value, write):
+    if write:
+        del BenchCache(["cached", k]).data
+    bench_cached(k, value)
+
+
+operations = {
+    "cache": op_cache,
+    "dict": op_dict,
+    "set": op_set,
+    "sortedset": op_sortedset,
+    "cached": op_cached,
+}
+"""the operations a mix can contain, each is called with (key number, value,
+True if it should write)"""
+
+
+def parse_mix(mix):
+    """parse a mix like cache=4,dict=2 into a dict of operation weights
+
+    :param mix: str
+    :returns: dict[str, float]
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in operations:
+            raise ValueError("Unknown operation {}, use one of {}".format(
+                name,
+                ", ".join(sorted(operations.keys())),
+            ))
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def work(dsn, mix, seconds, threads, keys, value_size, write_ratio, queue):
+    """The body of a worker process, runs the mix in threads for seconds and
+    puts the results on queue
+
+    :returns: dict, the histogram (in microseconds) and error count of every
+        operation, the process's cpu seconds, and the seconds it ran
+    """
+    caches.configure(dsn)
+    names = list(mix.keys())
+    weights = list(mix.values())
+    value = "x" * value_size
+    results = [
+        {name: [Histogram(), 0] for name in names} for _ in range(threads)
+    ]
+
+    def run(result, stop):
+        rand = random.Random()
+        while time.perf_counter() < stop:
+            name = rand.choices(names, weights)[0]
+            k = rand.randrange(keys)
+            write = rand.random() < write_ratio
+            start = time.perf_counter()
+            try:
+                operations[name](k, value, write)
+                result[name][0].record((time.perf_counter() - start) * 1000000)
+
+            except redis.RedisError:
+                result[name][1] += 1
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    ts = [
+        threading.Thread(target=run, args=(result, start + seconds))
+        for result in results
+    ]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+    ret = {
+        "ops": {},
+        "cpu": time.process_time() - cpu,
+        "seconds": time.perf_counter() - start,
+    }
+    for result in results:
+        for name, (h, errors) in result.items():
+            total = ret["ops"].setdefault(name, [Histogram(), 0])
+            total[0].merge(h)
+            total[1] += errors
+
+    queue.put(ret)
+
+
+def run(
+    dsn,
+    workers=None,
+    seconds=10,
+    threads=1,
+    mix="cache=4,dict=2,set=1,sortedset=1,cached=2",
+    keys=1000,
+    value_size=100,
+    write_ratio=0.1,
+):
+    """Run the load test and return the aggregated results
+
+    :param dsn: str, the server to load
+    :param workers: int, how many processes, defaults to the number of cpus
+    :param seconds: float, how long every worker runs the mix
+    :param threads: int, how many threads every worker runs the mix in
+    :param mix: str, the operations and their weights (eg, cache=4,dict=1)
+    :param keys: int, how many keys every operation spreads over
+    :param value_size: int, how big the written values are
+    :param write_ratio: float, the share of operations that write
+    :returns: dict
+    """
+    workers = workers or os.cpu_count() or 1
+    mix = parse_mix(mix)
+    interface = DSN(dsn).interface()
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=work,
+            args=(dsn, mix, seconds, threads, keys, value_size, write_ratio, queue),
+        ) for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+
+    # the server's connection count while the workers run
+    clients = []
+    results = []
+    while len(results) < workers:
+        try:
+            clients.append(int(interface.info("clients")["connected_clients"]))
+
+        except (redis.RedisError, KeyError):
+            pass
+
+        try:
+            results.append(queue.get(timeout=0.5))
+
+        except Empty:
+            if not any(p.is_alive() for p in processes) and queue.empty():
+                break
+
+    for p in processes:
+        p.join()
+
+    ops = {}
+    cpu = 0.0
+    throughput = 0.0
+    for result in results:
+        cpu += result["cpu"]
+        count = 0
+        for name, (h, errors) in result["ops"].items():
+            total = ops.setdefault(name, [Histogram(), 0])
+            total[0].merge(h)
+            total[1] += errors
+            count += h.count
+        throughput += count / result["seconds"]
+
+    everything = Histogram()
+    for h, errors in ops.values():
+        everything.merge(h)
+
+    ret = {
+        "workers": workers,
+        "threads": threads,
+        "seconds": seconds,
+        "finished": len(results),
+        "throughput": throughput,
+        "cpu_per_op": (cpu / everything.count * 1000000) if everything.count else 0,
+        "clients": {
+            "max": max(clients) if clients else 0,
+            "mean": (sum(clients) / len(clients)) if clients else 0,
+        },
+        "latency": {},
+    }
+    for name, (h, errors) in itertools.chain(
+        sorted(ops.items()),
+        [("all", (everything, sum(e for h, e in ops.values())))]
+    ):
+        ret["latency"][name] = {
+            "count": h.count,
+            "errors": errors,
+            "mean": h.mean(),
+            "p50": h.percentile(50),
+            "p99": h.percentile(99),
+            "p999": h.percentile(99.9),
+            "max": h.max or 0,
+        }
+
+    return ret
+
+
+def main(argv=None):
+    """Load test a redis server and print the throughput and latencies"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "--dsn",
+        default=os.environ.get("CACHES_DSN", "redis://localhost/0"),
+        help="the server to load, defaults to CACHES_DSN",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="how many processes, defaults to the cpu count")
+    parser.add_argument("--threads", type=int, default=1, help="how many threads per process")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to run")
+    parser.add_argument(
+        "--mix",
+        default="cache=4,dict=2,set=1,sortedset=1,cached=2",
+        help="the operations and their weights, any of {}".format(
+            ", ".join(sorted(operations.keys()))
+        ),
+    )
+    parser.add_argument("--keys", type=int, default=1000, help="how many keys to spread the operations over")
+    parser.add_argument("--value-size", type=int, default=100, help="how many bytes the written values are")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="the share of operations that write")
+    parser.add_argument("--keep", action="store_true", help="don't delete the keys when done")
+    args = parser.parse_args(argv)
+
+    try:
+        r = run(
+            args.dsn,
+            workers=args.workers,
+            seconds=args.seconds,
+            threads=args.threads,
+            mix=args.mix,
+            keys=args.keys,
+            value_size=args.value_size,
+            write_ratio=args.write_ratio,
+        )
+
+    finally:
+        if not args.keep:
+            caches.configure(args.dsn)
+            caches.unsafe_clear("caches.bench.*")
+
+    print("{} workers x {} threads for {}s".format(
+        r["workers"],
+        r["threads"],
+        r["seconds"],
+    ))
+    print("{:>12.0f}  ops/s".format(r["throughput"]))
+    print("{:>12.1f}  client cpu us/op".format(r["cpu_per_op"]))
+    print("{:>12}  max connections ({:.1f} mean)".format(
+        r["clients"]["max"],
+        r["clients"]["mean"],
+    ))
+
+    print("")
+    print("{:<10}{:>10}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "us", "count", "errors", "p50", "p99", "p99.9", "max"
+    ))
+    for name, l in r["latency"].items():
+        print("{:<10}{:>10}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+            name,
+            l["count"],
+            l["errors"],
+            l["p50"],
+            l["p99"],
+            l["p999"],
+            l["max"],
+        ))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,49 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import itertools
+import io
+import time
+import collections
+import uuid
+import random
+import threading
+import math
+import hashlib
 from contextlib import contextmanager
 
+import redis
+
 from .compat import *
-from .decorators import classproperty, cached
-from .interface import get_interface
+from .decorators import hybridproperty, hybridmethod, cached
+from .interface import get_interface, Script
+from .exception import LockError
+from .tracing import traced
+from . import metrics
+
+
+namespace_generations = {}
+"""locally caches (generation, expires) tuples for generational caches, keyed
+by the interface the generation was read from and the generation key"""
+
+chunk_manifest = b"\x00caches.chunks:"
+"""the prefix of the value stored in place of a value that was split into
+chunks, it is followed by <chunk id>:<how many chunks>"""
+
+delete_chunks_lua = """
+    local function delete_chunks(v)
+        if v and string.sub(v, 1, #ARGV[1]) == ARGV[1] then
+            local id, count = string.match(
+                string.sub(v, #ARGV[1] + 1),
+                '^(%w+):(%d+)$'
+            )
+            for i = 0, tonumber(count) - 1 do
+                redis.call('HDEL', KEYS[2], id .. ':' .. i)
+            end
+        end
+    end
+"""
+"""Lua that scripts can start with to delete the chunks of the manifest v,
+the script's ARGV[1] is chunk_manifest and KEYS[2] is the chunks key"""
 
 
 class BaseCache(object):
@@ -30,10 +68,27 @@ class BaseCache(object):
     default = None
     """if no value is found in the cache, return this value"""
 
-    @classproperty
+    hash_tag = False
+    """True to wrap the key in a {hash tag}, this keeps the key and every key
+    derived from it on the same Redis Cluster slot or ShardedRedis node"""
+
+    generational = False
+    """True to embed the namespace generation in the key, every key in the
+    namespace can then be invalidated at once with invalidate_namespace()"""
+
+    generation_ttl = 5
+    """how many seconds the namespace generation is cached locally"""
+
+    chunk_size = 0
+    """values bigger than this many bytes are split into chunk_size chunks
+    that are each written and read with their own command so one huge value
+    doesn't block Redis, 0 stores every value whole"""
+
+    @hybridproperty
     def interface(cls):
         """
-        return an Interface instance that can be used to access the db
+        return an Interface instance that can be used to access the db, an
+        instance created with its own connection_name uses that connection
         return -- Interface() -- the interface instance this Orm will use
         """
         return get_interface(cls.connection_name)
@@ -45,6 +100,54 @@ class BaseCache(object):
         dec = cached(cls, *args, **kwargs)
         return dec
 
+    @classmethod
+    def get_namespace_key(cls, prefix=""):
+        """return the key that holds the namespace generation
+
+        :param prefix: str, the normalized prefix, defaults to the class prefix
+        :returns: str
+        """
+        return "{}:gen".format(prefix or cls.prefix or cls.__name__)
+
+    @hybridmethod
+    def get_namespace_generation(cls, prefix=""):
+        """return the current namespace generation, this is cached locally
+        for generation_ttl seconds, called on an instance the generation is
+        read from the instance's interface
+
+        :param prefix: str, the normalized prefix
+        :returns: int
+        """
+        gen_key = cls.get_namespace_key(prefix)
+        interface = cls.interface
+        k = (id(interface), gen_key)
+        now = time.monotonic()
+        gen, expires = namespace_generations.get(k, (0, 0))
+        if expires <= now:
+            gen = int(interface.get(gen_key) or 0)
+            namespace_generations[k] = (gen, now + cls.generation_ttl)
+        return gen
+
+    @hybridmethod
+    def invalidate_namespace(cls, prefix=""):
+        """Invalidate every key in the namespace by incrementing the namespace
+        generation, the old keys will be removed by Redis as their ttl expires
+
+        This only works for classes that set generational = True, other
+        processes will see the new generation within generation_ttl seconds
+
+        :param prefix: str, the normalized prefix, defaults to the class prefix
+        :returns: int, the new generation
+        """
+        gen_key = cls.get_namespace_key(prefix)
+        interface = cls.interface
+        gen = int(interface.incr(gen_key))
+        namespace_generations[(id(interface), gen_key)] = (
+            gen,
+            time.monotonic() + cls.generation_ttl
+        )
+        return gen
+
     def __init__(self, key="", data=None, **kwargs):
         # allow for overriding class value with passed in values
         for k, v in kwargs.items():
@@ -57,6 +160,10 @@ class BaseCache(object):
         if isinstance(key, (basestring, int)):
             key = [key]
         prefixes = [self.normalize_prefix(self.prefix)]
+        if self.generational:
+            prefixes.append("g{}".format(
+                self.get_namespace_generation(prefixes[0])
+            ))
         nkey = '.'.join(
             map(String, filter(None, itertools.chain(prefixes, key)))
         )
@@ -64,13 +171,16 @@ class BaseCache(object):
         if not nkey:
             raise ValueError("No key")
 
+        if self.hash_tag:
+            nkey = "{" + nkey + "}"
+
         return nkey
 
     def normalize_data(self, data):
         return data
 
     def normalize_ttl(self, ttl):
-        return int(self.ttl)
+        return int(ttl)
 
     def normalize_prefix(self, prefix):
         if not prefix:
@@ -83,10 +193,11 @@ class BaseCache(object):
 
     def from_interface(self, val):
         if val is None or not self.serialize: return val
-        if not isinstance(val, basestring):
+        if not isinstance(val, (basestring, bytearray, memoryview)):
             raise TypeError('Only strings can be unpickled (%r given).' % val)
         return pickle.loads(val)
 
+    @traced()
     def exists(self):
         """return True if the key exists in Redis"""
         return bool(self.interface.exists(self.key))
@@ -94,18 +205,398 @@ class BaseCache(object):
     def has(self):
         return self.exists()
 
+    @traced()
     def clear(self):
-        self.interface.delete(self.key)
+        if self.chunk_size:
+            self.interface.delete(self.key, self.get_chunks_key())
+
+        else:
+            self.interface.delete(self.key)
 
     def update(self, data):
         raise NotImplementedError()
 
+    def get_chunks_key(self):
+        """return the key of the hash that holds the chunks of the values that
+        were split, it is on the same cluster slot as the key"""
+        tag = self.key if "{" in self.key else "{{{}}}".format(self.key)
+        return "{}.chunks".format(tag)
+
+    def split_chunks(self, data):
+        """Split a value bigger than chunk_size into chunks
+
+        :param data: mixed, the value returned from to_interface()
+        :returns: tuple[mixed, dict], the value to store, which is a manifest
+            if data was split, and the chunks keyed by their field in the
+            chunks hash
+        """
+        if (
+            not self.chunk_size
+            or not isinstance(data, (basestring, bytearray))
+            or len(data) <= self.chunk_size
+        ):
+            return data, {}
+
+        data = ByteString(data)
+        chunk_id = uuid.uuid4().hex
+        chunks = {}
+        for i, start in enumerate(range(0, len(data), self.chunk_size)):
+            field = "{}:{}".format(chunk_id, i)
+            chunks[field] = data[start:start + self.chunk_size]
+
+        manifest = chunk_manifest + ByteString(
+            "{}:{}".format(chunk_id, len(chunks))
+        )
+        return manifest, chunks
+
+    def write_chunks(self, pipe, chunks):
+        """add the commands that write chunks to the chunks hash to pipe, each
+        chunk is its own command so other clients run between them
+
+        :param pipe: RedisPipeline, a pipeline that isn't a transaction
+        :param chunks: dict, the chunks returned from split_chunks()
+        """
+        if chunks:
+            chunks_key = self.get_chunks_key()
+            for field, chunk in chunks.items():
+                pipe.hset(chunks_key, field, chunk)
+
+            if self.ttl:
+                pipe.expire(chunks_key, self.normalize_ttl(self.ttl))
+
+    def get_chunk_fields(self, data):
+        """return the chunks hash fields of manifest data, None if data isn't
+        a manifest"""
+        if (
+            not self.chunk_size
+            or not isinstance(data, bytes)
+            or not data.startswith(chunk_manifest)
+        ):
+            return None
+
+        chunk_id, count = String(data[len(chunk_manifest):]).split(":")
+        return ["{}:{}".format(chunk_id, i) for i in range(int(count))]
+
+    def join_chunks(self, data, read):
+        """If data is a manifest return the value its chunks make up
+
+        The manifest and the chunks are read with different commands, so if
+        the value was replaced in between (its old chunks are deleted) the
+        manifest is read again
+
+        :param data: mixed, the value read from the interface
+        :param read: callable, reads the value from the interface again
+        :returns: mixed, None if the chunks couldn't be read
+        """
+        for _ in range(3):
+            fields = self.get_chunk_fields(data)
+            if fields is None:
+                return data
+
+            chunks = self.interface.hmget(self.get_chunks_key(), fields)
+            if None not in chunks:
+                return b"".join(chunks)
+
+            data = read()
+
+        return None
+
+    def pop_chunks(self, data):
+        """Like join_chunks() but for a manifest that was removed, its chunks
+        are deleted once they are read"""
+        fields = self.get_chunk_fields(data)
+        if fields is None:
+            return data
+
+        chunks_key = self.get_chunks_key()
+        with self.interface.pipeline(transaction=False) as pipe:
+            pipe.hmget(chunks_key, fields)
+            pipe.hdel(chunks_key, *fields)
+            chunks = pipe.execute()[0]
+
+        return None if None in chunks else b"".join(chunks)
+
     @contextmanager
     def pipeline(self, **kwargs):
         with self.interface.pipeline() as pipe:
             yield pipe
             r = pipe.execute()
 
+    def block(self, callback, timeout):
+        """Run a blocking command (eg, BLPOP) for up to timeout seconds
+
+        The interface's socket_timeout would fail any blocking command that
+        waits longer than it, so the wait is broken into server side blocking
+        calls that each fit inside the socket timeout, the caller still wakes
+        up as soon as the server has something to return
+
+        :param callback: callable[float], runs the blocking command with the
+            passed in timeout and returns None if the command timed out
+        :param timeout: float, total seconds to block, 0 to block forever
+        :returns: mixed, whatever callback returned, None if it timed out
+        """
+        interval = 0
+        socket_timeout = getattr(self.interface, "socket_timeout", None)
+        if socket_timeout:
+            interval = socket_timeout * 0.5
+
+        stop = time.monotonic() + timeout if timeout else 0
+        while True:
+            if stop:
+                remaining = stop - time.monotonic()
+                if remaining <= 0:
+                    return None
+
+                t = min(remaining, interval) if interval else remaining
+
+            else:
+                t = interval
+
+            ret = callback(t)
+            if ret is not None:
+                return ret
+
+            if not interval:
+                return None
+
+
+class CacheFile(io.RawIOBase):
+    """The raw bytes of a Cache's value as a file, reads are GETRANGE calls and
+    writes are APPEND calls so only one chunk is ever in memory, use
+    Cache.open() instead of creating this directly
+
+    Writes in w mode go to a temporary key that replaces the value (and gets
+    the cache's ttl) in one transaction when the file is closed, so readers
+    never see a partially written value
+
+    If the cache has a chunk_size the written value is never split, a value
+    that already was is read one chunk at a time with HGET, and appending
+    copies the value to the temporary key first, like w mode, since APPEND
+    would write onto the chunk manifest
+    """
+    temp_ttl = 3600
+    """a temporary key that is never closed (eg, the process died) expires
+    after this many seconds"""
+
+    def __init__(self, cache, mode="rb"):
+        super(CacheFile, self).__init__()
+        if mode.replace("b", "") not in set(["r", "w", "a"]):
+            raise ValueError("Unsupported mode {}, use rb, wb, or ab".format(mode))
+
+        self.cache = cache
+        self.key = cache.key
+        self.interface = cache.interface
+        self.mode = mode
+        self.pos = 0
+        self.discarded = False
+        self.fields = None
+        """the chunks hash fields when the value was split into chunks"""
+        self.chunk = None
+        """the (index, data) of the last chunk that was read"""
+
+        if "r" in mode:
+            with self.interface.pipeline(transaction=False) as pipe:
+                pipe.exists(self.key)
+                pipe.strlen(self.key)
+                if cache.chunk_size:
+                    pipe.getrange(self.key, 0, len(chunk_manifest) - 1)
+                res = pipe.execute()
+            exists, self.size = res[0], res[1]
+            if not exists:
+                raise KeyError(self.key)
+
+            if cache.chunk_size and res[2] == chunk_manifest:
+                self.open_chunks()
+
+        elif "w" in mode or cache.chunk_size:
+            # the temporary key has to be on the same cluster slot as the key
+            # for the RENAME
+            tag = self.key if "{" in self.key else "{{{}}}".format(self.key)
+            self.write_key = "{}.open.{}".format(tag, uuid.uuid4().hex)
+
+            if "a" in mode:
+                self.copy()
+
+        else:
+            self.write_key = self.key
+
+    def open_chunks(self):
+        """Read the manifest of a value that was split into chunks, the chunks
+        are read as they are needed
+
+        Every chunk but the last is as big as the chunk_size the value was
+        written with, so the first and last chunk sizes give the offset of
+        every chunk
+        """
+        chunks_key = self.cache.get_chunks_key()
+        for _ in range(3):
+            with self.interface.pipeline(transaction=False) as pipe:
+                pipe.get(self.key)
+                pipe.strlen(self.key)
+                manifest, size = pipe.execute()
+
+            fields = self.cache.get_chunk_fields(manifest)
+            if fields is None:
+                if manifest is None:
+                    raise KeyError(self.key)
+
+                # it was replaced by a value that wasn't split
+                self.size = size
+                return
+
+            with self.interface.pipeline(transaction=False) as pipe:
+                pipe.hstrlen(chunks_key, fields[0])
+                pipe.hstrlen(chunks_key, fields[-1])
+                first, last = pipe.execute()
+
+            if first and last:
+                self.fields = fields
+                self.chunk_length = first
+                self.size = first * (len(fields) - 1) + last
+                return
+
+        raise KeyError(self.key)
+
+    def copy(self):
+        """append the current value to the temporary key stream_size bytes at
+        a time"""
+        try:
+            f = CacheFile(self.cache, "rb")
+
+        except KeyError:
+            return
+
+        try:
+            while True:
+                data = f.read(self.cache.stream_size)
+                if not data:
+                    break
+                self.write(data)
+
+        finally:
+            f.close()
+
+    def readable(self):
+        return "r" in self.mode
+
+    def writable(self):
+        return not self.readable()
+
+    def seekable(self):
+        return self.readable()
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self.seekable():
+            raise io.UnsupportedOperation("seek")
+
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, b):
+        if self.pos >= self.size:
+            return 0
+
+        end = min(self.pos + len(b), self.size) - 1
+        if self.fields is None:
+            data = self.interface.getrange(self.key, self.pos, end)
+
+        else:
+            # only the chunk pos is in is read, a short read is fine since the
+            # buffered reader keeps reading until it has what it needs
+            i = self.pos // self.chunk_length
+            if self.chunk is None or self.chunk[0] != i:
+                chunk = self.interface.hget(
+                    self.cache.get_chunks_key(),
+                    self.fields[i],
+                )
+                if chunk is None:
+                    raise IOError("{} was replaced while it was read".format(self.key))
+                self.chunk = (i, chunk)
+
+            start = self.pos - (i * self.chunk_length)
+            data = self.chunk[1][start:start + end + 1 - self.pos]
+        n = len(data)
+        b[:n] = data
+        self.pos += n
+        return n
+
+    def write(self, b):
+        if self.pos == 0 and self.write_key != self.key:
+            with self.interface.pipeline(transaction=False) as pipe:
+                pipe.append(self.write_key, b)
+                pipe.expire(self.write_key, self.temp_ttl)
+                pipe.execute()
+
+        else:
+            self.interface.append(self.write_key, b)
+
+        n = len(b)
+        self.pos += n
+        return n
+
+    def discard(self):
+        """throw away what was written instead of replacing the value"""
+        self.discarded = True
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self.writable():
+                self.commit()
+
+        finally:
+            super(CacheFile, self).close()
+
+    def commit(self):
+        ttl = self.cache.ttl
+        with self.interface.pipeline() as pipe:
+            if self.write_key != self.key:
+                if self.discarded:
+                    pipe.delete(self.write_key)
+
+                else:
+                    if self.pos:
+                        pipe.rename(self.write_key, self.key)
+                    elif "w" in self.mode:
+                        pipe.set(self.key, b"")
+
+                    if self.cache.chunk_size:
+                        pipe.delete(self.cache.get_chunks_key())
+
+                    if ttl:
+                        pipe.expire(self.key, self.cache.normalize_ttl(ttl))
+                    else:
+                        pipe.persist(self.key)
+
+            elif ttl:
+                pipe.expire(self.key, self.cache.normalize_ttl(ttl))
+
+            if len(pipe):
+                pipe.execute()
+
+        try:
+            delattr(self.cache, "_data")
+        except AttributeError:
+            pass
+
+
+class CacheWriter(io.BufferedWriter):
+    """Buffers the writes of a CacheFile, if the with statement raises an
+    error then the written value is thrown away"""
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.raw.discard()
+        return super(CacheWriter, self).__exit__(exc_type, exc_value, traceback)
+
 
 class Cache(BaseCache):
     """
@@ -119,32 +610,81 @@ class Cache(BaseCache):
         c2 = Cache(['foo', 'bar'])
         print c2.data # "boom, this value is now cached"
     """
+    stream_size = 1024 * 1024
+    """how many bytes open() reads or writes in each round trip"""
+
+    set_script = Script("Cache.set", delete_chunks_lua + """
+        delete_chunks(redis.call('GET', KEYS[1]))
+        redis.call('SET', KEYS[1], ARGV[2])
+        if tonumber(ARGV[3]) > 0 then
+            redis.call('EXPIRE', KEYS[1], ARGV[3])
+            redis.call('EXPIRE', KEYS[2], ARGV[3])
+        end
+        return 1
+    """)
+
     @property
+    @traced("data.get")
     def data(self):
         if not hasattr(self, '_data'):
             key = self.key
             data = self.interface.get(key)
+            if self.chunk_size:
+                data = self.join_chunks(data, lambda: self.interface.get(key))
+            stats = metrics.cache_stats
             if data is None:
+                if stats:
+                    stats.record("classes", self.__class__.__name__, misses=1)
                 data = self.default
+            elif stats:
+                data = stats.deserialize(
+                    self.__class__.__name__,
+                    self.from_interface,
+                    data
+                )
             else:
                 data = self.from_interface(data)
             self._data = self.normalize_data(data)
         return self._data
 
     @data.setter
+    @traced("data.set")
     def data(self, data):
         self._data = self.normalize_data(data)
         data = self.to_interface(self._data)
         key = self.key
-        if self.ttl:
+        stats = metrics.cache_stats
+        if stats:
+            stats.record(
+                "classes",
+                self.__class__.__name__,
+                sets=1,
+                bytes_written=metrics.payload_size(data),
+            )
+        if self.chunk_size:
+            data, chunks = self.split_chunks(data)
+            with self.interface.pipeline(transaction=False) as pipe:
+                self.write_chunks(pipe, chunks)
+                self.set_script(
+                    pipe,
+                    keys=[key, self.get_chunks_key()],
+                    args=[chunk_manifest, data, self.normalize_ttl(self.ttl)],
+                )
+                pipe.execute()
+
+        elif self.ttl:
             res = self.interface.setex(key, self.normalize_ttl(self.ttl), data)
         else:
             res = self.interface.set(key, data)
 
     @data.deleter
+    @traced("data.delete")
     def data(self):
         key = self.key
-        self.interface.delete(key)
+        if self.chunk_size:
+            self.interface.delete(key, self.get_chunks_key())
+        else:
+            self.interface.delete(key)
         try:
             delattr(self, '_data')
         except AttributeError: pass
@@ -153,9 +693,11 @@ class Cache(BaseCache):
         if data is not None:
             self.data = data
 
+    @traced()
     def clear(self):
         del self.data
 
+    @traced()
     def increment(self, delta):
         if self.serialize:
             raise ValueError("Cannot increment a serialized value")
@@ -171,6 +713,35 @@ class Cache(BaseCache):
         self._data = res
         return res
 
+    def open(self, mode="rb"):
+        """Open the raw value as a file so a big value can be streamed in
+        stream_size chunks instead of being held in memory all at once
+
+        A value that was split into chunks is read one chunk at a time, so
+        reading it holds up to chunk_size bytes in memory when that is bigger
+        than stream_size
+
+        :example:
+            with Cache("report").open("wb") as f:
+                shutil.copyfileobj(src, f)
+
+            with Cache("report").open() as f:
+                shutil.copyfileobj(f, response)
+
+            # serialized values are pickles, and pickle can stream those
+            with Cache("big").open("wb") as f:
+                pickle.dump(big, f, pickle.HIGHEST_PROTOCOL)
+
+        :param mode: str, rb to read, wb to replace the value when the file is
+            closed, ab to append to the value (with a chunk_size the value is
+            replaced when the file is closed, like wb)
+        :returns: io.BufferedReader|CacheWriter
+        """
+        raw = CacheFile(self, mode)
+        if raw.readable():
+            return io.BufferedReader(raw, self.stream_size)
+        return CacheWriter(raw, self.stream_size)
+
     def get(self, *default):
         data = self.data
         if data is None and default:
@@ -250,33 +821,130 @@ class DictCache(BaseCache, dict):
 
     https://redis.io/commands#hash
     """
+    pop_script = Script("DictCache.pop", """
+        local v = redis.call('HGET', KEYS[1], ARGV[1])
+        if v then
+            redis.call('HDEL', KEYS[1], ARGV[1])
+        end
+        return v
+    """)
+
+    popitem_script = Script("DictCache.popitem", """
+        local k = redis.call('HRANDFIELD', KEYS[1])
+        if not k then
+            return nil
+        end
+        local v = redis.call('HGET', KEYS[1], k)
+        redis.call('HDEL', KEYS[1], k)
+        return {k, v}
+    """)
+
+    setdefault_script = Script("DictCache.setdefault", """
+        local v = redis.call('HGET', KEYS[1], ARGV[1])
+        if v then
+            return v
+        end
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        if tonumber(ARGV[3]) > 0 then
+            for _, key in ipairs(KEYS) do
+                redis.call('EXPIRE', key, ARGV[3])
+            end
+        end
+        return ARGV[2]
+    """)
+
+    set_script = Script("DictCache.set", delete_chunks_lua + """
+        delete_chunks(redis.call('HGET', KEYS[1], ARGV[2]))
+        redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+        if tonumber(ARGV[4]) > 0 then
+            redis.call('EXPIRE', KEYS[1], ARGV[4])
+            redis.call('EXPIRE', KEYS[2], ARGV[4])
+        end
+        return 1
+    """)
+
+    delete_script = Script("DictCache.delete", delete_chunks_lua + """
+        delete_chunks(redis.call('HGET', KEYS[1], ARGV[2]))
+        return redis.call('HDEL', KEYS[1], ARGV[2])
+    """)
+
     def update(self, data):
         # create temp dictionary so I don't have to mess with the arguments
         d = dict(data or {})
         for k, v in d.items():
             self[k] = v
 
+    @traced()
     def __setitem__(self, k, v):
         """Set self[k] to v"""
         data = self.to_interface(self.normalize_data(v))
-        with self.pipeline() as pipe:
-            pipe.hset(self.key, k, data)
-            if self.ttl:
-                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+        stats = metrics.cache_stats
+        if stats:
+            stats.record(
+                "classes",
+                self.__class__.__name__,
+                sets=1,
+                bytes_written=metrics.payload_size(data),
+            )
+        if self.chunk_size:
+            data, chunks = self.split_chunks(data)
+            with self.interface.pipeline(transaction=False) as pipe:
+                self.write_chunks(pipe, chunks)
+                self.set_script(
+                    pipe,
+                    keys=[self.key, self.get_chunks_key()],
+                    args=[chunk_manifest, k, data, self.normalize_ttl(self.ttl)],
+                )
+                pipe.execute()
+
+        else:
+            with self.pipeline() as pipe:
+                pipe.hset(self.key, k, data)
+                if self.ttl:
+                    pipe.expire(self.key, self.normalize_ttl(self.ttl))
 
+    @traced()
     def __getitem__(self, k):
         data = self.interface.hget(self.key, k)
+        if self.chunk_size:
+            data = self.join_chunks(
+                data,
+                lambda: self.interface.hget(self.key, k)
+            )
+        stats = metrics.cache_stats
         if data is None:
-            if k not in self:
+            # with a chunk_size None can also mean the chunks of k's manifest
+            # are gone, so k existing doesn't mean there is a value
+            if self.chunk_size or k not in self:
+                if stats:
+                    stats.record("classes", self.__class__.__name__, misses=1)
                 raise KeyError(k)
-        return self.normalize_data(self.from_interface(data))
 
+        if stats:
+            data = stats.deserialize(
+                self.__class__.__name__,
+                self.from_interface,
+                data
+            )
+        else:
+            data = self.from_interface(data)
+        return self.normalize_data(data)
+
+    @traced()
     def __delitem__(self, k):
+        if self.chunk_size:
+            return self.delete_script(
+                self.interface,
+                keys=[self.key, self.get_chunks_key()],
+                args=[chunk_manifest, k],
+            )
         return self.interface.hdel(self.key, k)
 
+    @traced()
     def __contains__(self, k):
         return self.interface.hexists(self.key, k)
 
+    @traced()
     def __len__(self):
         return self.interface.hlen(self.key)
 
@@ -287,16 +955,24 @@ class DictCache(BaseCache, dict):
     def __repr__(self):
         return self.copy().__repr__()
 
+    @traced()
     def keys(self):
         for k in self.interface.hkeys(self.key):
             yield String(k)
 
+    @traced()
     def items(self):
         d = self.interface.hgetall(self.key) or {}
         for k, data in d.items():
+            if self.chunk_size:
+                data = self.join_chunks(
+                    data,
+                    lambda: self.interface.hget(self.key, k)
+                )
             v = self.normalize_data(self.from_interface(data))
             yield String(k), v
 
+    @traced()
     def values(self):
         for k, v in self.items():
             yield v
@@ -308,44 +984,119 @@ class DictCache(BaseCache, dict):
             v = default
         return v
 
+    def increment(self, k, delta=1):
+        """Atomically increment the value at field k by delta
+
+        https://redis.io/commands/hincrby/
+        https://redis.io/commands/hincrbyfloat/
+
+        :param k: str, the field
+        :param delta: int|float, if a float then HINCRBYFLOAT is used
+        :returns: int|float, the new value of the field
+        """
+        return self.increment_many({k: delta})[k]
+
+    @traced()
+    def increment_many(self, deltas):
+        """Atomically increment multiple fields in one round trip
+
+        :param deltas: dict, keys are fields and values are how much to
+            increment the field by
+        :returns: dict, the fields with their new values
+        """
+        if self.serialize:
+            raise ValueError("Cannot increment a serialized value")
+
+        deltas = dict(deltas)
+        with self.interface.pipeline() as pipe:
+            for k, delta in deltas.items():
+                if isinstance(delta, float):
+                    pipe.hincrbyfloat(self.key, k, delta)
+
+                else:
+                    pipe.hincrby(self.key, k, delta)
+
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+                if self.chunk_size:
+                    pipe.expire(
+                        self.get_chunks_key(),
+                        self.normalize_ttl(self.ttl)
+                    )
+
+            res = pipe.execute()
+
+        ret = {}
+        for k, v in zip(deltas.keys(), res):
+            ret[k] = self.normalize_data(v)
+        return ret
+
+    @traced()
     def setdefault(self, k, default=None):
-        if k not in self:
-            self[k] = default
+        """If k is in the dict return its value, otherwise set k to default and
+        return default, this is atomic"""
+        data = self.to_interface(self.normalize_data(default))
+        if self.chunk_size:
+            manifest, chunks = self.split_chunks(data)
+            with self.interface.pipeline(transaction=False) as pipe:
+                self.write_chunks(pipe, chunks)
+                self.setdefault_script(
+                    pipe,
+                    keys=[self.key, self.get_chunks_key()],
+                    args=[k, manifest, self.normalize_ttl(self.ttl)],
+                )
+                data = pipe.execute()[-1]
 
-    def pop(self, k, *default):
-        try:
-            with self.pipeline() as pipe:
-                pipe.hget(self.key, k)
-                pipe.hdel(self.key, k)
-                ret = pipe.execute()
-                data = ret[0]
-                if data is None:
-                    if ret[1] == 0:
-                        raise KeyError(k)
+            if chunks and data != manifest:
+                # k already had a value so the chunks were never used
+                self.interface.hdel(self.get_chunks_key(), *chunks.keys())
 
-                v = self.normalize_data(self.from_interface(data))
+            data = self.join_chunks(
+                data,
+                lambda: self.interface.hget(self.key, k)
+            )
 
-        except KeyError:
+        else:
+            data = self.setdefault_script(
+                self.interface,
+                keys=[self.key],
+                args=[k, data, self.normalize_ttl(self.ttl)],
+            )
+        return self.normalize_data(self.from_interface(data))
+
+    @traced()
+    def pop(self, k, *default):
+        data = self.pop_script(self.interface, keys=[self.key], args=[k])
+        if self.chunk_size:
+            data = self.pop_chunks(data)
+        if data is None:
             if default:
-                v = default[0]
-            else:
-                raise
-        return v
+                return default[0]
+            raise KeyError(k)
+
+        return self.normalize_data(self.from_interface(data))
 
+    @traced()
     def popitem(self):
         """unlike the actual dict.popitem of python >=3.7, this pops a random
         item
 
         https://docs.python.org/3/library/stdtypes.html#dict.popitem
         """
-        k = self.interface.hrandfield(self.key, 1)
-        if k:
-            k = k[0]
-            v = self.pop(k)
-            return (String(k), v)
+        while True:
+            ret = self.popitem_script(self.interface, keys=[self.key])
+            if not ret:
+                raise KeyError()
+
+            k, data = ret
+            if self.chunk_size:
+                data = self.pop_chunks(data)
+                if data is None:
+                    # the chunks are gone so the item had no value, it was
+                    # removed anyway so pop another one
+                    continue
 
-        else:
-            raise KeyError()
+            return (String(k), self.normalize_data(self.from_interface(data)))
 
     def copy(self):
         """Return a local copy divorced from the backend interface"""
@@ -358,6 +1109,7 @@ class SetCache(BaseCache, set):
     https://docs.python.org/3/library/stdtypes.html#set
     https://redis.io/commands#set
     """
+    @traced()
     def add(self, elem, **kwargs):
         data = self.to_interface(self.normalize_data(elem))
         with self.pipeline() as pipe:
@@ -376,6 +1128,7 @@ class SetCache(BaseCache, set):
                     for elem in iterator:
                         self._add(elem, pipe)
 
+    @traced()
     def remove(self, elem):
         """Remove element elem from the set. Raises KeyError if elem is not contained in the set."""
         data = self.to_interface(self.normalize_data(elem))
@@ -383,6 +1136,7 @@ class SetCache(BaseCache, set):
         if not res:
             raise KeyError(elem)
 
+    @traced()
     def discard(self, elem):
         """Remove element elem from the set if it is present."""
         try:
@@ -390,6 +1144,7 @@ class SetCache(BaseCache, set):
         except KeyError:
             pass
 
+    @traced()
     def pop(self):
         """Remove and return an arbitrary element from the set. Raises KeyError if the set is empty."""
         data = self.interface.spop(self.key, 1) # returns list
@@ -399,15 +1154,18 @@ class SetCache(BaseCache, set):
         elem = self.normalize_data(self.from_interface(data[0]))
         return elem
 
+    @traced()
     def __len__(self):
         return int(self.interface.scard(self.key))
 
+    @traced()
     def __contains__(self, elem):
         """Test for membership of *elem* in the set"""
         data = self.to_interface(self.normalize_data(elem))
         rank = self.interface.sismember(self.key, data)
         return bool(rank)
 
+    @traced()
     def __iter__(self):
         for data in self.interface.smembers(self.key):
             yield self.normalize_data(self.from_interface(data))
@@ -502,6 +1260,7 @@ class SortedSetCache(SetCache):
         if self.ttl:
             pipe.expire(self.key, self.normalize_ttl(self.ttl))
 
+    @traced()
     def remove(self, elem):
         """Remove element elem from the set. Raises KeyError if elem is not contained in the set."""
         data = self.to_interface(self.normalize_data(elem))
@@ -509,15 +1268,26 @@ class SortedSetCache(SetCache):
         if not res:
             raise KeyError(elem)
 
-    def pop(self, desc=False):
+    @traced()
+    def pop(self, desc=False, timeout=None):
         """Remove and return an element from the front or back of the set.
         Raises KeyError if the set is empty.
 
         :param desc: bool, False, then return an item from front of set, True then
             return an item from the back of the set
+        :param timeout: float, if not None then block for up to timeout seconds
+            waiting for an element to be added to the set, 0 blocks forever
         :returns: tuple (score, elem)
         """
-        if desc:
+        if timeout is not None:
+            # https://redis.io/commands/bzpopmax/
+            # https://redis.io/commands/bzpopmin/
+            command = self.interface.bzpopmax if desc else self.interface.bzpopmin
+            ret = self.block(lambda t: command(self.key, t), timeout)
+            if ret:
+                ret = [ret[1:]]
+
+        elif desc:
             # https://redis.io/commands/zpopmax/
             ret = self.interface.zpopmax(self.key, 1)
 
@@ -528,34 +1298,72 @@ class SortedSetCache(SetCache):
         if ret:
             ret = ret[0]
             elem = self.normalize_data(self.from_interface(ret[0]))
-            ret = (ret[1], elem)
+            ret = (self.normalize_score(ret[1]), elem)
 
         else:
             raise KeyError()
 
         return ret
 
-    def rpop(self):
+    def increment(self, elem, delta=1):
+        """Atomically increment the score of elem by delta, if elem isn't in
+        the set it will be added with a score of delta
+
+        https://redis.io/commands/zincrby/
+
+        :param elem: mixed, the element whose score should be incremented
+        :param delta: int|float, how much to increment the score
+        :returns: int, the new normalized score of elem
+        """
+        return self.increment_many([(delta, elem)])[0]
+
+    @traced()
+    def increment_many(self, items):
+        """Atomically increment the score of multiple elements in one round
+        trip
+
+        :param items: iterable, (delta, elem) tuples, similar to add()
+        :returns: list, the new normalized scores in the same order as items
+        """
+        count = 0
+        with self.interface.pipeline() as pipe:
+            for count, (delta, elem) in enumerate(items, 1):
+                data = self.to_interface(self.normalize_data(elem))
+                pipe.zincrby(self.key, delta, data)
+
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+            res = pipe.execute()
+
+        return [self.normalize_score(score) for score in res[:count]]
+
+    def rpop(self, timeout=None):
         """convenience method for pop(desc=True), pops from the end of the set instead of the front"""
-        return self.pop(desc=True)
+        return self.pop(desc=True, timeout=timeout)
 
+    @traced()
     def __len__(self):
         return int(self.interface.zcard(self.key))
 
+    @traced()
     def __contains__(self, elem):
         """Test for membership of *elem* in the set"""
         data = self.to_interface(self.normalize_data(elem))
         rank = self.interface.zrank(self.key, data)
         return rank is not None
 
+    @traced()
     def __iter__(self):
         for score, elem in self.chunk(desc=False):
             yield score, elem
 
+    @traced()
     def __reversed__(self):
         for score, elem in self.chunk(desc=True):
             yield score, elem
 
+    @traced()
     def chunk(self, limit=0, offset=0, chunk=5000, desc=False):
         """return limit elements of the set starting at offset
 
@@ -601,6 +1409,154 @@ class SortedSetCache(SetCache):
         return list(self.__iter__())
 
 
+class ListCache(BaseCache, list):
+    """A FIFO queue backed by a redis list
+
+    Elements are pushed onto the back of the list and popped off the front, so
+    iterating the list goes from oldest to newest element
+
+    Changes from standard Python list:
+        * pop() -- removes from the front instead of the back and can block
+        * append()/extend() -- will trim the list to maxlen if it is set
+        * anything that modifies the middle of the list isn't supported
+
+    https://redis.io/commands#list
+    https://docs.python.org/3/library/stdtypes.html#list
+    """
+    maxlen = 0
+    """if set, the list will be trimmed to the newest maxlen elements on push"""
+
+    def append(self, elem):
+        """Push elem onto the back of the list"""
+        self.extend([elem])
+
+    @traced()
+    def extend(self, iterable):
+        """Push all the elements in iterable onto the back of the list"""
+        data = [self.to_interface(self.normalize_data(elem)) for elem in iterable]
+        if data:
+            with self.pipeline() as pipe:
+                # https://redis.io/commands/rpush/
+                pipe.rpush(self.key, *data)
+                if self.maxlen:
+                    # https://redis.io/commands/ltrim/
+                    pipe.ltrim(self.key, -self.maxlen, -1)
+
+                if self.ttl:
+                    pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+    def update(self, data):
+        if data:
+            self.extend(data)
+
+    @traced()
+    def pop(self, timeout=None):
+        """Remove and return the element at the front (the oldest element) of
+        the list. Raises IndexError if the list is empty.
+
+        :param timeout: float, if not None then block for up to timeout seconds
+            waiting for an element to be pushed, 0 blocks forever
+        :returns: mixed, the element
+        """
+        if timeout is None:
+            # https://redis.io/commands/lpop/
+            data = self.interface.lpop(self.key)
+
+        else:
+            # https://redis.io/commands/blpop/
+            data = self.block(
+                lambda t: self.interface.blpop(self.key, t),
+                timeout
+            )
+            if data is not None:
+                data = data[1]
+
+        if data is None:
+            raise IndexError("pop from empty list")
+
+        return self.normalize_data(self.from_interface(data))
+
+    @traced()
+    def trim(self, size):
+        """Keep only the newest size elements of the list"""
+        if size:
+            self.interface.ltrim(self.key, -size, -1)
+
+        else:
+            self.clear()
+
+    @traced()
+    def __getitem__(self, index):
+        """return the element at index, this does not support slices"""
+        # https://redis.io/commands/lindex/
+        data = self.interface.lindex(self.key, index)
+        if data is None:
+            raise IndexError("list index out of range")
+        return self.normalize_data(self.from_interface(data))
+
+    @traced()
+    def __len__(self):
+        return int(self.interface.llen(self.key))
+
+    @traced()
+    def __iter__(self):
+        for elem in self.chunk():
+            yield elem
+
+    @traced()
+    def chunk(self, limit=0, offset=0, chunk=5000):
+        """return limit elements of the list starting at offset
+
+        :param limit: int, how many total items to iterate, 0 means iterate all items
+        :param offset: int, what item to start iterating
+        :param chunk: int, while iterating to limit pull chunk items at a time
+        :returns: yields items
+        """
+        while limit >= 0:
+            size = min(chunk, limit) if limit else chunk
+            # https://redis.io/commands/lrange/
+            items = self.interface.lrange(self.key, offset, offset + (size - 1))
+
+            count = 0
+            for count, data in enumerate(items, 1):
+                yield self.normalize_data(self.from_interface(data))
+
+            offset += count
+            if count < size:
+                limit = -1
+
+            elif limit:
+                limit -= count
+                if not limit:
+                    limit = -1
+
+    def copy(self):
+        """Return a local copy divorced from the backend interface"""
+        return list(self.__iter__())
+
+    def __repr__(self):
+        return self.copy().__repr__()
+
+    def noimp(self, *args, **kwargs):
+        raise NotImplementedError()
+
+    __setitem__ = noimp
+    __delitem__ = noimp
+    __contains__ = noimp
+    __reversed__ = noimp
+    __add__ = noimp
+    __iadd__ = noimp
+    __mul__ = noimp
+    __imul__ = noimp
+    __rmul__ = noimp
+    insert = noimp
+    remove = noimp
+    index = noimp
+    count = noimp
+    reverse = noimp
+    sort = noimp
+
+
 class SentinelCache(Cache):
     """Creates a cache after the first failed boolean check, handy when you only want
     to do things at certain intervals
@@ -617,18 +1573,874 @@ class SentinelCache(Cache):
     serialize = False
     default = 0
 
+    @traced()
+    def acquire(self, ttl=None):
+        """Set the sentinel value if it isn't already set, this is one atomic
+        SET NX command so only one caller can ever acquire the sentinel
+
+        https://redis.io/commands/set/
+
+        :param ttl: int, how many seconds the sentinel value lasts, overrides
+            the class ttl for this call
+        :returns: bool, True if the sentinel was set by this call, False if the
+            sentinel value was already set
+        """
+        ttl = self.normalize_ttl(self.ttl if ttl is None else ttl)
+        res = self.interface.set(self.key, 1, nx=True, ex=ttl or None)
+        return bool(res)
+
+    @classmethod
+    def acquire_many(cls, keys, ttl=None, **kwargs):
+        """Acquire the sentinel for many keys in one round trip
+
+        :param keys: iterable, each key will be passed to the constructor
+        :param ttl: int, overrides the class ttl for this call
+        :param **kwargs: passed to the constructor for every key
+        :returns: list[bool], True for every key whose sentinel was set by this
+            call, in the same order as keys
+        """
+        instances = [cls(key, **kwargs) for key in keys]
+        if not instances:
+            return []
+
+        # the instances' interface, kwargs can pick another connection
+        with instances[0].interface.pipeline(transaction=False) as pipe:
+            for s in instances:
+                ex = s.normalize_ttl(s.ttl if ttl is None else ttl)
+                pipe.set(s.key, 1, nx=True, ex=ex or None)
+            res = pipe.execute()
+
+        return [bool(r) for r in res]
+
     def __bool__(self):
-        """Return True if there is a cached value at key"""
-        ret = False
-        if self.exists():
-            ret = True
+        """Return True if there is a cached value at key, if there isn't then
+        the sentinel value is cached, this is atomic"""
+        # we cache the sentinal after the first failed exists check
+        return not self.acquire()
+SentinalCache = SentinelCache # because I can't spell
+
+
+RateLimit = collections.namedtuple("RateLimit", ["allowed", "remaining", "retry_after"])
+"""The result of RateLimitCache.check(), retry_after is in seconds"""
+
+
+class RateLimitCache(BaseCache):
+    """A distributed rate limiter, every check is one server side script so it
+    is atomic and only takes one round trip
+
+    algorithm can be:
+        * fixed -- a counter that allows limit requests per window, the window
+            starts with the first request
+        * sliding -- a sorted set log of request times (the same ZADD,
+            ZREMRANGEBYSCORE and ZCARD commands SortedSetCache uses), allows
+            limit requests in any window seconds
+        * token -- a token bucket that holds limit tokens and refills all of
+            them every window seconds, so bursts of limit requests are allowed
+
+    :example:
+        class LoginLimit(RateLimitCache):
+            algorithm = "sliding"
+            limit = 5
+            window = 60
+
+        r = LoginLimit(username).check()
+        if not r.allowed:
+            print("try again in {} seconds".format(r.retry_after))
+    """
+    algorithm = "fixed"
+    """one of fixed, sliding, or token"""
+
+    limit = 0
+    """how many requests are allowed per window"""
+
+    window = 60
+    """the window in seconds"""
+
+    scripts = {
+        "fixed": Script("RateLimitCache.fixed", """
+            local limit = tonumber(ARGV[1])
+            local window = tonumber(ARGV[2])
+            local cost = tonumber(ARGV[3])
+            local count = redis.call('INCRBY', KEYS[1], cost)
+            local ttl = redis.call('PTTL', KEYS[1])
+            if ttl < 0 then
+                redis.call('PEXPIRE', KEYS[1], window)
+                ttl = window
+            end
+            if count > limit then
+                redis.call('DECRBY', KEYS[1], cost)
+                return {0, limit - (count - cost), ttl}
+            end
+            return {1, limit - count, 0}
+        """),
+        "sliding": Script("RateLimitCache.sliding", """
+            local limit = tonumber(ARGV[1])
+            local window = tonumber(ARGV[2])
+            local cost = tonumber(ARGV[3])
+            local t = redis.call('TIME')
+            local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+            redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+            local count = redis.call('ZCARD', KEYS[1])
+            if count + cost > limit then
+                local retry = window
+                local i = count + cost - limit - 1
+                if cost <= limit then
+                    local entry = redis.call('ZRANGE', KEYS[1], i, i, 'WITHSCORES')
+                    if entry[2] then
+                        retry = tonumber(entry[2]) + window - now
+                    end
+                end
+                return {0, limit - count, retry}
+            end
+            for i = 1, cost do
+                redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+            end
+            redis.call('PEXPIRE', KEYS[1], window)
+            return {1, limit - count - cost, 0}
+        """),
+        "token": Script("RateLimitCache.token", """
+            local limit = tonumber(ARGV[1])
+            local window = tonumber(ARGV[2])
+            local cost = tonumber(ARGV[3])
+            local rate = limit / window
+            local t = redis.call('TIME')
+            local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+            local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+            local tokens = tonumber(bucket[1])
+            local ts = tonumber(bucket[2])
+            if tokens == nil then
+                tokens = limit
+                ts = now
+            end
+            tokens = math.min(limit, tokens + (math.max(0, now - ts) * rate))
+            local allowed = 0
+            local retry = 0
+            if tokens >= cost then
+                tokens = tokens - cost
+                allowed = 1
+            else
+                retry = math.ceil((cost - tokens) / rate)
+            end
+            redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+            redis.call('PEXPIRE', KEYS[1], math.ceil((limit - tokens) / rate) + 1)
+            return {allowed, math.floor(tokens), retry}
+        """),
+    }
+
+    def update(self, data):
+        if data is not None:
+            raise ValueError("RateLimitCache can't be set")
+
+    @traced()
+    def check(self, cost=1):
+        """Check the rate limit and count this request against it if allowed
+
+        :param cost: int, how many requests (or tokens) this check uses
+        :returns: RateLimit, (allowed, remaining, retry_after) where remaining is
+            how many requests are left and retry_after is how many seconds until
+            a request of cost would be allowed
+        """
+        if self.algorithm not in self.scripts:
+            raise ValueError("Unknown rate limit algorithm {}".format(
+                self.algorithm
+            ))
+
+        args = [int(self.limit), int(self.window * 1000), int(cost)]
+        if self.algorithm == "sliding":
+            args.append(uuid.uuid4().hex)
+
+        allowed, remaining, retry = self.scripts[self.algorithm](
+            self.interface,
+            keys=[self.key],
+            args=args,
+        )
+        return RateLimit(bool(allowed), max(0, int(remaining)), retry / 1000.0)
+
+
+class LockCache(BaseCache):
+    """A distributed lock
+
+    The lock is a SET NX PX with a random token so only the holder can release
+    or extend it, every acquire also increments a fencing token that can be
+    passed to other systems so they can reject writes from a holder whose lease
+    already expired
+
+    https://redis.io/docs/manual/patterns/distributed-locks/
+    https://martin.kleppmann.com/2016/02/08/how-to-do-distributed-locking.html
+
+    :example:
+        with LockCache("foo", ttl=5, renew=True) as lock:
+            # only one process can be in here at a time
+            write_to_storage(data, fence=lock.fence)
+    """
+    ttl = 10
+    """how many seconds the lease lasts, this can be a float"""
+
+    renew = False
+    """True to extend the lease in a background thread until release()"""
+
+    timeout = 10
+    """how many seconds acquire() will wait for the lock when used as a
+    context manager, None waits forever"""
+
+    sleep = 0.01
+    """the first wait between acquire attempts, this doubles on every attempt"""
+
+    max_sleep = 0.5
+    """the longest wait between acquire attempts"""
+
+    fence_ttl = 100
+    """the fence key expires this many leases after the lock was last acquired
+    or extended, long after any holder could still be using its fence, so
+    locking many different keys doesn't leave a fence key behind for each"""
+
+    hash_tag = True
+    """the lock and its fence key are used in the same script so they have to
+    be on the same slot"""
+
+    acquire_script = Script("LockCache.acquire", """
+        if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+            local fence = redis.call('INCR', KEYS[2])
+            redis.call('PEXPIRE', KEYS[2], ARGV[3])
+            return fence
+        end
+        return 0
+    """)
+
+    release_script = Script("LockCache.release", """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """)
+
+    extend_script = Script("LockCache.extend", """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            redis.call('PEXPIRE', KEYS[2], ARGV[3])
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """)
+
+    @property
+    def fence_key(self):
+        return "{}:fence".format(self.key)
+
+    def update(self, data):
+        self.token = None
+        self.fence = None
+        self.renewer = None
+
+    def normalize_ttl(self, ttl):
+        """returns milliseconds"""
+        return int(float(ttl) * 1000)
+
+    @traced()
+    def acquire(self, blocking=True, timeout=None):
+        """Acquire the lock
+
+        :param blocking: bool, False to only try once
+        :param timeout: float, how many seconds to wait for the lock, None to
+            wait forever
+        :returns: bool, True if the lock was acquired, self.fence will hold the
+            fencing token
+        """
+        token = uuid.uuid4().hex
+        stop = time.monotonic() + timeout if timeout is not None else 0
+        sleep = self.sleep
+        while True:
+            fence = self.acquire_script(
+                self.interface,
+                keys=[self.key, self.fence_key],
+                args=[
+                    token,
+                    self.normalize_ttl(self.ttl),
+                    self.normalize_ttl(self.ttl * self.fence_ttl),
+                ],
+            )
+            if fence:
+                self.token = token
+                self.fence = int(fence)
+                if self.renew:
+                    self.start_renewing()
+                return True
+
+            if not blocking:
+                return False
+
+            if stop:
+                remaining = stop - time.monotonic()
+                if remaining <= 0:
+                    return False
+                sleep = min(sleep, remaining)
+
+            # jitter so waiters don't all retry at the same time
+            time.sleep(sleep * random.uniform(0.5, 1.0))
+            sleep = min(sleep * 2, self.max_sleep)
+
+    @traced()
+    def release(self):
+        """Release the lock if this instance still holds it
+
+        :returns: bool, False if the lease had expired and the lock was lost
+        """
+        self.stop_renewing()
+        token = self.token
+        self.token = None
+        if not token:
+            return False
+
+        res = self.release_script(self.interface, keys=[self.key], args=[token])
+        return bool(res)
+
+    @traced()
+    def extend(self, ttl=None):
+        """Reset the lease to ttl seconds if this instance still holds the lock
+
+        :param ttl: float, defaults to the class ttl
+        :returns: bool, False if the lock was lost
+        """
+        if not self.token:
+            return False
+
+        ttl = self.ttl if ttl is None else ttl
+        res = self.extend_script(
+            self.interface,
+            keys=[self.key, self.fence_key],
+            args=[
+                self.token,
+                self.normalize_ttl(ttl),
+                self.normalize_ttl(ttl * self.fence_ttl),
+            ],
+        )
+        return bool(res)
+
+    def locked(self):
+        """return True if anyone holds the lock"""
+        return self.exists()
+
+    def start_renewing(self):
+        """extend the lease every ttl/3 seconds in a daemon thread"""
+        event = threading.Event()
+
+        def renew():
+            interval = float(self.ttl) / 3.0
+            while not event.wait(interval):
+                if not self.extend():
+                    break
+
+        thread = threading.Thread(target=renew, daemon=True)
+        self.renewer = (event, thread)
+        thread.start()
+
+    def stop_renewing(self):
+        if self.renewer:
+            event, thread = self.renewer
+            self.renewer = None
+            event.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def __enter__(self):
+        if not self.acquire(timeout=self.timeout):
+            raise LockError("Could not acquire lock {}".format(self.key))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class HyperLogLogCache(BaseCache):
+    """Approximate count of unique elements in ~12KB no matter how many elements
+    are added, the standard error is 0.81%
+
+    https://redis.io/docs/data-types/probabilistic/hyperloglogs/
+
+    :example:
+        c = HyperLogLogCache("visitors", ["a", "b"])
+        c.add("c")
+        len(c) # 3
+    """
+    chunk_size = 1000
+    """how many elements get sent in each PFADD"""
+
+    def update(self, data):
+        if data:
+            self.add(*data)
+
+    @traced()
+    def add(self, *elems):
+        """Add elems to the count, all the elements are added in one round trip
+
+        :returns: bool, True if the estimated count changed
+        """
+        changed = False
+        with self.interface.pipeline() as pipe:
+            elems = iter(elems)
+            while True:
+                chunk = [
+                    self.to_interface(self.normalize_data(elem))
+                    for elem in itertools.islice(elems, self.chunk_size)
+                ]
+                if not chunk:
+                    break
+                pipe.pfadd(self.key, *chunk)
+
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+            res = pipe.execute()
+            if self.ttl:
+                res.pop(-1)
+
+        return any(res)
+
+    @traced()
+    def count(self, *others):
+        """return the estimated count of unique elements
+
+        :param *others: HyperLogLogCache, if passed in the count will be of the
+            union of this and all of others, others need to be on the same slot
+            in a cluster
+        :returns: int
+        """
+        keys = [self.key]
+        keys.extend(other.key for other in others)
+        return self.interface.pfcount(*keys)
+
+    @traced()
+    def merge(self, *others):
+        """Merge the counts of others into this cache"""
+        with self.interface.pipeline() as pipe:
+            pipe.pfmerge(self.key, *[other.key for other in others])
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+            pipe.execute()
+
+    def __len__(self):
+        return self.count()
+
+
+class BloomCache(BaseCache):
+    """Approximate membership set built on a redis bitmap
+
+    An element is hashed client side into hash_count bit offsets that are set
+    and checked with pipelined SETBIT/GETBIT, membership checks can have false
+    positives (about error_rate of them once capacity elements have been added)
+    but never false negatives
+
+    https://en.wikipedia.org/wiki/Bloom_filter
+
+    :example:
+        c = BloomCache("seen", capacity=1000000, error_rate=0.001)
+        c.add("foo")
+        "foo" in c # True
+        "bar" in c # almost certainly False
+    """
+    serialize = False
+    """Elements are hashed directly so they have to be str, bytes, or int,
+    pickled values aren't guaranteed to hash the same everywhere"""
+
+    capacity = 100000
+    """how many elements you expect to add"""
+
+    error_rate = 0.01
+    """the false positive rate you want at capacity"""
+
+    @property
+    def size(self):
+        """how many bits the bitmap will hold"""
+        size = -self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)
+        return max(int(math.ceil(size)), 1)
+
+    @property
+    def hash_count(self):
+        """how many bits each element sets"""
+        count = (self.size / self.capacity) * math.log(2)
+        return max(int(round(count)), 1)
+
+    def update(self, data):
+        if data:
+            self.add(*data)
+
+    def get_offsets(self, elem):
+        """Returns the bit offsets of elem
+
+        this uses double hashing (Kirsch-Mitzenmacher) so only one digest is
+        computed per element no matter how many hashes are needed
+
+        :param elem: str|bytes|int
+        :returns: list[int]
+        """
+        data = self.to_interface(self.normalize_data(elem))
+        digest = hashlib.blake2b(ByteString(data), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    @traced()
+    def add(self, *elems):
+        """Add all elems in one round trip
+
+        :returns: bool, True if at least one of elems wasn't in the set
+        """
+        with self.interface.pipeline() as pipe:
+            for elem in elems:
+                for offset in self.get_offsets(elem):
+                    pipe.setbit(self.key, offset, 1)
+
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+            res = pipe.execute()
+            if self.ttl:
+                res.pop(-1)
+
+        return not all(res)
+
+    @traced()
+    def contains_many(self, elems):
+        """Check membership of all elems in one round trip
+
+        :param elems: iterable
+        :returns: list[bool], in the same order as elems
+        """
+        hash_count = self.hash_count
+        with self.interface.pipeline(transaction=False) as pipe:
+            count = 0
+            for elem in elems:
+                for offset in self.get_offsets(elem):
+                    pipe.getbit(self.key, offset)
+                count += 1
+
+            res = pipe.execute()
+
+        return [
+            all(res[i * hash_count:(i + 1) * hash_count]) for i in range(count)
+        ]
+
+    def __contains__(self, elem):
+        return self.contains_many([elem])[0]
+
+
+class BitmapCache(BaseCache):
+    """A compact array of bits (or small ints) addressed by integer offset
+
+    https://redis.io/docs/data-types/bitmaps/
+    https://redis.io/commands/bitfield/
+
+    :example:
+        c = BitmapCache(["active", today])
+        c[user_id] = 1
+        c[user_id] # 1
+        c.count() # how many users were active today
+
+        # 4-bit counters
+        c = BitmapCache("counters", width=4)
+        c.set_many({0: 3, 1: 15})
+        c.get_many([0, 1]) # [3, 15]
+    """
+    serialize = False
+
+    width = 1
+    """how many bits each value uses, values larger than 1 bit are read and
+    written with BITFIELD"""
+
+    signed = False
+    """True if values wider than 1 bit are signed ints"""
+
+    @property
+    def bitfield_type(self):
+        """the BITFIELD type (eg, u1, i8) of each value"""
+        return "{}{}".format("i" if self.signed else "u", self.width)
+
+    def bitfield_offset(self, offset):
+        """the # prefix makes BITFIELD multiply the offset by the type width"""
+        return "#{}".format(offset)
+
+    def update(self, data):
+        if data:
+            self.set_many(data)
+
+    @traced()
+    def __getitem__(self, offset):
+        if self.width == 1:
+            return self.interface.getbit(self.key, offset)
+
+        else:
+            return self.get_many([offset])[0]
+
+    def __setitem__(self, offset, value):
+        self.set_many({offset: value})
+
+    @traced()
+    def get_many(self, offsets):
+        """Get the values at offsets in one BITFIELD command
+
+        :param offsets: iterable[int]
+        :returns: list[int], in the same order as offsets
+        """
+        bf = self.interface.bitfield(self.key)
+        for offset in offsets:
+            bf.get(self.bitfield_type, self.bitfield_offset(offset))
+        return bf.execute() if bf.operations else []
+
+    @traced()
+    def set_many(self, values):
+        """Set many values in one BITFIELD command
+
+        :param values: dict|iterable, {offset: value} or a sequence of values
+            where the value's index is its offset
+        :returns: list[int], the old values
+        """
+        if isinstance(values, Mapping):
+            values = values.items()
 
         else:
-            # we cache the sentinal after the first failed exists check
-            self.increment(1)
+            values = enumerate(values)
+
+        with self.interface.pipeline() as pipe:
+            bf = pipe.bitfield(self.key)
+            for offset, value in values:
+                bf.set(self.bitfield_type, self.bitfield_offset(offset), int(value))
+
+            if not bf.operations:
+                return []
+
+            bf.execute()
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+            return pipe.execute()[0]
+
+    @traced()
+    def count(self, start=None, end=None):
+        """Return how many bits are set, BITCOUNT
+
+        :param start: int, the first byte
+        :param end: int, the last byte
+        :returns: int
+        """
+        return self.interface.bitcount(self.key, start, end)
+
+    @traced()
+    def bitop(self, operation, *others):
+        """Store the result of operation on others into this cache, BITOP
+
+        :example:
+            both = BitmapCache("both")
+            both.bitop("AND", BitmapCache("monday"), BitmapCache("tuesday"))
+
+        :param operation: str, AND, OR, XOR, or NOT
+        :param *others: BitmapCache, the source bitmaps, NOT takes only one,
+            these need to be on the same slot in a cluster
+        :returns: int, the size of the resulting bitmap in bytes
+        """
+        with self.interface.pipeline() as pipe:
+            pipe.bitop(operation, self.key, *[other.key for other in others])
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+            return pipe.execute()[0]
+
+
+class StreamCache(BaseCache):
+    """An append only log with consumer groups backed by a redis stream
+
+    Each value is serialized with to_interface and stored in the entry's
+    field, reads return (id, value) tuples
+
+    https://redis.io/docs/data-types/streams/
 
+    :example:
+        c = StreamCache("events", maxlen=10000)
+        c.append_many(events)
+
+        c.create_group("workers")
+        for msg_id, event in c.read_group("workers", "worker-1", count=500):
+            handle(event)
+            ...
+        c.ack("workers", *msg_ids)
+    """
+    maxlen = None
+    """if set then the stream is approximately (MAXLEN ~) trimmed to this many
+    entries on every append"""
+
+    field = "d"
+    """the entry field the serialized value is stored in"""
+
+    def update(self, data):
+        if data:
+            self.append_many(data)
+
+    def normalize_id(self, msg_id):
+        return String(msg_id)
+
+    def normalize_block(self, timeout):
+        """convert block() seconds to XREAD BLOCK milliseconds, 0 blocks
+        forever so small timeouts are rounded up to 1ms"""
+        if timeout is None:
+            return None
+        return max(int(timeout * 1000), 1) if timeout else 0
+
+    def normalize_entries(self, entries):
+        """convert XRANGE/XREAD entries to a list of (id, value) tuples"""
+        ret = []
+        for msg_id, fields in entries or []:
+            data = fields.get(ByteString(self.field), fields.get(self.field))
+            ret.append((
+                self.normalize_id(msg_id),
+                self.normalize_data(self.from_interface(data)),
+            ))
         return ret
-SentinalCache = SentinelCache # because I can't spell
+
+    def append(self, value):
+        """Add value to the end of the stream
+
+        :returns: str, the entry id
+        """
+        return self.append_many([value])[0]
+
+    @traced()
+    def append_many(self, values):
+        """Add all values to the end of the stream in one round trip
+
+        :param values: iterable
+        :returns: list[str], the entry ids in the same order as values
+        """
+        with self.interface.pipeline() as pipe:
+            count = 0
+            for value in values:
+                data = self.to_interface(self.normalize_data(value))
+                pipe.xadd(
+                    self.key,
+                    {self.field: data},
+                    maxlen=self.maxlen,
+                    approximate=True,
+                )
+                count += 1
+
+            if not count:
+                return []
+
+            if self.ttl:
+                pipe.expire(self.key, self.normalize_ttl(self.ttl))
+
+            res = pipe.execute()
+
+        return [self.normalize_id(msg_id) for msg_id in res[:count]]
+
+    @traced()
+    def read(self, count=100, last_id="0", timeout=None):
+        """Read up to count entries that come after last_id, XREAD
+
+        :param count: int, the most entries that will be returned
+        :param last_id: str, only entries after this id are returned, "$" for
+            only entries that get added while blocking
+        :param timeout: float, if not None then block for up to timeout
+            seconds waiting for entries, 0 blocks forever
+        :returns: list[tuple], (id, value) tuples
+        """
+        if last_id == "$" and timeout is not None:
+            # block() can split the wait into several XREADs, if each one was
+            # sent "$" then entries added in between them would be skipped
+            last = self.interface.xrevrange(self.key, "+", "-", count=1)
+            last_id = last[0][0] if last else "0-0"
+
+        def command(t):
+            res = self.interface.xread(
+                {self.key: last_id},
+                count=count,
+                block=self.normalize_block(t),
+            )
+            return res or None
+
+        if timeout is None:
+            res = command(None)
+
+        else:
+            res = self.block(command, timeout)
+
+        return self.normalize_entries(res[0][1] if res else [])
+
+    @traced()
+    def range(self, start="-", end="+", count=None):
+        """Return the entries between start and end ids inclusive, XRANGE"""
+        return self.normalize_entries(
+            self.interface.xrange(self.key, start, end, count=count)
+        )
+
+    @traced()
+    def create_group(self, group, last_id="$"):
+        """Create consumer group, creating the stream if it doesn't exist
+
+        :param group: str, the group name
+        :param last_id: str, the group will get entries after this id, "0" for
+            every entry in the stream
+        :returns: bool, False if the group already existed
+        """
+        try:
+            return bool(self.interface.xgroup_create(
+                self.key,
+                group,
+                id=last_id,
+                mkstream=True,
+            ))
+
+        except redis.ResponseError as e:
+            if "BUSYGROUP" in String(e):
+                return False
+            raise
+
+    @traced()
+    def read_group(self, group, consumer, count=100, timeout=None, pending=False):
+        """Read up to count entries for consumer in group, XREADGROUP
+
+        :param group: str, the group created with create_group()
+        :param consumer: str, this consumer's name
+        :param count: int, the most entries that will be returned
+        :param timeout: float, if not None then block for up to timeout
+            seconds waiting for entries, 0 blocks forever
+        :param pending: bool, True to return the consumer's entries that were
+            delivered but never acked instead of new entries
+        :returns: list[tuple], (id, value) tuples
+        """
+        def command(t):
+            res = self.interface.xreadgroup(
+                group,
+                consumer,
+                {self.key: "0" if pending else ">"},
+                count=count,
+                block=self.normalize_block(t),
+            )
+            return res or None
+
+        if timeout is None or pending:
+            res = command(None)
+
+        else:
+            res = self.block(command, timeout)
+
+        return self.normalize_entries(res[0][1] if res else [])
+
+    @traced()
+    def ack(self, group, *msg_ids):
+        """Acknowledge all msg_ids in one XACK
+
+        :returns: int, how many entries were acknowledged
+        """
+        if not msg_ids:
+            return 0
+        return self.interface.xack(self.key, group, *msg_ids)
+
+    @traced()
+    def trim(self, maxlen):
+        """Approximately trim the stream to maxlen entries"""
+        return self.interface.xtrim(self.key, maxlen=maxlen, approximate=True)
+
+    @traced()
+    def __len__(self):
+        return self.interface.xlen(self.key)
 
 
 # class StateCache(BaseCache):
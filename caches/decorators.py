@@ -1,9 +1,36 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 
+import time
+import functools
+
 from datatypes import FuncDecorator, classproperty
 
 from .compat import *
+from . import metrics
+from . import tracing
+
+
+class hybridproperty(classproperty):
+    """Like classproperty but when it is read on an instance fget receives the
+    instance, so attributes the instance overrode (eg, connection_name) are
+    used"""
+    def __get__(self, instance, instance_class=None):
+        return self.fget(instance_class if instance is None else instance)
+
+
+class hybridmethod(object):
+    """Like classmethod but when it is called on an instance the method
+    receives the instance instead of the class"""
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, instance, instance_class=None):
+        return functools.partial(
+            self.func,
+            instance_class if instance is None else instance
+        )
 
 
 class cached(FuncDecorator):
@@ -42,9 +69,15 @@ class cached(FuncDecorator):
         ttl -- integer -- how long to keep the cache value in the cache
         prefix -- string -- if you want the cache to have a certain prefix on the key
         canary -- mixed -- the sentinal value to check for, defaults to None
+        lock -- bool|class -- True (or a LockCache child) to only let one
+            process recompute a missing value while the others wait for it
     """
     def decorate(self, func, cache_cls, key=None, **cache_options):
         canary = cache_options.pop('canary', None)
+        lock_cls = cache_options.pop('lock', None)
+        if lock_cls is True:
+            from .core import LockCache # avoid circular import
+            lock_cls = LockCache
         if key:
             if callable(key):
                 key_cb = key
@@ -54,26 +87,88 @@ class cached(FuncDecorator):
         else:
             key_cb = lambda *args, **kwargs: []
 
-        def decorator(*args, **kwargs):
+        name = "{}.{}".format(
+            func.__module__,
+            getattr(func, "__qualname__", func.__name__)
+        )
+
+        def lookup(*args, **kwargs):
+            """returns a tuple (value, hit)"""
             # build the caching object
             key_args = key_cb(*args, **kwargs)
             if isinstance(key_args, basestring):
                 key_args = [key_args]
 
-            c = cache_cls(key_args)
-            for k, n in cache_options.items():
-                setattr(c, k, n)
-
-            # get/set the cache
-            ret = c.data
-            if ret is canary:
-                ret = func(*args, **kwargs)
+            def get_cache():
+                c = cache_cls(key_args)
+                for k, n in cache_options.items():
+                    setattr(c, k, n)
+                return c
+
+            def set_cache(c):
+                stats = metrics.cache_stats
+                if stats:
+                    start = time.perf_counter()
+                    ret = func(*args, **kwargs)
+                    stats.record(
+                        "functions",
+                        name,
+                        misses=1,
+                        recompute_seconds=time.perf_counter() - start,
+                    )
+
+                else:
+                    ret = func(*args, **kwargs)
 
                 # cache the result
                 if ret is not canary:
                     c.data = ret
+                return ret
 
-            return ret
+            # get/set the cache
+            c = get_cache()
+            ret = c.data
+            hit = ret is not canary
+            if not hit and lock_cls:
+                lock = lock_cls(c.key)
+                if lock.acquire(timeout=lock.timeout):
+                    try:
+                        # somebody else might have set the value while
+                        # we were waiting for the lock
+                        c = get_cache()
+                        ret = c.data
+                        hit = ret is not canary
+                        if not hit:
+                            ret = set_cache(c)
+
+                    finally:
+                        lock.release()
+
+                else:
+                    # we waited long enough, compute it ourselves
+                    ret = set_cache(c)
+
+            elif not hit:
+                ret = set_cache(c)
+
+            if hit:
+                stats = metrics.cache_stats
+                if stats:
+                    stats.record("functions", name, hits=1)
+
+            return ret, hit
+
+        def decorator(*args, **kwargs):
+            if tracing.tracer is None:
+                return lookup(*args, **kwargs)[0]
+
+            with tracing.operation(
+                "cached.{}".format(name),
+                {"caches.function": name}
+            ) as span:
+                ret, hit = lookup(*args, **kwargs)
+                span.set_attribute("caches.hit", hit)
+                return ret
 
         return decorator
 
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import importlib
+import functools
 
 import dsnparse
+import redis
+import redis.sentinel
 
 from .compat import *
-from .interface import set_interface
+from .interface import set_interface, set_interface_factory
+from .exception import CacheError
 
 
 class DSN(dsnparse.ParseResult):
@@ -20,8 +24,175 @@ class DSN(dsnparse.ParseResult):
         interface_class = getattr(interface_module, interface_class_name)
         return interface_class
 
-    def interface(self):
-        return self.interface_class(**self.connection_config())
+    @property
+    def pool_class(self):
+        """The connection pool class, set with the pool_class query param, it
+        can be "blocking" for redis.BlockingConnectionPool or a full
+        module.path.Classname
+
+        :returns: type|None, None means the interface will create its own
+            default pool
+        """
+        pool_class = self.pool_options.get("pool_class", None)
+        if pool_class:
+            if pool_class.lower() in set(["blocking", "blockingconnectionpool"]):
+                pool_class = redis.BlockingConnectionPool
+
+            elif pool_class.lower() in set(["default", "connectionpool"]):
+                pool_class = redis.ConnectionPool
+
+            else:
+                pool_module_name, pool_class_name = pool_class.rsplit('.', 1)
+                pool_module = importlib.import_module(pool_module_name)
+                pool_class = getattr(pool_module, pool_class_name)
+
+        return pool_class
+
+    @property
+    def pool_key(self):
+        """DSNs with the same pool_key point at the same server with the same
+        settings and so can share one connection pool"""
+        return (
+            self.scheme,
+            repr(sorted(self.connection_config().items())),
+            repr(sorted(self.pool_options.items())),
+        )
+
+    def interface(self, connection_pool=None):
+        """Create the interface
+
+        :param connection_pool: redis.ConnectionPool, an already created pool
+            (eg, shared with another interface) the interface should use
+        :returns: Interface
+        """
+        interface_options = self.interface_options()
+        sentinel_pool = interface_options.pop("connection_pool", None)
+        if not connection_pool:
+            connection_pool = sentinel_pool
+
+        if not connection_pool and self.pool_class:
+            connection_pool = self.connection_pool()
+
+        if connection_pool:
+            return self.interface_class(
+                connection_pool=connection_pool,
+                **interface_options
+            )
+
+        else:
+            connection_config = self.connection_config()
+            connection_config.update(interface_options)
+            return self.interface_class(**connection_config)
+
+    def interface_options(self):
+        """Options that are handled by the interface instead of the connection,
+        this creates the replica interfaces, if the sentinels query param was
+        set then the primary and the replicas use Redis Sentinel pools
+
+        :returns: dict
+        """
+        options = dict(self.interface_params)
+        replica_options = dict(self.replica_options)
+        sentinels = replica_options.pop("sentinels", None)
+        service_name = replica_options.pop("service_name", None)
+        replicas = replica_options.pop("replicas", None)
+
+        if sentinels:
+            # https://redis.io/docs/management/sentinel/
+            sentinel = redis.sentinel.Sentinel(
+                sentinels,
+                sentinel_kwargs={
+                    "socket_timeout": self.query_params["socket_timeout"],
+                },
+            )
+            options["connection_pool"] = self.sentinel_pool(
+                sentinel,
+                service_name,
+            )
+            options["replicas"] = [
+                self.interface_class(
+                    connection_pool=self.sentinel_pool(
+                        sentinel,
+                        service_name,
+                        is_master=False,
+                    )
+                )
+            ]
+            options.update(replica_options)
+
+        elif replicas:
+            connection_config = self.connection_config()
+            connection_config.pop("hosts", None)
+            options["replicas"] = []
+            for host, port in replicas:
+                connection_config.update(dict(host=host, port=port))
+                options["replicas"].append(
+                    self.interface_class(**connection_config)
+                )
+
+            options.update(replica_options)
+
+        return options
+
+    def sentinel_pool(self, sentinel, service_name, is_master=True):
+        """Create a connection pool that asks the sentinels for the address of
+        the primary (or a replica) every time it connects, so the interface
+        follows a failover instead of being stuck on the old primary
+
+        https://redis.readthedocs.io/en/stable/connections.html#sentinel-client
+
+        :param sentinel: redis.sentinel.Sentinel
+        :param service_name: str, the name the sentinels monitor the primary as
+        :param is_master: bool, False to connect to the replicas, the pool
+            rotates through them and uses the primary if there aren't any
+        :returns: redis.sentinel.SentinelConnectionPool
+        """
+        connection_config = self.connection_config()
+        for k in ["host", "port", "hosts"]:
+            connection_config.pop(k, None)
+
+        if connection_config.pop("ssl", False):
+            connection_config["connection_class"] = (
+                redis.sentinel.SentinelManagedSSLConnection
+            )
+
+        return redis.sentinel.SentinelConnectionPool(
+            service_name,
+            sentinel,
+            is_master=is_master,
+            **connection_config
+        )
+
+    def connection_pool(self):
+        """Create a connection pool using pool_class
+
+        https://redis.readthedocs.io/en/stable/connections.html#connection-pools
+
+        :returns: redis.ConnectionPool
+        """
+        pool_class = self.pool_class or redis.ConnectionPool
+        connection_config = self.connection_config()
+
+        # interfaces that don't talk to a server (eg, memory://) say which
+        # connections their pool needs
+        connection_config.update(
+            getattr(self.interface_class, "connection_kwargs", {})
+        )
+
+        if connection_config.pop("ssl", False):
+            connection_config["connection_class"] = redis.SSLConnection
+
+        path = connection_config.pop("unix_socket_path", None)
+        if path:
+            connection_config["connection_class"] = redis.UnixDomainSocketConnection
+            connection_config["path"] = path
+            connection_config.pop("host", None)
+            connection_config.pop("port", None)
+
+        if "pool_timeout" in self.pool_options:
+            connection_config["timeout"] = self.pool_options["pool_timeout"]
+
+        return pool_class(**connection_config)
 
     def connection_config(self):
         connection_config = dict(
@@ -33,6 +204,17 @@ class DSN(dsnparse.ParseResult):
         paths = self.paths
         if paths:
             connection_config['db'] = paths[0]
+
+        hosts = self.hosts
+        if len(hosts) > 1:
+            # interfaces that span multiple servers (eg, ShardedRedis) will
+            # receive all the hosts
+            connection_config["hosts"] = [
+                (host, port or self.port) for host, port in hosts
+            ]
+            connection_config.pop("host")
+            connection_config.pop("port")
+
         return connection_config
 
     def configure(self):
@@ -51,10 +233,54 @@ class DSN(dsnparse.ParseResult):
             self.query_params.get("socket_timeout", 1.0)
         )
 
+        # these configure the connection pool instead of the connection
+        self.pool_options = {}
+        for k in ["pool_class", "pool_timeout", "share_pool"]:
+            if k in self.query_params:
+                self.pool_options[k] = self.query_params.pop(k)
+
+        if "pool_timeout" in self.pool_options:
+            self.pool_options["pool_timeout"] = float(
+                self.pool_options["pool_timeout"]
+            )
+
+        # these configure the interface instead of the connection
+        self.interface_params = {}
+        for k in getattr(self.interface_class, "interface_params", []):
+            if k in self.query_params:
+                self.interface_params[k] = self.query_params.pop(k)
+
+        # these configure read replicas
+        self.replica_options = {}
+        for k in ["replicas", "sentinels", "service_name", "read_strategy"]:
+            if k in self.query_params:
+                self.replica_options[k] = self.query_params.pop(k)
+
+        for k in ["replicas", "sentinels"]:
+            if k in self.replica_options:
+                self.replica_options[k] = self.configure_hosts(
+                    self.replica_options[k],
+                    26379 if k == "sentinels" else self.port,
+                )
+
     def configure_scheme(self, v):
         ret = v
         d = {
             "caches.interface.Redis": set(["redis", "rediss"]),
+            "caches.interface.RedisCluster": set([
+                "rediscluster",
+                "redis+cluster",
+                "rediss+cluster",
+            ]),
+            "caches.interface.ShardedRedis": set([
+                "redis+sharded",
+                "rediss+sharded",
+            ]),
+            "caches.tiered.TieredRedis": set([
+                "redis+tiered",
+                "rediss+tiered",
+            ]),
+            "caches.memory.InMemory": set(["memory"]),
         }
 
         kv = v.lower()
@@ -65,6 +291,24 @@ class DSN(dsnparse.ParseResult):
 
         return ret
 
+    def configure_hosts(self, v, default_port):
+        """Convert a host:port,host2:port2 string into a list of tuples
+
+        :param v: str|list, the hosts
+        :param default_port: int, the port to use for hosts without a port
+        :returns: list[tuple], (host, port) tuples
+        """
+        hosts = []
+        if isinstance(v, basestring):
+            v = v.split(",")
+
+        for hostloc in v:
+            hostloc = String(hostloc).strip()
+            if hostloc:
+                host, _, port = hostloc.partition(":")
+                hosts.append((host, int(port) if port else default_port))
+        return hosts
+
     def configure_password(self, username, password):
         # compensate for passing pw as username (eg, not doing //:password@ but instead //password@)
         ret = None
@@ -87,25 +331,43 @@ def configure_environ(dsn_env_name='CACHES_DSN', parse_class=DSN):
     because it will fail on _2 and move on, so make sure your N dsns are in order
     (eg, 1, 2, 3, ...)
 
+    The interfaces aren't created until they are first requested with
+    get_interface(), so importing caches doesn't open any connections
+
     :example:
         export CACHES_DSN_1=redis://host:port/dbname#conn_name_1
         export CACHES_DSN_2=redis://host2:port/dbname2#conn_name_2
         $ python
-        >>> import caches.interface
-        >>> print caches.interface.interfaces # prints a dict with interfaces conn_name_1 and
+        >>> import caches
+        >>> print caches.get_interfaces() # prints a dict with interfaces conn_name_1 and
         conn_name_2 keys
 
+    DSNs that point at the same server with the same settings will share one
+    connection pool unless they set share_pool=false in their query string
+
     :param dsn_env_name: string, the name of the environment variables
     :param parse_class: dsnparse.ParseResult, the class that will hold the result
-    :returns: list, a list of the found interfaces
+    :returns: list, a list of the found dsns
     """
-    inters = []
+    pools = {}
+
+    def factory(c):
+        share_pool = c.pool_options.get("share_pool", True)
+        pool_key = c.pool_key
+        if share_pool and pool_key in pools:
+            inter = c.interface(pools[pool_key])
+
+        else:
+            inter = c.interface()
+            if share_pool and getattr(inter, "connection_pool", None):
+                pools[pool_key] = inter.connection_pool
+
+        return inter
+
     cs = dsnparse.parse_environs(dsn_env_name, parse_class=parse_class)
     for c in cs:
-        inter = c.interface()
-        set_interface(inter, c.connection_name)
-        inters.append(inter)
-    return inters
+        set_interface_factory(functools.partial(factory, c), c.connection_name)
+    return cs
 
 
 def configure(dsn, parse_class=DSN):
@@ -119,6 +381,9 @@ def configure(dsn, parse_class=DSN):
 
        redis://localhost:6379/0?timeout=5
        module.path.Classname://localhost:6379/0?timeout=5
+       redis://localhost:6379/0?pool_class=blocking&max_connections=20&pool_timeout=5
+       redis://primary:6379/0?replicas=replica1:6379,replica2:6379
+       redis://localhost/0?sentinels=sentinel1:26379,sentinel2:26379&service_name=mymaster
 
     :param dsn: string, a properly formatted prom dsn, see DsnConnection for how to format the dsn
     :param parse_class: dsnparse.ParseResult, the class that will hold the result
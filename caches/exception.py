@@ -4,3 +4,5 @@ from __future__ import unicode_literals, division, print_function, absolute_impo
 
 class CacheError(Exception): pass
 
+
+class LockError(CacheError): pass
@@ -1,14 +1,23 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import logging
+import os
+import threading
+import hashlib
+import bisect
+import itertools
+import time
+from contextlib import contextmanager
 
 import redis
+import redis.cluster
 from redis.client import Pipeline
-from redis.commands.core import Script
+from redis.commands import CoreCommands
 from datatypes import LogMixin
 
 from .compat import *
 from .exception import CacheError
+from . import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -17,10 +26,81 @@ logger = logging.getLogger(__name__)
 interfaces = {}
 """holds all the configured interfaces"""
 
+interface_factories = {}
+"""holds callables that create an interface the first time it is requested"""
+
+interfaces_lock = threading.RLock()
+"""guards interfaces and interface_factories"""
+
+interfaces_pid = os.getpid()
+"""the process that created the interfaces, used to detect a fork"""
+
+registered_scripts = {}
+"""every Script that has been created, keyed by sha, so an interface that
+can't run Lua (eg, caches.memory.InMemory) can find which script it was sent"""
+
+
+def check_pid():
+    """If the process has forked since the interfaces were created then drop
+    any interfaces that can be recreated and reset the connections of the ones
+    that can't, so a child process never shares sockets with its parent"""
+    global interfaces_pid
+    pid = os.getpid()
+    if pid != interfaces_pid:
+        with interfaces_lock:
+            if pid != interfaces_pid:
+                logger.debug("Process forked, resetting interfaces")
+                for name in list(interfaces.keys()):
+                    if name in interface_factories:
+                        interfaces.pop(name)
+
+                    else:
+                        pool = getattr(interfaces[name], "connection_pool", None)
+                        if pool:
+                            pool.reset()
+
+                interfaces_pid = pid
+
+
+pinned = threading.local()
+"""holds the interfaces that had a write in the current read_your_writes()"""
+
+
+@contextmanager
+def read_your_writes():
+    """Within this context, once an interface sends a write command all of its
+    reads will go to the primary instead of a replica, so the writes are
+    always visible to the rest of the context (eg, a web request)
+
+    :example:
+        with caches.read_your_writes():
+            c = Cache("foo")
+            c.data = 1
+            Cache("foo").data # 1, read from the primary
+    """
+    writes = getattr(pinned, "writes", None)
+    if writes is None:
+        pinned.writes = set()
+
+    try:
+        yield
+
+    finally:
+        if writes is None:
+            pinned.writes = None
+
 
 def get_interfaces():
-    global interfaces
-    return interfaces
+    """return all the interfaces, this will create any interfaces that haven't
+    been created yet
+
+    :returns: dict, connection_name keys and interface values
+    """
+    check_pid()
+    with interfaces_lock:
+        for name in interface_factories.keys():
+            get_interface(name)
+        return dict(interfaces)
 
 
 def get_interface(name=''):
@@ -29,8 +109,16 @@ def get_interface(name=''):
 
     name -- string -- the name of the connection for the interface to return
     """
-    global interfaces
-    return interfaces[name]
+    check_pid()
+    interface = interfaces.get(name, None)
+    if interface is None:
+        with interfaces_lock:
+            interface = interfaces.get(name, None)
+            if interface is None:
+                interface = interface_factories[name]()
+                interfaces[name] = interface
+
+    return interface
 
 
 def set_interface(interface, name=''):
@@ -40,13 +128,76 @@ def set_interface(interface, name=''):
     if not interface:
         raise ValueError('interface is empty')
 
-    global interfaces
     logger.debug('connection_name: "{}" -> {}.{}'.format(
         name,
         interface.__module__,
         interface.__class__.__name__
     ))
-    interfaces[name] = interface
+    with interfaces_lock:
+        interface_factories.pop(name, None)
+        interfaces[name] = interface
+
+
+def set_interface_factory(factory, name=''):
+    """Make an interface available without creating it, factory will be called
+    to create the interface the first time get_interface(name) is called
+
+    :param factory: callable, returns an interface instance
+    :param name: str, the connection name
+    """
+    with interfaces_lock:
+        interfaces.pop(name, None)
+        interface_factories[name] = factory
+
+
+class Script(object):
+    """A Lua script that runs server side in one round trip
+
+    The script is ran with EVALSHA, the first time a server responds with
+    NOSCRIPT the script is loaded and ran again, so every script is only sent
+    to each server once. Pipelines load their scripts before they execute
+
+    https://redis.io/docs/manual/programmability/eval-intro/
+
+    :example:
+        incr = Script("incr", "return redis.call('INCR', KEYS[1])")
+        incr(interface, keys=["foo"])
+    """
+    def __init__(self, name, lua):
+        """
+        :param name: str, the name of the script, used in logs
+        :param lua: str, the script's Lua source code, the script has to take
+            at least one key
+        """
+        self.name = name
+        self.script = lua
+        self.sha = hashlib.sha1(ByteString(lua)).hexdigest()
+        registered_scripts[self.sha] = self
+
+    def __call__(self, client, keys, args=None):
+        """Run the script
+
+        :param client: Redis|Pipeline, the interface or pipeline to use
+        :param keys: list, the KEYS the script uses
+        :param args: list, the ARGV the script uses
+        :returns: mixed, whatever the script returns, if client is a pipeline
+            then the pipeline is returned
+        """
+        keys = list(keys)
+        args = list(args or [])
+
+        scripts = getattr(client, "scripts", None)
+        if isinstance(scripts, set):
+            # pipelines will load their scripts right before they execute
+            scripts.add(self)
+            return client.evalsha(self.sha, len(keys), *(keys + args))
+
+        try:
+            return client.evalsha(self.sha, len(keys), *(keys + args))
+
+        except redis.exceptions.NoScriptError:
+            client.script_load(self.script)
+            return client.evalsha(self.sha, len(keys), *(keys + args))
 
 
 class RedisMixin(LogMixin):
@@ -60,7 +211,8 @@ class RedisMixin(LogMixin):
         'ZREVRANGEBYSCORE', 'ZREVRANK', 'ZSCORE', 'APPEND', 'BITCOUNT', 'BITOP',
         'DECR', 'DECRBY', 'GET', 'GETBIT', 'GETRANGE', 'GETSET', 'INCR',
         'INCRBY', 'INCRBYFLOAT', 'MGET', 'MSET', 'MSETNX', 'PSETEX', 'SET',
-        'SETBIT', 'SETEX', 'SETNX', 'SETRANGE', 'STRLEN',
+        'SETBIT', 'SETEX', 'SETNX', 'SETRANGE', 'STRLEN', 'PFADD', 'PFCOUNT',
+        'PFMERGE', 'BITFIELD', 'XADD', 'XLEN', 'XACK', 'XTRIM', 'XRANGE',
     ])
 
     log_key_field = set(['HDEL',
@@ -134,34 +286,33 @@ class RedisMixin(LogMixin):
 
         self.log(format_log, *format_args)
 
-    def pipeline(self, transaction=True, shard_hint=None):
-        pipeline = RedisPipeline(
-            self.connection_pool,
-            self.response_callbacks,
-            transaction,
-            shard_hint
-        )
-
-        return pipeline
 
 
 class RedisPipeline(RedisMixin, Pipeline):
     def _execute_pipeline(self, connection, commands, raise_on_error):
         self.log('Execute {} Pipeline commands', len(commands))
+        hook = metrics.hook
+        start = time.perf_counter() if hook else 0.0
         res = super(RedisPipeline, self)._execute_pipeline(
             connection,
             commands,
             raise_on_error
         )
+        if hook:
+            metrics.observe_pipeline(hook, commands, res, time.perf_counter() - start)
         return res
 
     def _execute_transaction(self, connection, commands, raise_on_error):
         self.log('Execute {} Transaction commands', len(commands))
+        hook = metrics.hook
+        start = time.perf_counter() if hook else 0.0
         res = super(RedisPipeline, self)._execute_transaction(
             connection,
             commands,
             raise_on_error
         )
+        if hook:
+            metrics.observe_pipeline(hook, commands, res, time.perf_counter() - start)
         return res
 
     def execute_command(self, *args, **kwargs):
@@ -175,7 +326,26 @@ class Redis(RedisMixin, redis.StrictRedis):
     https://github.com/andymccurdy/redis-py
     https://github.com/andymccurdy/redis-py/blob/master/redis/commands.py
     """
-    def __init__(self, **connection_config):
+    read_commands = set([
+        'EXISTS', 'TTL', 'PTTL', 'TYPE', 'GET', 'MGET', 'STRLEN', 'GETRANGE',
+        'GETBIT', 'BITCOUNT', 'BITPOS', 'HGET', 'HMGET', 'HGETALL', 'HKEYS',
+        'HVALS', 'HLEN', 'HEXISTS', 'HSTRLEN', 'SMEMBERS', 'SISMEMBER',
+        'SMISMEMBER', 'SCARD', 'ZRANGE', 'ZRANGEBYSCORE', 'ZREVRANGE',
+        'ZREVRANGEBYSCORE', 'ZRANK', 'ZREVRANK', 'ZSCORE', 'ZMSCORE', 'ZCARD',
+        'ZCOUNT', 'LRANGE', 'LLEN', 'LINDEX', 'XRANGE', 'XREVRANGE', 'XLEN',
+    ])
+    """commands that can be sent to a replica"""
+
+    pipeline_class = RedisPipeline
+
+    def __init__(self, replicas=None, read_strategy="round_robin", **connection_config):
+        """
+        :param replicas: list[Redis], read_commands will be sent to these
+            interfaces instead of this one
+        :param read_strategy: str, how a replica is chosen, either round_robin
+            or latency (the replica with the lowest average latency)
+        :param **connection_config: passed through to redis-py
+        """
         try:
             super(Redis, self).__init__(**connection_config)
             self.log('Connected using config {}', connection_config)
@@ -183,6 +353,12 @@ class Redis(RedisMixin, redis.StrictRedis):
         except redis.RedisError as e:
             raise CacheError(e)
 
+        self.replicas = replicas or []
+        self.read_strategy = read_strategy
+        self.replica_cycle = itertools.cycle(self.replicas)
+        self.replica_latencies = {}
+        self.replica_reads = 0
+
     def __getattribute__(self, name):
         """
         http://stackoverflow.com/questions/6602256/python-wrap-all-functions-in-a-library
@@ -195,13 +371,459 @@ class Redis(RedisMixin, redis.StrictRedis):
 
         return ret
 
+    @property
+    def socket_timeout(self):
+        """how long a command can wait for a response before it fails"""
+        return self.connection_pool.connection_kwargs.get("socket_timeout", None)
+
+    def get_primary_nodes(self):
+        """return an interface for every primary server this interface uses
+
+        :returns: list[Redis]
+        """
+        return [self]
+
     def unsafe_flush(self):
         """this will clear the entire cache db, be careful with this"""
         self.log('FLUSH DB {}', self.connection_pool.connection_kwargs['db'])
         return self.flushdb()
 
+    def get_replica(self):
+        """return the replica the next read command should use"""
+        self.replica_reads += 1
+        if self.read_strategy == "latency":
+            # every so often try a replica round robin so a replica that was
+            # slow gets a chance to update its latency
+            if self.replica_reads % 100:
+                return min(
+                    self.replicas,
+                    key=lambda r: self.replica_latencies.get(id(r), 0.0)
+                )
+
+        return next(self.replica_cycle)
+
+    def execute_replica_command(self, replica, *args, **kwargs):
+        """run a read command on replica, if the replica can't be reached (or
+        doesn't answer in time) then None is returned and the command should be
+        ran on the primary"""
+        start = time.monotonic()
+        try:
+            res = replica.execute_command(*args, **kwargs)
+
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self.log('Replica read failed, reading from primary: {}', e)
+            self.replica_latencies[id(replica)] = float("inf")
+            return None, False
+
+        latency = time.monotonic() - start
+        prev = self.replica_latencies.get(id(replica), latency)
+        if prev == float("inf"):
+            prev = latency
+        self.replica_latencies[id(replica)] = (prev * 0.8) + (latency * 0.2)
+        return res, True
+
     def execute_command(self, *args, **kwargs):
+        if self.replicas:
+            writes = getattr(pinned, "writes", None)
+            if args[0] in self.read_commands:
+                if writes is None or id(self) not in writes:
+                    res, ok = self.execute_replica_command(
+                        self.get_replica(),
+                        *args,
+                        **kwargs
+                    )
+                    if ok:
+                        return res
+
+            elif writes is not None:
+                writes.add(id(self))
+
+        hook = metrics.hook
+        start = time.perf_counter() if hook else 0.0
         res = super(Redis, self).execute_command(*args, **kwargs)
+        if hook:
+            metrics.observe_command(hook, args, res, time.perf_counter() - start)
+        self.log_call(args, res)
+        return res
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        if self.replicas:
+            # pipelines always go to the primary and usually write
+            writes = getattr(pinned, "writes", None)
+            if writes is not None:
+                writes.add(id(self))
+
+        pipeline = self.pipeline_class(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint
+        )
+
+        return pipeline
+
+
+class RedisCluster(RedisMixin, redis.cluster.RedisCluster):
+    """Redis Cluster interface, keys are spread across the cluster's nodes by
+    hash slot
+
+    Caching classes that set hash_tag = True will keep all the keys derived from
+    the cache's key (eg, chunks) in the same slot
+
+    https://redis.io/docs/reference/cluster-spec/
+    https://redis.readthedocs.io/en/stable/clustering.html
+    """
+    def __init__(self, hosts=None, db=0, **connection_config):
+        """
+        :param hosts: list[tuple], (host, port) tuples of the startup nodes,
+            if not given then host and port will be used
+        :param db: int, cluster mode only supports db 0
+        :param **connection_config: passed through to redis-py's RedisCluster
+        """
+        if int(db or 0):
+            raise CacheError("Redis Cluster only supports db 0")
+
+        if hosts:
+            connection_config["startup_nodes"] = [
+                redis.cluster.ClusterNode(host, port or 6379) for host, port in hosts
+            ]
+
+        try:
+            super(RedisCluster, self).__init__(**connection_config)
+            self.log('Connected using config {}', connection_config)
+
+        except redis.RedisError as e:
+            raise CacheError(e)
+
+    @property
+    def socket_timeout(self):
+        """how long a command can wait for a response before it fails"""
+        return self.nodes_manager.connection_kwargs.get("socket_timeout", None)
+
+    def get_primary_nodes(self):
+        """return a redis-py client for every primary node of the cluster
+
+        :returns: list[redis.Redis]
+        """
+        return [
+            self.get_redis_connection(node) for node in self.get_primaries()
+        ]
+
+    def unsafe_flush(self):
+        """this will clear every primary node of the cluster, be careful with this"""
+        self.log('FLUSH DB on all cluster primaries')
+        return self.flushdb(target_nodes=self.PRIMARIES)
+
+    def execute_command(self, *args, **kwargs):
+        hook = metrics.hook
+        start = time.perf_counter() if hook else 0.0
+        res = super(RedisCluster, self).execute_command(*args, **kwargs)
+        if hook:
+            metrics.observe_command(hook, args, res, time.perf_counter() - start)
         self.log_call(args, res)
         return res
 
+
+class HashRing(object):
+    """Consistent hashing ring, each node is placed on the ring replicas times
+    so adding or removing a node only moves about 1/N of the keys
+
+    Like Redis Cluster, if a key contains a {hash tag} then only the hash tag is
+    hashed, so keys with the same hash tag always land on the same node
+
+    https://en.wikipedia.org/wiki/Consistent_hashing
+    """
+    def __init__(self, nodes, replicas=160):
+        """
+        :param nodes: dict, the keys are stable names for the nodes (eg,
+            host:port/db) and the values are the nodes
+        :param replicas: int, how many points each node gets on the ring
+        """
+        self.nodes = nodes
+        self.points = []
+        for name in nodes.keys():
+            for i in range(replicas):
+                self.points.append((self.hash("{}-{}".format(name, i)), name))
+        self.points.sort()
+        self.hashes = [h for h, name in self.points]
+
+    def hash(self, key):
+        if not isinstance(key, bytes):
+            key = ByteString(key)
+        return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+    def hash_tag(self, key):
+        """return the part of key that should be hashed
+
+        https://redis.io/docs/reference/cluster-spec/#hash-tags
+        """
+        if isinstance(key, bytes):
+            key = key.decode("utf-8", "replace")
+        else:
+            key = String(key)
+
+        start = key.find("{")
+        if start >= 0:
+            stop = key.find("}", start + 1)
+            if stop > start + 1:
+                key = key[start + 1:stop]
+
+        return key
+
+    def get_name(self, key):
+        """return the name of the node key lives on"""
+        i = bisect.bisect(self.hashes, self.hash(self.hash_tag(key)))
+        if i == len(self.points):
+            i = 0
+        return self.points[i][1]
+
+    def get_node(self, key):
+        """return the node key lives on"""
+        return self.nodes[self.get_name(key)]
+
+
+class CommandKeysMixin(object):
+    """Knows which keys a command touches"""
+
+    no_key = set([
+        "PING", "INFO", "TIME", "ECHO", "DBSIZE", "RANDOMKEY", "SCRIPT EXISTS",
+    ])
+    """commands with no key that will be ran on the first node"""
+
+    all_nodes = set(["FLUSHDB", "FLUSHALL", "SCRIPT LOAD", "SCRIPT FLUSH"])
+    """commands with no key that will be ran on every node"""
+
+    split_keys = set(["DEL", "UNLINK", "EXISTS", "TOUCH", "MGET"])
+    """multi-key commands that will be split up by node and then combined"""
+
+    def command_keys(self, args):
+        """return all the keys a command touches
+
+        :param args: tuple, the command args, args[0] is the command name
+        :returns: list
+        """
+        command = args[0]
+        if command in self.no_key or command in self.all_nodes or len(args) < 2:
+            return []
+
+        elif command in self.split_keys:
+            return list(args[1:])
+
+        elif command in set(["EVAL", "EVALSHA"]):
+            return list(args[3:3 + int(args[2])])
+
+        elif command in set(["RENAME", "RENAMENX"]):
+            return list(args[1:3])
+
+        elif command == "BITOP":
+            return list(args[2:])
+
+        elif command in set(["BLPOP", "BRPOP", "BZPOPMIN", "BZPOPMAX"]):
+            return list(args[1:-1])
+
+        elif command in set(["MSET", "MSETNX"]):
+            return list(args[1::2])
+
+        elif command in set(["XREAD", "XREADGROUP"]):
+            args = [String(arg) if isinstance(arg, bytes) else arg for arg in args]
+            i = [String(arg).upper() for arg in args].index("STREAMS") + 1
+            return list(args[i:i + ((len(args) - i) // 2)])
+
+        return [args[1]]
+
+
+class ShardedMixin(CommandKeysMixin, RedisMixin):
+    """Shared command routing for ShardedRedis and ShardedPipeline"""
+    def command_node(self, args):
+        """return the node name a command has to run on, if the command's keys
+        live on different nodes a CacheError is raised
+
+        :returns: str|None, None if the command doesn't have any keys
+        """
+        names = set(self.ring.get_name(k) for k in self.command_keys(args))
+        if len(names) > 1:
+            raise CacheError(
+                "{} keys are on {} different shards, use a hash tag".format(
+                    args[0],
+                    len(names)
+                )
+            )
+        return names.pop() if names else None
+
+
+class ShardedPipeline(ShardedMixin, CoreCommands):
+    """Queues commands and then runs a pipeline on each shard that has commands
+    when execute() is called, the results are returned in queued order"""
+    def __init__(self, interface, transaction=True):
+        self.interface = interface
+        self.ring = interface.ring
+        self.transaction = transaction
+        self.command_stack = []
+        self.scripts = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def reset(self):
+        self.command_stack = []
+        self.scripts = set()
+
+    def execute_command(self, *args, **kwargs):
+        if args[0] in self.all_nodes or args[0] in self.no_key:
+            raise CacheError("{} is not supported in a sharded pipeline".format(
+                args[0]
+            ))
+
+        name = self.command_node(args) or next(iter(self.ring.nodes.keys()))
+        self.command_stack.append((name, args, kwargs))
+        self.log_call(args, None, is_pipe=True)
+        return self
+
+    def execute(self, raise_on_error=True):
+        pipes = {}
+        positions = {}
+        for i, (name, args, kwargs) in enumerate(self.command_stack):
+            if name not in pipes:
+                pipes[name] = self.ring.nodes[name].pipeline(
+                    transaction=self.transaction
+                )
+                pipes[name].scripts.update(self.scripts)
+                positions[name] = []
+
+            pipes[name].execute_command(*args, **kwargs)
+            positions[name].append(i)
+
+        ret = [None] * len(self.command_stack)
+        try:
+            self.log('Execute {} Sharded Pipeline commands on {} shards',
+                len(self.command_stack),
+                len(pipes)
+            )
+            for name, pipe in pipes.items():
+                for i, res in zip(positions[name], pipe.execute(raise_on_error)):
+                    ret[i] = res
+
+        finally:
+            for pipe in pipes.values():
+                pipe.reset()
+            self.reset()
+
+        return ret
+
+
+class ShardedRedis(ShardedMixin, CoreCommands):
+    """Spreads keys across several redis servers using client side consistent
+    hashing
+
+    Every node is a Redis interface, commands are routed to a node using their
+    key, multi-key commands have to have all their keys on the same node unless
+    they are in split_keys. Caching classes that set hash_tag = True will keep
+    all the keys derived from the cache's key on the same node
+
+    :example:
+        redis+sharded://host1:6379,host2:6379/0
+    """
+    replicas = 160
+    """how many points each node gets on the hash ring"""
+
+    def __init__(self, hosts=None, host=None, port=None, **connection_config):
+        """
+        :param hosts: list[tuple], (host, port) tuples of every node
+        :param **connection_config: passed to each node's Redis interface
+        """
+        if not hosts:
+            hosts = [(host, port)]
+
+        nodes = {}
+        for host, port in hosts:
+            port = port or 6379
+            name = "{}:{}/{}".format(host, port, connection_config.get("db", 0))
+            nodes[name] = Redis(host=host, port=port, **connection_config)
+
+        self.ring = HashRing(nodes, self.replicas)
+        self.log('Sharding across {} nodes', len(nodes))
+
+    @property
+    def nodes(self):
+        return list(self.ring.nodes.values())
+
+    @property
+    def socket_timeout(self):
+        return self.nodes[0].socket_timeout
+
+    def get_node(self, key):
+        """return the Redis interface key lives on"""
+        return self.ring.get_node(key)
+
+    def get_primary_nodes(self):
+        """return the Redis interface of every shard
+
+        :returns: list[Redis]
+        """
+        return self.nodes
+
+    def get_encoder(self):
+        return self.nodes[0].get_encoder()
+
+    def get_connection_kwargs(self):
+        return self.nodes[0].get_connection_kwargs()
+
+    def unsafe_flush(self):
+        """this will clear the entire cache db on every node, be careful"""
+        for node in self.nodes:
+            node.unsafe_flush()
+
+    def scan_iter(self, *args, **kwargs):
+        """scan every node"""
+        for node in self.nodes:
+            for key in node.scan_iter(*args, **kwargs):
+                yield key
+
+    def execute_command(self, *args, **kwargs):
+        command = args[0]
+        if command == "SCAN":
+            raise CacheError("SCAN is not supported, use scan_iter()")
+
+        elif command in self.all_nodes:
+            ret = None
+            for node in self.nodes:
+                ret = node.execute_command(*args, **kwargs)
+            return ret
+
+        elif command in self.split_keys:
+            positions = {}
+            for i, key in enumerate(args[1:]):
+                positions.setdefault(self.ring.get_name(key), []).append(i)
+
+            if len(positions) == 1:
+                name = next(iter(positions.keys()))
+                return self.ring.nodes[name].execute_command(*args, **kwargs)
+
+            if command == "MGET":
+                ret = [None] * (len(args) - 1)
+                for name, indexes in positions.items():
+                    keys = [args[i + 1] for i in indexes]
+                    res = self.ring.nodes[name].execute_command(command, *keys)
+                    for i, v in zip(indexes, res):
+                        ret[i] = v
+
+            else:
+                ret = 0
+                for name, indexes in positions.items():
+                    keys = [args[i + 1] for i in indexes]
+                    ret += self.ring.nodes[name].execute_command(command, *keys)
+
+            return ret
+
+        name = self.command_node(args) or next(iter(self.ring.nodes.keys()))
+        return self.ring.nodes[name].execute_command(*args, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ShardedPipeline(self, transaction=transaction)
+
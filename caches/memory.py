@@ -0,0 +1,1943 @@
+# -*- coding: utf-8 -*-
+"""An in-process stand in for a Redis server
+
+    caches.configure("memory://")
+
+The memory interface is a normal Redis interface whose connections run every
+command against a store in this process instead of sending it over a socket,
+the replies are shaped like the ones redis-py would parse off the wire so the
+response callbacks, pipelines and MULTI/EXEC all work unchanged. Interfaces
+with the same host (eg, memory://foo/0 and memory://foo/1) share a store and
+every store has the usual numbered databases.
+
+Lua can't run here, so every Script needs a Python version registered with the
+script() decorator, the scripts of the cache classes are already registered
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import bisect
+import collections
+import fnmatch
+import hashlib
+import math
+import random
+import threading
+import time
+
+import redis
+import redis.connection
+
+from .compat import *
+from .interface import Redis, registered_scripts
+
+
+stores = {}
+"""holds the MemoryStore of every host"""
+
+stores_lock = threading.Lock()
+
+script_functions = {}
+"""the Python version of a Script, keyed by the Script's name"""
+
+
+def get_store(name):
+    """return the store of host name, creating it if needed"""
+    with stores_lock:
+        store = stores.get(name)
+        if store is None:
+            store = MemoryStore()
+            stores[name] = store
+        return store
+
+
+def script(name):
+    """Decorator that registers the Python version of a Script
+
+    :example:
+        incr = Script("incr", "return redis.call('INCR', KEYS[1])")
+
+        @script("incr")
+        def incr_script(call, keys, args):
+            return call("INCR", keys[0])
+
+    :param name: str, the Script's name
+    :returns: callable, the decorated function receives call(*args), which
+        runs a command and returns its reply, and the keys and args the script
+        was ran with, it should return what the Lua script would return
+    """
+    def decorator(func):
+        script_functions[name] = func
+        return func
+    return decorator
+
+
+class ReplyError(Exception):
+    """Raised by a command to send an error reply, the message starts with the
+    error code (eg, WRONGTYPE Operation against...)"""
+    pass
+
+
+def wrong_type():
+    return ReplyError(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def encode(v):
+    """convert a script argument to bytes the way redis-py would"""
+    if isinstance(v, bytes):
+        return v
+    if isinstance(v, (bytearray, memoryview)):
+        return bytes(v)
+    if isinstance(v, float):
+        return format_float(v)
+    return String(v).encode("utf-8")
+
+
+def decode(v, encoder):
+    if isinstance(v, bytes):
+        return encoder.decode(v)
+    if isinstance(v, list):
+        return [decode(x, encoder) for x in v]
+    return v
+
+
+def format_float(f):
+    if math.isinf(f):
+        return b"inf" if f > 0 else b"-inf"
+    if f == int(f) and abs(f) < 1e17:
+        return String(int(f)).encode("utf-8")
+    return repr(f).encode("utf-8")
+
+
+def to_int(v):
+    try:
+        return int(v)
+    except ValueError:
+        raise ReplyError("ERR value is not an integer or out of range")
+
+
+def to_float(v):
+    try:
+        f = float(v)
+    except ValueError:
+        raise ReplyError("ERR value is not a valid float")
+    if math.isnan(f):
+        raise ReplyError("ERR value is not a valid float")
+    return f
+
+
+def score_bound(v):
+    """parse a ZRANGEBYSCORE min or max, returns (score, exclusive)"""
+    if v.startswith(b"("):
+        return to_float(v[1:]), True
+    return to_float(v), False
+
+
+def in_bounds(score, lo, hi):
+    (lo, lo_excl), (hi, hi_excl) = lo, hi
+    if score < lo or (lo_excl and score == lo):
+        return False
+    if score > hi or (hi_excl and score == hi):
+        return False
+    return True
+
+
+def index_range(start, stop, length):
+    """convert inclusive start and stop indexes that can be negative (like
+    LRANGE takes) to a python slice range, returns (start, stop)"""
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop = length + stop
+    stop = min(stop, length - 1)
+    if start > stop:
+        return 0, 0
+    return start, stop + 1
+
+
+def match(pattern, v):
+    return pattern is None or fnmatch.fnmatchcase(v, pattern)
+
+
+def get_bits(buf, offset, width):
+    v = 0
+    for i in range(offset, offset + width):
+        byte = i >> 3
+        bit = (buf[byte] >> (7 - (i & 7))) & 1 if byte < len(buf) else 0
+        v = (v << 1) | bit
+    return v
+
+
+def set_bits(buf, offset, width, value):
+    end = (offset + width + 7) >> 3
+    if end > len(buf):
+        buf.extend(b"\x00" * (end - len(buf)))
+    for i in range(offset + width - 1, offset - 1, -1):
+        byte = i >> 3
+        mask = 1 << (7 - (i & 7))
+        if value & 1:
+            buf[byte] |= mask
+        else:
+            buf[byte] &= ~mask
+        value >>= 1
+
+
+def parse_id(v, seq=0):
+    """parse a stream id, seq is used when v doesn't have a sequence number"""
+    if v == b"-":
+        return (0, 0)
+    if v == b"+":
+        return (float("inf"), float("inf"))
+    try:
+        ms, _, s = v.partition(b"-")
+        return (int(ms), int(s) if s else seq)
+    except ValueError:
+        raise ReplyError("ERR Invalid stream ID specified as stream command argument")
+
+
+def format_id(i):
+    return "{}-{}".format(*i).encode("utf-8")
+
+
+class Stream(object):
+    """The entries and consumer groups of a stream key"""
+    def __init__(self):
+        self.ids = []
+        self.entries = []
+        self.last_id = (0, 0)
+        self.groups = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, i, fields):
+        self.ids.append(i)
+        self.entries.append([format_id(i), fields])
+        self.last_id = i
+
+    def after(self, i, count=None):
+        """return the entries with an id greater than i"""
+        start = bisect.bisect_right(self.ids, i)
+        stop = len(self.ids) if not count else start + count
+        return self.entries[start:stop]
+
+    def get(self, i):
+        index = bisect.bisect_left(self.ids, i)
+        if index < len(self.ids) and self.ids[index] == i:
+            return self.entries[index]
+
+    def trim(self, maxlen):
+        removed = max(0, len(self.ids) - maxlen)
+        del self.ids[:removed]
+        del self.entries[:removed]
+        return removed
+
+
+class Database(object):
+    """One numbered database, every value is stored as a (type, value) tuple
+    where the value is bytes, dict, set, list, or Stream, a zset is a dict of
+    member -> score and a HyperLogLog is a set that reports itself as a
+    string"""
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def __len__(self):
+        return len(self.keys())
+
+    def exists(self, key):
+        return self.lookup(key) is not None
+
+    def lookup(self, key):
+        """return the (type, value) of key, None if it doesn't exist"""
+        item = self.data.get(key)
+        if item is not None:
+            expires = self.expires.get(key)
+            if expires is not None and expires <= now_ms():
+                self.delete(key)
+                item = None
+        return item
+
+    def get(self, key, type_name, default=None):
+        """return the value of key, if the key doesn't exist then default is
+        set (if it isn't None) and returned
+
+        :param type_name: str, the type the key has to be
+        :param default: callable, creates an empty value
+        """
+        item = self.lookup(key)
+        if item is None:
+            if default is None:
+                return None
+            value = default()
+            self.data[key] = (type_name, value)
+            return value
+
+        if item[0] != type_name:
+            raise wrong_type()
+        return item[1]
+
+    def set(self, key, type_name, value, keepttl=True):
+        self.data[key] = (type_name, value)
+        if not keepttl:
+            self.expires.pop(key, None)
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def clean(self, key, value):
+        """remove key if value, a container, is empty"""
+        if not value:
+            self.delete(key)
+
+    def keys(self):
+        now = now_ms()
+        for key, expires in list(self.expires.items()):
+            if expires <= now:
+                self.delete(key)
+        return list(self.data.keys())
+
+    def flush(self):
+        self.data = {}
+        self.expires = {}
+
+
+class MemoryStore(object):
+    """Holds the databases of one in-memory server and runs commands on them
+
+    Every command runs while holding the store's lock, so each command (and
+    every MULTI/EXEC and script) is atomic like it would be on a real server,
+    blocking commands wait on the lock's condition for another command to
+    change the data
+    """
+    info = {
+        "redis_version": "7.2.0",
+        "redis_mode": "standalone",
+        "executable": "caches.memory",
+    }
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.waiters = 0
+        self.dbs = collections.defaultdict(Database)
+        self.scripts = {}
+        self.blocking = True
+
+    def has_command(self, name):
+        return hasattr(self, "cmd_{}".format(String(name).lower()))
+
+    def execute(self, db, args):
+        """run one command
+
+        :param db: int, the selected database
+        :param args: list[bytes], the command and its arguments
+        :returns: mixed, the reply
+        """
+        with self.lock:
+            try:
+                return self.call(self.dbs[db], args)
+
+            finally:
+                if self.waiters:
+                    self.changed.notify_all()
+
+    def execute_transaction(self, db, commands):
+        """run commands atomically, errors are returned in the reply"""
+        with self.lock:
+            ret = []
+            self.blocking = False
+            try:
+                for args in commands:
+                    try:
+                        ret.append(self.call(self.dbs[db], args))
+
+                    except ReplyError as e:
+                        ret.append(e)
+
+            finally:
+                self.blocking = True
+                if self.waiters:
+                    self.changed.notify_all()
+            return ret
+
+    def call(self, db, args):
+        """run args on Database db"""
+        name = String(args[0]).lower()
+        command = getattr(self, "cmd_{}".format(name), None)
+        if command is None:
+            raise ReplyError("ERR unknown command '{}'".format(name))
+        return command(db, *args[1:])
+
+    def block(self, timeout, callback):
+        """run callback until it returns something other than None
+
+        :param timeout: float, seconds to wait, 0 waits forever
+        :returns: mixed, what callback returned, None if it timed out
+        """
+        ret = callback()
+        if ret is not None or not self.blocking:
+            return ret
+
+        deadline = time.monotonic() + timeout if timeout else None
+        while ret is None:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+            self.waiters += 1
+            try:
+                self.changed.wait(remaining)
+            finally:
+                self.waiters -= 1
+            ret = callback()
+        return ret
+
+    # Connection and server commands
+
+    def cmd_ping(self, db, message=None):
+        return b"PONG" if message is None else message
+
+    def cmd_echo(self, db, message):
+        return message
+
+    def cmd_time(self, db):
+        t = time.time()
+        return [encode(int(t)), encode(int((t % 1) * 1000000))]
+
+    def cmd_info(self, db, *sections):
+        lines = ["# Server"]
+        lines.extend("{}:{}".format(k, v) for k, v in self.info.items())
+        lines.append("# Keyspace")
+        for i, d in sorted(self.dbs.items()):
+            keys = len(d)
+            if keys:
+                lines.append("db{}:keys={},expires={},avg_ttl=0".format(
+                    i,
+                    keys,
+                    len(d.expires),
+                ))
+        return "\r\n".join(lines).encode("utf-8")
+
+    def cmd_client(self, db, subcommand, *args):
+        if subcommand.upper() == b"ID":
+            return 1
+        if subcommand.upper() == b"GETNAME":
+            return None
+        return b"OK"
+
+    def cmd_dbsize(self, db):
+        return len(db)
+
+    def cmd_flushdb(self, db, *args):
+        db.flush()
+        return b"OK"
+
+    def cmd_flushall(self, db, *args):
+        for d in self.dbs.values():
+            d.flush()
+        return b"OK"
+
+    # Key commands
+
+    def cmd_del(self, db, *keys):
+        return sum(1 for key in keys if db.lookup(key) and db.delete(key))
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, db, *keys):
+        return sum(1 for key in keys if db.exists(key))
+
+    def cmd_type(self, db, key):
+        item = db.lookup(key)
+        if item is None:
+            return b"none"
+        return b"string" if item[0] == "hll" else item[0].encode("utf-8")
+
+    def cmd_keys(self, db, pattern):
+        return [key for key in db.keys() if match(pattern, key)]
+
+    def cmd_scan(self, db, cursor, *args):
+        # COUNT is only a hint, so everything is returned in one call
+        options = self.scan_options(args)
+        keys = [key for key in db.keys() if match(options.get(b"MATCH"), key)]
+        if b"TYPE" in options:
+            keys = [k for k in keys if self.cmd_type(db, k) == options[b"TYPE"].lower()]
+        return [b"0", keys]
+
+    def scan_options(self, args):
+        return {
+            args[i].upper(): args[i + 1] for i in range(0, len(args) - 1, 2)
+        }
+
+    def cmd_rename(self, db, key, newkey):
+        item = db.lookup(key)
+        if item is None:
+            raise ReplyError("ERR no such key")
+        expires = db.expires.get(key)
+        db.delete(key)
+        db.delete(newkey)
+        db.set(newkey, item[0], item[1])
+        if expires is not None:
+            db.expires[newkey] = expires
+        return b"OK"
+
+    def expire_at(self, db, key, when, options):
+        if not db.exists(key):
+            return 0
+
+        current = db.expires.get(key)
+        options = set(o.upper() for o in options)
+        if b"NX" in options and current is not None:
+            return 0
+        if b"XX" in options and current is None:
+            return 0
+        if b"GT" in options and (current is None or when <= current):
+            return 0
+        if b"LT" in options and current is not None and when >= current:
+            return 0
+
+        if when <= now_ms():
+            db.delete(key)
+        else:
+            db.expires[key] = when
+        return 1
+
+    def cmd_expire(self, db, key, seconds, *options):
+        return self.expire_at(db, key, now_ms() + to_int(seconds) * 1000, options)
+
+    def cmd_pexpire(self, db, key, ms, *options):
+        return self.expire_at(db, key, now_ms() + to_int(ms), options)
+
+    def cmd_expireat(self, db, key, timestamp, *options):
+        return self.expire_at(db, key, to_int(timestamp) * 1000, options)
+
+    def cmd_pexpireat(self, db, key, timestamp, *options):
+        return self.expire_at(db, key, to_int(timestamp), options)
+
+    def cmd_pttl(self, db, key):
+        if not db.exists(key):
+            return -2
+        expires = db.expires.get(key)
+        if expires is None:
+            return -1
+        return max(0, expires - now_ms())
+
+    def cmd_ttl(self, db, key):
+        ttl = self.cmd_pttl(db, key)
+        return ttl if ttl < 0 else (ttl + 500) // 1000
+
+    def cmd_persist(self, db, key):
+        if db.exists(key) and db.expires.pop(key, None) is not None:
+            return 1
+        return 0
+
+    # String commands
+
+    def get_string(self, db, key):
+        return db.get(key, "string")
+
+    def cmd_get(self, db, key):
+        return self.get_string(db, key)
+
+    def cmd_getdel(self, db, key):
+        v = self.get_string(db, key)
+        db.delete(key)
+        return v
+
+    def cmd_set(self, db, key, value, *args):
+        options = [a.upper() for a in args]
+        expires = None
+        keepttl = False
+        i = 0
+        while i < len(options):
+            o = options[i]
+            if o in (b"EX", b"PX", b"EXAT", b"PXAT"):
+                v = to_int(args[i + 1])
+                if v <= 0:
+                    raise ReplyError("ERR invalid expire time in 'set' command")
+                expires = {
+                    b"EX": now_ms() + v * 1000,
+                    b"PX": now_ms() + v,
+                    b"EXAT": v * 1000,
+                    b"PXAT": v,
+                }[o]
+                i += 1
+            elif o == b"KEEPTTL":
+                keepttl = True
+            elif o not in (b"NX", b"XX", b"GET"):
+                raise ReplyError("ERR syntax error")
+            i += 1
+
+        item = db.lookup(key)
+        old = None
+        if b"GET" in options and item is not None:
+            if item[0] != "string":
+                raise wrong_type()
+            old = item[1]
+
+        ok = True
+        if b"NX" in options and item is not None:
+            ok = False
+        elif b"XX" in options and item is None:
+            ok = False
+
+        if ok:
+            db.set(key, "string", bytes(value), keepttl=keepttl)
+            if expires is not None:
+                db.expires[key] = expires
+
+        if b"GET" in options:
+            return old
+        return b"OK" if ok else None
+
+    def cmd_setnx(self, db, key, value):
+        return 1 if self.cmd_set(db, key, value, b"NX") else 0
+
+    def cmd_setex(self, db, key, seconds, value):
+        return self.cmd_set(db, key, value, b"EX", seconds)
+
+    def cmd_psetex(self, db, key, ms, value):
+        return self.cmd_set(db, key, value, b"PX", ms)
+
+    def cmd_getset(self, db, key, value):
+        return self.cmd_set(db, key, value, b"GET")
+
+    def cmd_mget(self, db, *keys):
+        ret = []
+        for key in keys:
+            item = db.lookup(key)
+            ret.append(item[1] if item is not None and item[0] == "string" else None)
+        return ret
+
+    def cmd_mset(self, db, *args):
+        for i in range(0, len(args), 2):
+            db.set(args[i], "string", args[i + 1], keepttl=False)
+        return b"OK"
+
+    def cmd_msetnx(self, db, *args):
+        if any(db.exists(args[i]) for i in range(0, len(args), 2)):
+            return 0
+        self.cmd_mset(db, *args)
+        return 1
+
+    def cmd_incrby(self, db, key, amount):
+        v = self.get_string(db, key)
+        v = (to_int(v) if v is not None else 0) + to_int(amount)
+        db.set(key, "string", encode(v))
+        return v
+
+    def cmd_incr(self, db, key):
+        return self.cmd_incrby(db, key, 1)
+
+    def cmd_decrby(self, db, key, amount):
+        return self.cmd_incrby(db, key, -to_int(amount))
+
+    def cmd_decr(self, db, key):
+        return self.cmd_incrby(db, key, -1)
+
+    def cmd_incrbyfloat(self, db, key, amount):
+        v = self.get_string(db, key)
+        v = (to_float(v) if v is not None else 0.0) + to_float(amount)
+        db.set(key, "string", format_float(v))
+        return format_float(v)
+
+    def cmd_append(self, db, key, value):
+        v = (self.get_string(db, key) or b"") + value
+        db.set(key, "string", v)
+        return len(v)
+
+    def cmd_strlen(self, db, key):
+        return len(self.get_string(db, key) or b"")
+
+    def cmd_getrange(self, db, key, start, end):
+        v = self.get_string(db, key) or b""
+        start, stop = index_range(to_int(start), to_int(end), len(v))
+        return v[start:stop]
+
+    cmd_substr = cmd_getrange
+
+    def cmd_setrange(self, db, key, offset, value):
+        offset = to_int(offset)
+        if offset < 0:
+            raise ReplyError("ERR offset is out of range")
+
+        v = self.get_string(db, key)
+        if v is None and not value:
+            return 0
+
+        buf = bytearray(v or b"")
+        if len(buf) < offset:
+            buf.extend(b"\x00" * (offset - len(buf)))
+        buf[offset:offset + len(value)] = value
+        db.set(key, "string", bytes(buf))
+        return len(buf)
+
+    def cmd_getbit(self, db, key, offset):
+        return get_bits(self.get_string(db, key) or b"", to_int(offset), 1)
+
+    def cmd_setbit(self, db, key, offset, value):
+        offset = to_int(offset)
+        buf = bytearray(self.get_string(db, key) or b"")
+        old = get_bits(buf, offset, 1)
+        set_bits(buf, offset, 1, to_int(value))
+        db.set(key, "string", bytes(buf))
+        return old
+
+    def cmd_bitcount(self, db, key, *args):
+        v = self.get_string(db, key) or b""
+        if args:
+            start, end = to_int(args[0]), to_int(args[1])
+            if len(args) > 2 and args[2].upper() == b"BIT":
+                start, stop = index_range(start, end, len(v) * 8)
+                return sum(get_bits(v, i, 1) for i in range(start, stop))
+
+            start, stop = index_range(start, end, len(v))
+            v = v[start:stop]
+        return sum(bin(b).count("1") for b in bytearray(v))
+
+    def cmd_bitop(self, db, operation, dest, *keys):
+        operation = operation.upper()
+        values = [bytearray(self.get_string(db, key) or b"") for key in keys]
+        size = max(len(v) for v in values) if values else 0
+
+        if operation == b"NOT":
+            if len(values) != 1:
+                raise ReplyError("ERR BITOP NOT must be called with a single source key.")
+            ret = bytearray((~b) & 0xff for b in values[0])
+
+        else:
+            ops = {
+                b"AND": lambda a, b: a & b,
+                b"OR": lambda a, b: a | b,
+                b"XOR": lambda a, b: a ^ b,
+            }
+            if operation not in ops:
+                raise ReplyError("ERR syntax error")
+
+            op = ops[operation]
+            ret = bytearray(size)
+            for i in range(size):
+                b = values[0][i] if i < len(values[0]) else 0
+                for v in values[1:]:
+                    b = op(b, v[i] if i < len(v) else 0)
+                ret[i] = b
+
+        if ret:
+            db.set(dest, "string", bytes(ret), keepttl=False)
+        else:
+            db.delete(dest)
+        return len(ret)
+
+    def cmd_bitfield(self, db, key, *args):
+        v = self.get_string(db, key)
+        buf = bytearray(v or b"")
+        ret = []
+        overflow = b"WRAP"
+        changed = False
+
+        def field(type_name, offset):
+            signed = type_name[:1].lower() == b"i"
+            width = to_int(type_name[1:])
+            if offset.startswith(b"#"):
+                offset = to_int(offset[1:]) * width
+            else:
+                offset = to_int(offset)
+            return signed, width, offset
+
+        def to_signed(value, width):
+            if value & (1 << (width - 1)):
+                value -= 1 << width
+            return value
+
+        def fit(value, signed, width):
+            """returns the value to store, None if it overflowed with FAIL"""
+            lo, hi = (-(1 << (width - 1)), (1 << (width - 1)) - 1) if signed else (0, (1 << width) - 1)
+            if lo <= value <= hi:
+                return value
+            if overflow == b"FAIL":
+                return None
+            if overflow == b"SAT":
+                return hi if value > hi else lo
+            value &= (1 << width) - 1
+            return to_signed(value, width) if signed else value
+
+        i = 0
+        while i < len(args):
+            op = args[i].upper()
+            if op == b"OVERFLOW":
+                overflow = args[i + 1].upper()
+                i += 2
+                continue
+
+            signed, width, offset = field(args[i + 1], args[i + 2])
+            current = get_bits(buf, offset, width)
+            if signed:
+                current = to_signed(current, width)
+
+            if op == b"GET":
+                ret.append(current)
+                i += 3
+
+            elif op in (b"SET", b"INCRBY"):
+                value = to_int(args[i + 3])
+                if op == b"INCRBY":
+                    value = fit(current + value, signed, width)
+                    reply = value
+                else:
+                    value = fit(value, signed, width)
+                    reply = current
+
+                if value is None:
+                    ret.append(None)
+                else:
+                    set_bits(buf, offset, width, value & ((1 << width) - 1))
+                    changed = True
+                    ret.append(reply)
+                i += 4
+
+            else:
+                raise ReplyError("ERR syntax error")
+
+        if changed:
+            db.set(key, "string", bytes(buf))
+        return ret
+
+    # Hash commands
+
+    def get_hash(self, db, key, create=False):
+        return db.get(key, "hash", dict if create else None)
+
+    def cmd_hset(self, db, key, *args):
+        if not args or len(args) % 2:
+            raise ReplyError("ERR wrong number of arguments for 'hset' command")
+        h = self.get_hash(db, key, True)
+        added = 0
+        for i in range(0, len(args), 2):
+            if args[i] not in h:
+                added += 1
+            h[args[i]] = args[i + 1]
+        return added
+
+    def cmd_hmset(self, db, key, *args):
+        self.cmd_hset(db, key, *args)
+        return b"OK"
+
+    def cmd_hsetnx(self, db, key, field, value):
+        h = self.get_hash(db, key, True)
+        if field in h:
+            return 0
+        h[field] = value
+        return 1
+
+    def cmd_hget(self, db, key, field):
+        return (self.get_hash(db, key) or {}).get(field)
+
+    def cmd_hmget(self, db, key, *fields):
+        h = self.get_hash(db, key) or {}
+        return [h.get(f) for f in fields]
+
+    def cmd_hgetall(self, db, key):
+        h = self.get_hash(db, key) or {}
+        return [x for kv in h.items() for x in kv]
+
+    def cmd_hkeys(self, db, key):
+        return list((self.get_hash(db, key) or {}).keys())
+
+    def cmd_hvals(self, db, key):
+        return list((self.get_hash(db, key) or {}).values())
+
+    def cmd_hlen(self, db, key):
+        return len(self.get_hash(db, key) or {})
+
+    def cmd_hstrlen(self, db, key, field):
+        return len((self.get_hash(db, key) or {}).get(field, b""))
+
+    def cmd_hexists(self, db, key, field):
+        return 1 if field in (self.get_hash(db, key) or {}) else 0
+
+    def cmd_hdel(self, db, key, *fields):
+        h = self.get_hash(db, key)
+        if h is None:
+            return 0
+        ret = sum(1 for f in fields if h.pop(f, None) is not None)
+        db.clean(key, h)
+        return ret
+
+    def cmd_hincrby(self, db, key, field, amount):
+        h = self.get_hash(db, key, True)
+        v = to_int(h.get(field, 0)) + to_int(amount)
+        h[field] = encode(v)
+        return v
+
+    def cmd_hincrbyfloat(self, db, key, field, amount):
+        h = self.get_hash(db, key, True)
+        v = to_float(h.get(field, 0)) + to_float(amount)
+        h[field] = format_float(v)
+        return h[field]
+
+    def cmd_hrandfield(self, db, key, *args):
+        h = self.get_hash(db, key) or {}
+        if not args:
+            return random.choice(list(h.keys())) if h else None
+
+        count = to_int(args[0])
+        if count >= 0:
+            fields = random.sample(list(h.keys()), min(count, len(h)))
+        else:
+            fields = [random.choice(list(h.keys())) for _ in range(-count)] if h else []
+
+        if len(args) > 1 and args[1].upper() == b"WITHVALUES":
+            return [x for f in fields for x in (f, h[f])]
+        return fields
+
+    def cmd_hscan(self, db, key, cursor, *args):
+        pattern = self.scan_options(args).get(b"MATCH")
+        h = self.get_hash(db, key) or {}
+        return [b"0", [x for kv in h.items() if match(pattern, kv[0]) for x in kv]]
+
+    # Set commands
+
+    def get_set(self, db, key, create=False):
+        return db.get(key, "set", set if create else None)
+
+    def cmd_sadd(self, db, key, *members):
+        s = self.get_set(db, key, True)
+        size = len(s)
+        s.update(members)
+        return len(s) - size
+
+    def cmd_srem(self, db, key, *members):
+        s = self.get_set(db, key)
+        if s is None:
+            return 0
+        size = len(s)
+        s.difference_update(members)
+        db.clean(key, s)
+        return size - len(s)
+
+    def cmd_smembers(self, db, key):
+        return list(self.get_set(db, key) or [])
+
+    def cmd_scard(self, db, key):
+        return len(self.get_set(db, key) or [])
+
+    def cmd_sismember(self, db, key, member):
+        return 1 if member in (self.get_set(db, key) or ()) else 0
+
+    def cmd_smismember(self, db, key, *members):
+        s = self.get_set(db, key) or ()
+        return [1 if m in s else 0 for m in members]
+
+    def cmd_spop(self, db, key, *args):
+        s = self.get_set(db, key)
+        if not args:
+            if not s:
+                return None
+            ret = random.choice(list(s))
+            s.discard(ret)
+            db.clean(key, s)
+            return ret
+
+        if s is None:
+            return []
+        ret = random.sample(list(s), min(to_int(args[0]), len(s)))
+        s.difference_update(ret)
+        db.clean(key, s)
+        return ret
+
+    def cmd_srandmember(self, db, key, *args):
+        s = list(self.get_set(db, key) or [])
+        if not args:
+            return random.choice(s) if s else None
+
+        count = to_int(args[0])
+        if count >= 0:
+            return random.sample(s, min(count, len(s)))
+        return [random.choice(s) for _ in range(-count)] if s else []
+
+    def set_op(self, db, op, keys):
+        sets = [self.get_set(db, key) or set() for key in keys]
+        ret = set(sets[0])
+        for s in sets[1:]:
+            ret = getattr(ret, op)(s)
+        return ret
+
+    def cmd_sinter(self, db, *keys):
+        return list(self.set_op(db, "intersection", keys))
+
+    def cmd_sunion(self, db, *keys):
+        return list(self.set_op(db, "union", keys))
+
+    def cmd_sdiff(self, db, *keys):
+        return list(self.set_op(db, "difference", keys))
+
+    def set_op_store(self, db, op, dest, keys):
+        s = self.set_op(db, op, keys)
+        db.delete(dest)
+        if s:
+            db.set(dest, "set", s)
+        return len(s)
+
+    def cmd_sinterstore(self, db, dest, *keys):
+        return self.set_op_store(db, "intersection", dest, keys)
+
+    def cmd_sunionstore(self, db, dest, *keys):
+        return self.set_op_store(db, "union", dest, keys)
+
+    def cmd_sdiffstore(self, db, dest, *keys):
+        return self.set_op_store(db, "difference", dest, keys)
+
+    def cmd_smove(self, db, src, dest, member):
+        s = self.get_set(db, src)
+        self.get_set(db, dest)
+        if not s or member not in s:
+            return 0
+        s.discard(member)
+        db.clean(src, s)
+        self.get_set(db, dest, True).add(member)
+        return 1
+
+    def cmd_sscan(self, db, key, cursor, *args):
+        pattern = self.scan_options(args).get(b"MATCH")
+        s = self.get_set(db, key) or ()
+        return [b"0", [m for m in s if match(pattern, m)]]
+
+    # Sorted set commands
+
+    def get_zset(self, db, key, create=False):
+        return db.get(key, "zset", dict if create else None)
+
+    def zsorted(self, z, reverse=False):
+        """return the (member, score) pairs of z in score order"""
+        return sorted(
+            z.items(),
+            key=lambda kv: (kv[1], kv[0]),
+            reverse=reverse,
+        )
+
+    def zreply(self, items, withscores):
+        if withscores:
+            return [x for m, s in items for x in (m, format_float(s))]
+        return [m for m, s in items]
+
+    def cmd_zadd(self, db, key, *args):
+        flags = set()
+        i = 0
+        while i < len(args) and args[i].upper() in (b"NX", b"XX", b"GT", b"LT", b"CH", b"INCR"):
+            flags.add(args[i].upper())
+            i += 1
+
+        pairs = args[i:]
+        if not pairs or len(pairs) % 2:
+            raise ReplyError("ERR syntax error")
+        if b"INCR" in flags and len(pairs) != 2:
+            raise ReplyError("ERR INCR option supports a single increment-element pair")
+
+        z = self.get_zset(db, key, True)
+        added = changed = 0
+        ret = None
+        for i in range(0, len(pairs), 2):
+            score = to_float(pairs[i])
+            member = pairs[i + 1]
+            current = z.get(member)
+            if b"INCR" in flags:
+                score += current or 0.0
+
+            if current is None:
+                if b"XX" in flags:
+                    continue
+                z[member] = score
+                added += 1
+                ret = score
+
+            else:
+                if b"NX" in flags:
+                    continue
+                if b"GT" in flags and score <= current:
+                    continue
+                if b"LT" in flags and score >= current:
+                    continue
+                if score != current:
+                    z[member] = score
+                    changed += 1
+                ret = score
+
+        db.clean(key, z)
+        if b"INCR" in flags:
+            return None if ret is None else format_float(ret)
+        return added + changed if b"CH" in flags else added
+
+    def cmd_zincrby(self, db, key, amount, member):
+        z = self.get_zset(db, key, True)
+        z[member] = z.get(member, 0.0) + to_float(amount)
+        return format_float(z[member])
+
+    def cmd_zrem(self, db, key, *members):
+        z = self.get_zset(db, key)
+        if z is None:
+            return 0
+        ret = sum(1 for m in members if z.pop(m, None) is not None)
+        db.clean(key, z)
+        return ret
+
+    def cmd_zscore(self, db, key, member):
+        score = (self.get_zset(db, key) or {}).get(member)
+        return None if score is None else format_float(score)
+
+    def cmd_zmscore(self, db, key, *members):
+        return [self.cmd_zscore(db, key, m) for m in members]
+
+    def cmd_zcard(self, db, key):
+        return len(self.get_zset(db, key) or {})
+
+    def cmd_zcount(self, db, key, lo, hi):
+        lo, hi = score_bound(lo), score_bound(hi)
+        z = self.get_zset(db, key) or {}
+        return sum(1 for s in z.values() if in_bounds(s, lo, hi))
+
+    def cmd_zrank(self, db, key, member, reverse=False):
+        z = self.get_zset(db, key) or {}
+        if member not in z:
+            return None
+        return [m for m, s in self.zsorted(z, reverse)].index(member)
+
+    def cmd_zrevrank(self, db, key, member):
+        return self.cmd_zrank(db, key, member, True)
+
+    def zrange(self, db, key, start, stop, byscore=False, rev=False, limit=None, withscores=False):
+        items = self.zsorted(self.get_zset(db, key) or {}, rev)
+        if byscore:
+            lo, hi = score_bound(start), score_bound(stop)
+            if rev:
+                lo, hi = hi, lo
+            items = [kv for kv in items if in_bounds(kv[1], lo, hi)]
+            if limit:
+                offset, count = limit
+                items = items[offset:] if count < 0 else items[offset:offset + count]
+
+        else:
+            start, stop = index_range(to_int(start), to_int(stop), len(items))
+            items = items[start:stop]
+
+        return self.zreply(items, withscores)
+
+    def cmd_zrange(self, db, key, start, stop, *args):
+        options = [a.upper() for a in args]
+        limit = None
+        if b"LIMIT" in options:
+            i = options.index(b"LIMIT")
+            limit = (to_int(args[i + 1]), to_int(args[i + 2]))
+        if b"BYLEX" in options:
+            raise ReplyError("ERR BYLEX is not supported by the memory interface")
+        return self.zrange(
+            db,
+            key,
+            start,
+            stop,
+            byscore=b"BYSCORE" in options,
+            rev=b"REV" in options,
+            limit=limit,
+            withscores=b"WITHSCORES" in options,
+        )
+
+    def cmd_zrevrange(self, db, key, start, stop, *args):
+        return self.cmd_zrange(db, key, start, stop, b"REV", *args)
+
+    def cmd_zrangebyscore(self, db, key, lo, hi, *args):
+        return self.cmd_zrange(db, key, lo, hi, b"BYSCORE", *args)
+
+    def cmd_zrevrangebyscore(self, db, key, hi, lo, *args):
+        return self.cmd_zrange(db, key, hi, lo, b"BYSCORE", b"REV", *args)
+
+    def cmd_zremrangebyscore(self, db, key, lo, hi):
+        z = self.get_zset(db, key)
+        if z is None:
+            return 0
+        lo, hi = score_bound(lo), score_bound(hi)
+        members = [m for m, s in z.items() if in_bounds(s, lo, hi)]
+        for m in members:
+            del z[m]
+        db.clean(key, z)
+        return len(members)
+
+    def cmd_zremrangebyrank(self, db, key, start, stop):
+        z = self.get_zset(db, key)
+        if z is None:
+            return 0
+        items = self.zsorted(z)
+        start, stop = index_range(to_int(start), to_int(stop), len(items))
+        for m, s in items[start:stop]:
+            del z[m]
+        db.clean(key, z)
+        return stop - start
+
+    def zpop(self, db, key, count, reverse):
+        z = self.get_zset(db, key)
+        if not z:
+            return []
+        items = self.zsorted(z, reverse)[:count]
+        for m, s in items:
+            del z[m]
+        db.clean(key, z)
+        return items
+
+    def cmd_zpopmin(self, db, key, count=1, reverse=False):
+        return self.zreply(self.zpop(db, key, to_int(count), reverse), True)
+
+    def cmd_zpopmax(self, db, key, count=1):
+        return self.cmd_zpopmin(db, key, count, True)
+
+    def bzpop(self, db, args, reverse):
+        keys, timeout = args[:-1], to_float(args[-1])
+
+        def pop():
+            for key in keys:
+                items = self.zpop(db, key, 1, reverse)
+                if items:
+                    return [key, items[0][0], format_float(items[0][1])]
+
+        return self.block(timeout, pop)
+
+    def cmd_bzpopmin(self, db, *args):
+        return self.bzpop(db, args, False)
+
+    def cmd_bzpopmax(self, db, *args):
+        return self.bzpop(db, args, True)
+
+    def cmd_zscan(self, db, key, cursor, *args):
+        pattern = self.scan_options(args).get(b"MATCH")
+        z = self.get_zset(db, key) or {}
+        items = [kv for kv in z.items() if match(pattern, kv[0])]
+        return [b"0", self.zreply(items, True)]
+
+    # List commands
+
+    def get_list(self, db, key, create=False):
+        return db.get(key, "list", list if create else None)
+
+    def cmd_rpush(self, db, key, *values):
+        l = self.get_list(db, key, True)
+        l.extend(values)
+        return len(l)
+
+    def cmd_lpush(self, db, key, *values):
+        l = self.get_list(db, key, True)
+        l[0:0] = reversed(values)
+        return len(l)
+
+    def cmd_rpushx(self, db, key, *values):
+        return self.cmd_rpush(db, key, *values) if db.exists(key) else 0
+
+    def cmd_lpushx(self, db, key, *values):
+        return self.cmd_lpush(db, key, *values) if db.exists(key) else 0
+
+    def pop(self, db, key, count, left):
+        l = self.get_list(db, key)
+        if not l:
+            return None
+        if left:
+            ret = l[:count]
+            del l[:count]
+        else:
+            ret = l[-count:][::-1]
+            del l[-count:]
+        db.clean(key, l)
+        return ret
+
+    def cmd_lpop(self, db, key, *args):
+        if args:
+            return self.pop(db, key, to_int(args[0]), True)
+        ret = self.pop(db, key, 1, True)
+        return ret[0] if ret else None
+
+    def cmd_rpop(self, db, key, *args):
+        if args:
+            return self.pop(db, key, to_int(args[0]), False)
+        ret = self.pop(db, key, 1, False)
+        return ret[0] if ret else None
+
+    def bpop(self, db, args, left):
+        keys, timeout = args[:-1], to_float(args[-1])
+
+        def pop():
+            for key in keys:
+                ret = self.pop(db, key, 1, left)
+                if ret:
+                    return [key, ret[0]]
+
+        return self.block(timeout, pop)
+
+    def cmd_blpop(self, db, *args):
+        return self.bpop(db, args, True)
+
+    def cmd_brpop(self, db, *args):
+        return self.bpop(db, args, False)
+
+    def cmd_llen(self, db, key):
+        return len(self.get_list(db, key) or [])
+
+    def cmd_lindex(self, db, key, index):
+        l = self.get_list(db, key) or []
+        index = to_int(index)
+        if -len(l) <= index < len(l):
+            return l[index]
+        return None
+
+    def cmd_lset(self, db, key, index, value):
+        l = self.get_list(db, key)
+        if l is None:
+            raise ReplyError("ERR no such key")
+        index = to_int(index)
+        if not -len(l) <= index < len(l):
+            raise ReplyError("ERR index out of range")
+        l[index] = value
+        return b"OK"
+
+    def cmd_lrange(self, db, key, start, stop):
+        l = self.get_list(db, key) or []
+        start, stop = index_range(to_int(start), to_int(stop), len(l))
+        return l[start:stop]
+
+    def cmd_ltrim(self, db, key, start, stop):
+        l = self.get_list(db, key)
+        if l is not None:
+            start, stop = index_range(to_int(start), to_int(stop), len(l))
+            l[:] = l[start:stop]
+            db.clean(key, l)
+        return b"OK"
+
+    def cmd_lrem(self, db, key, count, value):
+        l = self.get_list(db, key)
+        if l is None:
+            return 0
+        count = to_int(count)
+        indexes = [i for i, v in enumerate(l) if v == value]
+        if count < 0:
+            indexes = indexes[::-1][:-count]
+        elif count > 0:
+            indexes = indexes[:count]
+        for i in sorted(indexes, reverse=True):
+            del l[i]
+        db.clean(key, l)
+        return len(indexes)
+
+    # HyperLogLog commands, these count exactly
+
+    def get_hll(self, db, key, create=False):
+        return db.get(key, "hll", set if create else None)
+
+    def cmd_pfadd(self, db, key, *elements):
+        created = not db.exists(key)
+        s = self.get_hll(db, key, True)
+        size = len(s)
+        s.update(elements)
+        return 1 if created or len(s) != size else 0
+
+    def cmd_pfcount(self, db, *keys):
+        ret = set()
+        for key in keys:
+            ret.update(self.get_hll(db, key) or ())
+        return len(ret)
+
+    def cmd_pfmerge(self, db, dest, *keys):
+        s = self.get_hll(db, dest, True)
+        for key in keys:
+            s.update(self.get_hll(db, key) or ())
+        return b"OK"
+
+    # Stream commands
+
+    def get_stream(self, db, key, create=False):
+        return db.get(key, "stream", Stream if create else None)
+
+    def trim_options(self, args):
+        """parse MAXLEN [=|~] n [LIMIT n], returns (maxlen, remaining args)"""
+        maxlen = None
+        while args and args[0].upper() in (b"MAXLEN", b"LIMIT", b"MINID"):
+            option = args[0].upper()
+            args = args[1:]
+            if args[0] in (b"=", b"~"):
+                args = args[1:]
+            if option == b"MAXLEN":
+                maxlen = to_int(args[0])
+            elif option == b"MINID":
+                raise ReplyError("ERR MINID is not supported by the memory interface")
+            args = args[1:]
+        return maxlen, args
+
+    def cmd_xadd(self, db, key, *args):
+        nomkstream = False
+        if args[0].upper() == b"NOMKSTREAM":
+            nomkstream = True
+            args = args[1:]
+
+        maxlen, args = self.trim_options(args)
+        entry_id, fields = args[0], list(args[1:])
+        if not fields or len(fields) % 2:
+            raise ReplyError("ERR wrong number of arguments for 'xadd' command")
+
+        s = self.get_stream(db, key, not nomkstream)
+        if s is None:
+            return None
+
+        last = s.last_id
+        if entry_id == b"*":
+            ms = now_ms()
+            i = (ms, 0) if ms > last[0] else (last[0], last[1] + 1)
+
+        else:
+            i = parse_id(entry_id, last[1] + 1 if entry_id == String(last[0]).encode("utf-8") else 0)
+            if i <= last:
+                raise ReplyError(
+                    "ERR The ID specified in XADD is equal or smaller than the target stream top item"
+                )
+
+        s.add(i, fields)
+        if maxlen is not None:
+            s.trim(maxlen)
+        return format_id(i)
+
+    def cmd_xlen(self, db, key):
+        return len(self.get_stream(db, key) or ())
+
+    def cmd_xtrim(self, db, key, *args):
+        maxlen, args = self.trim_options(args)
+        s = self.get_stream(db, key)
+        if s is None or maxlen is None:
+            return 0
+        return s.trim(maxlen)
+
+    def xrange(self, s, start, end, count, reverse=False):
+        if start.startswith(b"("):
+            lo = parse_id(start[1:])
+            lo = (lo[0], lo[1] + 1)
+        else:
+            lo = parse_id(start)
+
+        if end.startswith(b"("):
+            hi = parse_id(end[1:])
+            hi = (hi[0], hi[1] - 1)
+        else:
+            hi = parse_id(end, float("inf"))
+
+        ret = []
+        entries = zip(s.ids, s.entries) if s else []
+        if reverse:
+            entries = reversed(list(entries))
+        for i, entry in entries:
+            if lo <= i <= hi:
+                ret.append(entry)
+                if count and len(ret) >= count:
+                    break
+        return ret
+
+    def cmd_xrange(self, db, key, start, end, *args):
+        count = to_int(args[1]) if args else None
+        return self.xrange(self.get_stream(db, key), start, end, count)
+
+    def cmd_xrevrange(self, db, key, end, start, *args):
+        count = to_int(args[1]) if args else None
+        return self.xrange(self.get_stream(db, key), start, end, count, True)
+
+    def read_options(self, args):
+        """parse [COUNT n] [BLOCK ms] [NOACK] STREAMS key... id...
+
+        :returns: tuple, (count, block, noack, [(key, id), ...])
+        """
+        count = block = None
+        noack = False
+        i = 0
+        while args[i].upper() != b"STREAMS":
+            option = args[i].upper()
+            if option == b"COUNT":
+                count = to_int(args[i + 1])
+                i += 1
+            elif option == b"BLOCK":
+                block = to_int(args[i + 1])
+                i += 1
+            elif option == b"NOACK":
+                noack = True
+            i += 1
+
+        streams = args[i + 1:]
+        half = len(streams) // 2
+        return count, block, noack, list(zip(streams[:half], streams[half:]))
+
+    def cmd_xread(self, db, *args):
+        count, block, noack, streams = self.read_options(args)
+
+        ids = []
+        for key, i in streams:
+            if i == b"$":
+                s = self.get_stream(db, key)
+                ids.append(s.last_id if s else (0, 0))
+            else:
+                ids.append(parse_id(i))
+
+        def read():
+            ret = []
+            for (key, _), i in zip(streams, ids):
+                entries = (self.get_stream(db, key) or Stream()).after(i, count)
+                if entries:
+                    ret.append([key, entries])
+            return ret or None
+
+        if block is None:
+            return read()
+        return self.block(block / 1000.0, read)
+
+    def cmd_xgroup(self, db, subcommand, key, group, *args):
+        subcommand = subcommand.upper()
+        if subcommand == b"CREATE":
+            mkstream = any(a.upper() == b"MKSTREAM" for a in args[1:])
+            s = self.get_stream(db, key, mkstream)
+            if s is None:
+                raise ReplyError(
+                    "ERR The XGROUP subcommand requires the key to exist. "
+                    "Note that for CREATE you may want to use the MKSTREAM "
+                    "option to create an empty stream automatically."
+                )
+            if group in s.groups:
+                raise ReplyError("BUSYGROUP Consumer Group name already exists")
+
+            last = s.last_id if args[0] == b"$" else parse_id(args[0])
+            s.groups[group] = {"last_id": last, "pending": collections.OrderedDict()}
+            return b"OK"
+
+        elif subcommand == b"DESTROY":
+            s = self.get_stream(db, key)
+            return 1 if s and s.groups.pop(group, None) is not None else 0
+
+        raise ReplyError("ERR unknown subcommand '{}'".format(String(subcommand)))
+
+    def cmd_xreadgroup(self, db, option, group, consumer, *args):
+        count, block, noack, streams = self.read_options(args)
+
+        def get_group(key):
+            s = self.get_stream(db, key)
+            g = s.groups.get(group) if s else None
+            if g is None:
+                raise ReplyError(
+                    "NOGROUP No such key '{}' or consumer group '{}' in XREADGROUP with GROUP option".format(
+                        String(key),
+                        String(group),
+                    )
+                )
+            return s, g
+
+        for key, i in streams:
+            get_group(key)
+
+        def read():
+            ret = []
+            for key, i in streams:
+                s, g = get_group(key)
+                if i == b">":
+                    entries = s.after(g["last_id"], count)
+                    if entries:
+                        g["last_id"] = parse_id(entries[-1][0])
+                        if not noack:
+                            for entry in entries:
+                                g["pending"][entry[0]] = consumer
+                        ret.append([key, entries])
+
+                else:
+                    # the consumer's pending entries, deleted entries are
+                    # returned with None fields
+                    start = parse_id(i)
+                    entries = []
+                    for entry_id, c in g["pending"].items():
+                        if c == consumer and parse_id(entry_id) > start:
+                            entry = s.get(parse_id(entry_id))
+                            entries.append(entry or [entry_id, None])
+                            if count and len(entries) >= count:
+                                break
+                    ret.append([key, entries])
+            return ret or None
+
+        if block is None or any(i != b">" for key, i in streams):
+            return read()
+        return self.block(block / 1000.0, read)
+
+    def cmd_xack(self, db, key, group, *ids):
+        s = self.get_stream(db, key)
+        g = s.groups.get(group) if s else None
+        if g is None:
+            return 0
+        return sum(1 for i in ids if g["pending"].pop(i, None) is not None)
+
+    # Scripting commands
+
+    def cmd_script(self, db, subcommand, *args):
+        subcommand = subcommand.upper()
+        if subcommand == b"LOAD":
+            sha = hashlib.sha1(args[0]).hexdigest().encode("utf-8")
+            self.scripts[sha] = args[0]
+            return sha
+
+        elif subcommand == b"EXISTS":
+            return [1 if sha.lower() in self.scripts else 0 for sha in args]
+
+        elif subcommand == b"FLUSH":
+            self.scripts = {}
+            return b"OK"
+
+        raise ReplyError("ERR unknown subcommand '{}'".format(String(subcommand)))
+
+    def cmd_eval(self, db, source, numkeys, *args):
+        sha = self.cmd_script(db, b"LOAD", source)
+        return self.cmd_evalsha(db, sha, numkeys, *args)
+
+    def cmd_evalsha(self, db, sha, numkeys, *args):
+        sha = sha.lower()
+        if sha not in self.scripts:
+            raise ReplyError("NOSCRIPT No matching script. Please use EVAL.")
+
+        s = registered_scripts.get(String(sha))
+        func = script_functions.get(s.name) if s else None
+        if func is None:
+            raise ReplyError(
+                "ERR the memory interface can't run Lua, register a Python "
+                "version of script {} with caches.memory.script()".format(
+                    s.name if s else String(sha)
+                )
+            )
+
+        numkeys = to_int(numkeys)
+        keys, args = list(args[:numkeys]), list(args[numkeys:])
+
+        def call(*args):
+            args = [encode(a) for a in args]
+            name = String(args[0]).lower()
+            if name in ("eval", "evalsha"):
+                raise ReplyError("ERR This Redis command is not allowed from script")
+            return self.call(db, args)
+
+        blocking = self.blocking
+        self.blocking = False
+        try:
+            return func(call, keys, args)
+
+        finally:
+            self.blocking = blocking
+
+
+@script("DictCache.pop")
+def dict_pop(call, keys, args):
+    v = call("HGET", keys[0], args[0])
+    if v is not None:
+        call("HDEL", keys[0], args[0])
+    return v
+
+
+@script("DictCache.popitem")
+def dict_popitem(call, keys, args):
+    k = call("HRANDFIELD", keys[0])
+    if k is None:
+        return None
+    v = call("HGET", keys[0], k)
+    call("HDEL", keys[0], k)
+    return [k, v]
+
+
+@script("DictCache.setdefault")
+def dict_setdefault(call, keys, args):
+    v = call("HGET", keys[0], args[0])
+    if v is not None:
+        return v
+    call("HSET", keys[0], args[0], args[1])
+    if int(args[2]) > 0:
+        for key in keys:
+            call("EXPIRE", key, args[2])
+    return args[1]
+
+
+def delete_chunks(call, keys, args, v):
+    """the Python version of core.delete_chunks_lua"""
+    if v is not None and v.startswith(args[0]):
+        chunk_id, count = v[len(args[0]):].split(b":")
+        for i in range(int(count)):
+            call("HDEL", keys[1], chunk_id + ":{}".format(i).encode("utf-8"))
+
+
+@script("Cache.set")
+def cache_set(call, keys, args):
+    delete_chunks(call, keys, args, call("GET", keys[0]))
+    call("SET", keys[0], args[1])
+    if int(args[2]) > 0:
+        call("EXPIRE", keys[0], args[2])
+        call("EXPIRE", keys[1], args[2])
+    return 1
+
+
+@script("DictCache.set")
+def dict_set(call, keys, args):
+    delete_chunks(call, keys, args, call("HGET", keys[0], args[1]))
+    call("HSET", keys[0], args[1], args[2])
+    if int(args[3]) > 0:
+        call("EXPIRE", keys[0], args[3])
+        call("EXPIRE", keys[1], args[3])
+    return 1
+
+
+@script("DictCache.delete")
+def dict_delete(call, keys, args):
+    delete_chunks(call, keys, args, call("HGET", keys[0], args[1]))
+    return call("HDEL", keys[0], args[1])
+
+
+def script_now(call):
+    t = call("TIME")
+    return int(t[0]) * 1000 + int(t[1]) // 1000
+
+
+@script("RateLimitCache.fixed")
+def rate_limit_fixed(call, keys, args):
+    limit, window, cost = int(args[0]), int(args[1]), int(args[2])
+    count = call("INCRBY", keys[0], cost)
+    ttl = call("PTTL", keys[0])
+    if ttl < 0:
+        call("PEXPIRE", keys[0], window)
+        ttl = window
+    if count > limit:
+        call("DECRBY", keys[0], cost)
+        return [0, limit - (count - cost), ttl]
+    return [1, limit - count, 0]
+
+
+@script("RateLimitCache.sliding")
+def rate_limit_sliding(call, keys, args):
+    limit, window, cost = int(args[0]), int(args[1]), int(args[2])
+    now = script_now(call)
+    call("ZREMRANGEBYSCORE", keys[0], "-inf", now - window)
+    count = call("ZCARD", keys[0])
+    if count + cost > limit:
+        retry = window
+        i = count + cost - limit - 1
+        if cost <= limit:
+            entry = call("ZRANGE", keys[0], i, i, "WITHSCORES")
+            if len(entry) > 1:
+                retry = int(float(entry[1]) + window - now)
+        return [0, limit - count, retry]
+
+    for i in range(1, cost + 1):
+        call("ZADD", keys[0], now, args[3] + ":{}".format(i).encode("utf-8"))
+    call("PEXPIRE", keys[0], window)
+    return [1, limit - count - cost, 0]
+
+
+@script("RateLimitCache.token")
+def rate_limit_token(call, keys, args):
+    limit, window, cost = int(args[0]), int(args[1]), int(args[2])
+    rate = limit / window
+    now = script_now(call)
+    tokens, ts = call("HMGET", keys[0], "tokens", "ts")
+    if tokens is None:
+        tokens = limit
+        ts = now
+    tokens = min(limit, float(tokens) + (max(0, now - float(ts)) * rate))
+    allowed = 0
+    retry = 0
+    if tokens >= cost:
+        tokens -= cost
+        allowed = 1
+    else:
+        retry = int(math.ceil((cost - tokens) / rate))
+    call("HSET", keys[0], "tokens", "{:.14g}".format(tokens), "ts", now)
+    call("PEXPIRE", keys[0], int(math.ceil((limit - tokens) / rate)) + 1)
+    return [allowed, int(math.floor(tokens)), retry]
+
+
+@script("LockCache.acquire")
+def lock_acquire(call, keys, args):
+    if call("SET", keys[0], args[0], "NX", "PX", args[1]) is not None:
+        fence = call("INCR", keys[1])
+        call("PEXPIRE", keys[1], args[2])
+        return fence
+    return 0
+
+
+@script("LockCache.release")
+def lock_release(call, keys, args):
+    if call("GET", keys[0]) == args[0]:
+        return call("DEL", keys[0])
+    return 0
+
+
+@script("LockCache.extend")
+def lock_extend(call, keys, args):
+    if call("GET", keys[0]) == args[0]:
+        call("PEXPIRE", keys[1], args[2])
+        return call("PEXPIRE", keys[0], args[1])
+    return 0
+
+
+class MemoryConnection(redis.connection.Connection):
+    """A redis-py connection that runs its commands on a MemoryStore, the
+    replies are queued until they are read like they would be on a socket"""
+    def __init__(self, *args, **kwargs):
+        super(MemoryConnection, self).__init__(*args, **kwargs)
+        self.replies = collections.deque()
+        self.selected = int(self.db or 0)
+        self.transaction = None
+        self.aborted = False
+
+    def connect(self):
+        if self._sock is None:
+            # the store stands in for the socket, that way is_connected and
+            # friends work like they would with a real connection
+            self._sock = get_store(self.host or "")
+            self.selected = int(self.db or 0)
+
+    def disconnect(self, *args, **kwargs):
+        self._sock = None
+        self.replies.clear()
+        self.transaction = None
+        self.aborted = False
+
+    def check_health(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return bool(self.replies)
+
+    def pack_command(self, *args):
+        return [args]
+
+    def pack_commands(self, commands):
+        return [tuple(args) for args in commands]
+
+    def send_command(self, *args, **kwargs):
+        self.send_packed_command(self.pack_command(*args))
+
+    def send_packed_command(self, command, check_health=True):
+        self.connect()
+        for args in command:
+            self.replies.append(self.execute(args))
+
+    def read_response(self, disable_decoding=False, **kwargs):
+        if not self.replies:
+            raise redis.ConnectionError("No reply to read from the memory interface")
+
+        reply = self.replies.popleft()
+        if isinstance(reply, redis.ResponseError):
+            raise reply
+
+        if self.encoder.decode_responses and not disable_decoding:
+            reply = decode(reply, self.encoder)
+        return reply
+
+    def error(self, e):
+        """convert a ReplyError to the exception redis-py would have parsed"""
+        return self._parser.parse_error(String(e))
+
+    def execute(self, args):
+        """run one command and return its reply, errors are returned not
+        raised like they would be read off the socket"""
+        # redis-py sends multi word commands (eg, "SCRIPT LOAD") as one arg
+        args = list(String(args[0]).split()) + list(args[1:])
+        args = [bytes(self.encoder.encode(a)) for a in args]
+        name = args[0].upper()
+        store = self._sock
+
+        try:
+            if self.transaction is not None:
+                if name == b"EXEC":
+                    commands = self.transaction
+                    aborted = self.aborted
+                    self.transaction = None
+                    self.aborted = False
+                    if aborted:
+                        raise ReplyError(
+                            "EXECABORT Transaction discarded because of previous errors."
+                        )
+                    return [
+                        self.error(r) if isinstance(r, ReplyError) else r
+                        for r in store.execute_transaction(self.selected, commands)
+                    ]
+
+                elif name == b"DISCARD":
+                    self.transaction = None
+                    self.aborted = False
+                    return b"OK"
+
+                elif name == b"MULTI":
+                    raise ReplyError("ERR MULTI calls can not be nested")
+
+                elif not store.has_command(name):
+                    self.aborted = True
+                    raise ReplyError("ERR unknown command '{}'".format(String(name)))
+
+                self.transaction.append(args)
+                return b"QUEUED"
+
+            if name == b"MULTI":
+                self.transaction = []
+                return b"OK"
+
+            elif name in (b"EXEC", b"DISCARD"):
+                raise ReplyError("ERR {} without MULTI".format(String(name)))
+
+            elif name == b"SELECT":
+                self.selected = to_int(args[1])
+                return b"OK"
+
+            return store.execute(self.selected, args)
+
+        except ReplyError as e:
+            return self.error(e)
+
+        except redis.RedisError:
+            raise
+
+        except Exception as e:
+            # a bad argument (eg, a missing option value), report it like
+            # the server would instead of leaving the replies out of sync
+            return self.error("ERR {}: {}".format(e.__class__.__name__, e))
+
+
+class InMemory(Redis):
+    """Redis interface that keeps the data in this process, handy for tests
+    and single process deployments that don't want to run a server
+
+    :example:
+        caches.configure("memory://")
+        caches.configure("memory://name/1") # db 1 of the "name" store
+    """
+    connection_kwargs = {
+        "connection_class": MemoryConnection,
+        # the replies are shaped like RESP2 replies
+        "protocol": 2,
+    }
+    """passed to the connection pool, the DSN uses these when it creates the
+    pool"""
+
+    def __init__(self, replicas=None, read_strategy="round_robin", **connection_config):
+        if not connection_config.get("connection_pool"):
+            connection_config.setdefault("db", 0)
+            connection_config.update(self.connection_kwargs)
+            connection_config = {
+                "connection_pool": redis.ConnectionPool(**connection_config)
+            }
+
+        super(InMemory, self).__init__(
+            replicas=replicas,
+            read_strategy=read_strategy,
+            **connection_config
+        )
+
+    @property
+    def store(self):
+        """the MemoryStore this interface uses"""
+        return get_store(self.connection_pool.connection_kwargs.get("host") or "")
+
+    def monitor(self):
+        raise redis.ResponseError("MONITOR is not supported by the memory interface")
@@ -0,0 +1,729 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import socket
+import threading
+import collections
+import heapq
+import itertools
+import time
+import random
+
+from .compat import *
+
+
+hook = None
+"""the Metrics instance every command is reported to, None to disable, this
+combines all the hooks"""
+
+hooks = {}
+"""the named Metrics instances (eg, metrics, hotkeys, tracing) combined in hook"""
+
+
+def set_hook(name, metrics):
+    """set or remove the named hook and recombine hook so the interfaces only
+    have one thing to check
+
+    :param name: str
+    :param metrics: Metrics, None to remove the hook
+    """
+    global hook
+    if metrics is None:
+        hooks.pop(name, None)
+
+    else:
+        hooks[name] = metrics
+
+    if not hooks:
+        hook = None
+
+    elif len(hooks) == 1:
+        hook = list(hooks.values())[0]
+
+    else:
+        hook = MultiMetrics(hooks.values())
+
+
+def set_metrics(metrics):
+    """Report every command the interfaces run to metrics
+
+    :example:
+        m = HistogramMetrics()
+        set_metrics(m)
+        ...
+        m.snapshot()
+
+    :param metrics: Metrics, None to turn metrics off
+    """
+    set_hook("metrics", metrics)
+
+
+def get_metrics():
+    """return the Metrics instance set with set_metrics() or None"""
+    return hooks.get("metrics", None)
+
+
+def enable_hotkeys(enabled=True, capacity=1000, sample_rate=1.0):
+    """Start (or stop) sampling the most accessed and the biggest keys, see
+    hotkeys()
+
+    :param enabled: bool
+    :param capacity: int, how many keys are tracked, the top keys are accurate
+        as long as there are less than capacity keys that are about as hot
+    :param sample_rate: float, between 0 and 1, how many commands are sampled,
+        counts are scaled back up so they are still estimates of the totals
+    """
+    if enabled:
+        set_hook("hotkeys", HotKeys(capacity=capacity, sample_rate=sample_rate))
+
+    else:
+        set_hook("hotkeys", None)
+
+
+def hotkeys(n=10):
+    """return the most accessed and the biggest keys sampled since
+    enable_hotkeys() was called
+
+    :example:
+        caches.enable_hotkeys()
+        ...
+        for key, count in caches.hotkeys()["hot"]:
+            print(key, count)
+
+    :param n: int, how many keys to return
+    :returns: dict, hot is a list of (key, count) tuples and big is a list of
+        (key, bytes) tuples, both are sorted highest first
+    """
+    sampler = hooks.get("hotkeys", None)
+    if sampler is None:
+        return {"hot": [], "big": []}
+    return sampler.top(n)
+
+
+cache_stats = None
+"""the CacheStats instance the cache classes and cached functions report hits
+and misses to, None when stats are disabled"""
+
+
+def enable_stats(enabled=True):
+    """Start (or stop) collecting hit/miss stats, see stats()"""
+    global cache_stats
+    if enabled:
+        if cache_stats is None:
+            cache_stats = CacheStats()
+
+    else:
+        cache_stats = None
+
+
+def stats():
+    """return the hit/miss stats collected since enable_stats() was called
+
+    :example:
+        caches.enable_stats()
+        ...
+        s = caches.stats()
+        s["classes"]["Cache"]["hit_rate"]
+        s["functions"]["app.models.get_user"]["recompute_seconds"]
+
+    :returns: dict, with classes and functions keys, each is a dict of name
+        keys and dict values with counts (eg, hits, misses, hit_rate), see
+        CacheStats.snapshot()
+    """
+    if cache_stats is None:
+        return {"classes": {}, "functions": {}}
+    return cache_stats.snapshot()
+
+
+def reset_stats():
+    """zero out the hit/miss stats"""
+    if cache_stats is not None:
+        cache_stats.reset()
+
+
+no_key = set([
+    "PING", "INFO", "TIME", "ECHO", "DBSIZE", "RANDOMKEY", "SCAN", "SELECT",
+    "FLUSHDB", "FLUSHALL", "SCRIPT LOAD", "SCRIPT EXISTS", "SCRIPT FLUSH",
+    "CLIENT SETNAME", "CLIENT LIST", "CONFIG GET", "CONFIG SET", "MULTI",
+    "EXEC", "WATCH", "UNWATCH", "HELLO", "AUTH", "CLIENT SETINFO", "MONITOR",
+    "READONLY", "QUIT",
+])
+"""commands whose first argument isn't a key"""
+
+
+def command_key(args):
+    """return the first key args touches
+
+    :param args: tuple, the command args, args[0] is the command name
+    :returns: str|bytes|None
+    """
+    command = args[0]
+    if command in no_key or len(args) < 2:
+        return None
+
+    elif command in ("EVAL", "EVALSHA"):
+        return args[3] if len(args) > 3 and int(args[2]) else None
+
+    elif command == "BITOP":
+        return args[2]
+
+    elif command in ("XREAD", "XREADGROUP"):
+        for i, arg in enumerate(args):
+            if String(arg).upper() == "STREAMS":
+                return args[i + 1] if i + 1 < len(args) else None
+        return None
+
+    return args[1]
+
+
+def key_prefix(key):
+    """return the prefix part of key, for keys created by the cache classes
+    this is the name of the class (or the class's prefix)
+
+    :example:
+        key_prefix("{DictCache.foo}") # DictCache
+        key_prefix("Cache:gen") # Cache
+
+    :param key: str|bytes
+    :returns: str
+    """
+    if key is None:
+        return ""
+
+    if isinstance(key, bytes):
+        key = key.decode("utf-8", "replace")
+
+    else:
+        key = String(key)
+
+    key = key.lstrip("{")
+    for i, ch in enumerate(key):
+        if ch in ".:}":
+            return key[:i]
+    return key
+
+
+def payload_size(value):
+    """return roughly how many bytes value takes on the wire"""
+    if value is None or isinstance(value, bool):
+        return 0
+
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+
+    elif isinstance(value, basestring):
+        return len(value.encode("utf-8"))
+
+    elif isinstance(value, (int, long, float)):
+        return len(str(value))
+
+    elif isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in value.items())
+
+    elif isinstance(value, (list, tuple, set)):
+        return sum(payload_size(v) for v in value)
+
+    return 0
+
+
+def observe_command(metrics, args, res, latency, depth=1):
+    """report one command to metrics"""
+    key = command_key(args)
+    metrics.observe(
+        command=String(args[0]),
+        prefix=key_prefix(key),
+        latency=latency,
+        bytes_out=payload_size(args[1:]),
+        bytes_in=payload_size(res),
+        depth=depth,
+        key=key,
+    )
+
+
+def observe_pipeline(metrics, commands, res, latency):
+    """report a pipeline to metrics, see Metrics.observe_pipeline()"""
+    if commands:
+        metrics.observe_pipeline(commands, res, latency)
+
+
+class CacheStats(object):
+    """Hit/miss counters for the cache classes and the cached decorator
+
+    Cache classes are counted by class name and cached functions by their
+    module and qualified name
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.sections = {"classes": {}, "functions": {}}
+
+    def record(self, section, name, **fields):
+        """add fields to the counters of name
+
+        :param section: str, classes or functions
+        :param name: str, the class or function name
+        :param **fields: int|float, the values to add (eg, hits=1)
+        """
+        with self.lock:
+            counts = self.sections[section].get(name)
+            if counts is None:
+                counts = collections.Counter()
+                self.sections[section][name] = counts
+            counts.update(fields)
+
+    def deserialize(self, name, callback, data):
+        """count a hit for class name and time callback deserializing data
+
+        :returns: mixed, whatever callback returned
+        """
+        start = time.perf_counter()
+        ret = callback(data)
+        self.record(
+            "classes",
+            name,
+            hits=1,
+            bytes_read=payload_size(data),
+            deserialize_seconds=time.perf_counter() - start,
+        )
+        return ret
+
+    def snapshot(self):
+        """return a copy of the counters
+
+        Every name has hits, misses, and hit_rate, classes also have sets,
+        bytes_read, bytes_written, and deserialize_seconds, functions also have
+        recompute_seconds (the total time spent recomputing on misses)
+
+        :returns: dict
+        """
+        ret = {}
+        with self.lock:
+            for section, names in self.sections.items():
+                ret[section] = {}
+                for name, counts in names.items():
+                    d = dict(counts)
+                    d.setdefault("hits", 0)
+                    d.setdefault("misses", 0)
+                    total = d["hits"] + d["misses"]
+                    d["hit_rate"] = d["hits"] / total if total else 0.0
+                    ret[section][name] = d
+        return ret
+
+
+class Metrics(object):
+    """Base class for a metrics hook, children override observe()"""
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        """called after every command
+
+        :param command: str, the command name (eg, GET)
+        :param prefix: str, the key's prefix, usually the cache class name
+        :param latency: float, seconds the command took, commands in a
+            pipeline get an equal share of the pipeline's latency
+        :param bytes_out: int, roughly how many bytes were sent
+        :param bytes_in: int, roughly how many bytes were received
+        :param depth: int, how many commands were in the pipeline, 1 if the
+            command wasn't pipelined
+        :param key: str|bytes|None, the first key the command touched
+        """
+        pass
+
+    def observe_pipeline(self, commands, res, latency):
+        """called after every pipeline, by default every command of the
+        pipeline is passed to observe() with an equal share of the latency
+
+        :param commands: list[tuple], (args, options) tuples
+        :param res: list, the results of commands
+        :param latency: float, seconds the whole pipeline took
+        """
+        depth = len(commands)
+        if not isinstance(res, list) or len(res) != depth:
+            res = [None] * depth
+
+        share = latency / depth
+        for (args, options), r in zip(commands, res):
+            observe_command(self, args, r, share, depth)
+
+
+class MultiMetrics(Metrics):
+    """Report every command to all of hooks"""
+    def __init__(self, hooks):
+        self.hooks = list(hooks)
+
+    def observe(self, *args, **kwargs):
+        for h in self.hooks:
+            h.observe(*args, **kwargs)
+
+    def observe_pipeline(self, commands, res, latency):
+        for h in self.hooks:
+            h.observe_pipeline(commands, res, latency)
+
+
+class Histogram(object):
+    """A log-linear histogram in the spirit of HdrHistogram
+
+    Values are bucketed so every value is recorded within 1/2**sub_bits
+    relative error, memory only grows with the number of distinct buckets and
+    not with the number of values
+
+    http://hdrhistogram.org/
+    """
+    def __init__(self, sub_bits=5):
+        """
+        :param sub_bits: int, 5 gives ~3% relative error
+        """
+        self.sub_bits = sub_bits
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, value):
+        """return the bucket of value"""
+        value = int(value)
+        if value < (1 << self.sub_bits):
+            return value
+
+        shift = value.bit_length() - self.sub_bits - 1
+        return ((shift + 1) << self.sub_bits) + (value >> shift) - (1 << self.sub_bits)
+
+    def value(self, index):
+        """return the smallest value that would go in the bucket index"""
+        if index < (1 << self.sub_bits):
+            return index
+
+        shift = (index >> self.sub_bits) - 1
+        mask = (1 << self.sub_bits) - 1
+        return ((index & mask) + (1 << self.sub_bits)) << shift
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.buckets[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """add the values recorded by other (eg, another process's histogram)
+        to this histogram, both need the same sub_bits"""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, p):
+        """return the value at percentile p (eg, 99 for p99)"""
+        if not self.count:
+            return 0
+
+        target = max(p / 100.0 * self.count, 1)
+        seen = 0
+        for index in sorted(self.buckets.keys()):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self.value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class SpaceSaving(object):
+    """Approximate top-K counts in fixed space
+
+    Only capacity keys are tracked, when a new key shows up and there is no
+    room the key with the lowest count is replaced and the new key inherits
+    its count, that inherited count is the most the new key's count could be
+    overestimated by, so any key that's hotter than the tracked minimum is
+    guaranteed to be in the counts
+
+    https://www.cs.ucsb.edu/sites/default/files/documents/2005-23.pdf
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        """key -> [count, error]"""
+
+        self.heap = MinHeap(lambda key: self.counts.get(key, [None])[0])
+        """finds the key with the lowest count without scanning counts"""
+
+    def add(self, key, weight=1):
+        counts = self.counts
+        if key in counts:
+            counts[key][0] += weight
+
+        elif len(counts) < self.capacity:
+            counts[key] = [weight, 0]
+
+        else:
+            min_count, min_key = self.heap.pop()
+            counts.pop(min_key)
+            counts[key] = [min_count + weight, min_count]
+
+        self.heap.push(counts[key][0], key, self.capacity)
+
+    def top(self, n=10):
+        """return the n keys with the highest counts
+
+        :returns: list[tuple], (key, count, error) tuples
+        """
+        items = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)
+        return [(k, c, e) for k, (c, e) in items[:n]]
+
+
+class MinHeap(object):
+    """A heap of (value, key) tuples that finds the key with the lowest value
+    in O(log n)
+
+    Values only ever grow, so instead of updating a key's entry a new entry is
+    pushed and the old one is skipped when it reaches the top because it no
+    longer matches the key's current value
+    """
+    def __init__(self, value):
+        """
+        :param value: callable[key], returns the key's current value, None if
+            the key is gone
+        """
+        self.value = value
+        self.entries = []
+        self.counter = itertools.count()
+
+    def push(self, value, key, capacity):
+        """
+        :param capacity: int, how many keys are tracked, the stale entries are
+            dropped once there are twice as many entries, so that O(capacity)
+            work happens at most once every capacity pushes
+        """
+        # the counter breaks value ties so keys never have to be compared
+        heapq.heappush(self.entries, (value, next(self.counter), key))
+        if len(self.entries) > capacity * 2:
+            entries = {}
+            for entry in self.entries:
+                if self.value(entry[2]) == entry[0]:
+                    entries[entry[2]] = entry
+            self.entries = list(entries.values())
+            heapq.heapify(self.entries)
+
+    def peek(self):
+        """return the (value, key) with the lowest value, None if empty"""
+        entries = self.entries
+        while entries:
+            value, _, key = entries[0]
+            if self.value(key) == value:
+                return value, key
+            heapq.heappop(entries)
+        return None
+
+    def pop(self):
+        """remove and return the (value, key) with the lowest value"""
+        ret = self.peek()
+        heapq.heappop(self.entries)
+        return ret
+
+
+class HotKeys(Metrics):
+    """Samples the most accessed keys and the keys with the biggest payloads"""
+    def __init__(self, capacity=1000, sample_rate=1.0):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hot = SpaceSaving(self.capacity)
+            self.big = {}
+            self.big_heap = MinHeap(self.big.get)
+
+    def add(self, key, size):
+        """count one access of key that moved size bytes"""
+        if isinstance(key, bytes):
+            key = key.decode("utf-8", "replace")
+
+        with self.lock:
+            self.hot.add(key, 1.0 / self.sample_rate)
+
+            big = self.big
+            if size > big.get(key, -1):
+                if key not in big and len(big) >= self.capacity:
+                    # only a payload bigger than the smallest one tracked
+                    # replaces it
+                    if size <= self.big_heap.peek()[0]:
+                        return
+                    big.pop(self.big_heap.pop()[1])
+
+                big[key] = size
+                self.big_heap.push(size, key, self.capacity)
+
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        if key is None:
+            return
+
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+
+        self.add(key, max(bytes_out, bytes_in))
+
+    def top(self, n=10):
+        """see hotkeys()"""
+        with self.lock:
+            hot = [(k, int(round(c))) for k, c, e in self.hot.top(n)]
+            big = sorted(self.big.items(), key=lambda kv: kv[1], reverse=True)
+        return {"hot": hot, "big": big[:n]}
+
+
+class HistogramMetrics(Metrics):
+    """Aggregates commands in process by (prefix, command)
+
+    Latencies are kept in microsecond histograms so percentiles stay accurate
+    no matter how many commands are observed
+
+    :example:
+        m = HistogramMetrics()
+        set_metrics(m)
+        ...
+        for (prefix, command), stats in m.snapshot().items():
+            print(prefix, command, stats["count"], stats["p99_ms"])
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        k = (prefix, command)
+        with self.lock:
+            stats = self.stats.get(k)
+            if stats is None:
+                stats = {
+                    "latency": Histogram(),
+                    "bytes_out": 0,
+                    "bytes_in": 0,
+                    "pipelined": 0,
+                }
+                self.stats[k] = stats
+
+            stats["latency"].record(latency * 1000000.0)
+            stats["bytes_out"] += bytes_out
+            stats["bytes_in"] += bytes_in
+            if depth > 1:
+                stats["pipelined"] += 1
+
+    def snapshot(self):
+        """return the aggregated metrics
+
+        :returns: dict, (prefix, command) keys with dict values that have
+            count, seconds (the total time), bytes_out, bytes_in, pipelined
+            (how many ran in a pipeline), and mean_ms, p50_ms, p99_ms, max_ms
+        """
+        ret = {}
+        with self.lock:
+            for k, stats in self.stats.items():
+                h = stats["latency"]
+                ret[k] = {
+                    "count": h.count,
+                    "seconds": h.total / 1000000.0,
+                    "bytes_out": stats["bytes_out"],
+                    "bytes_in": stats["bytes_in"],
+                    "pipelined": stats["pipelined"],
+                    "mean_ms": h.mean() / 1000.0,
+                    "p50_ms": h.percentile(50) / 1000.0,
+                    "p99_ms": h.percentile(99) / 1000.0,
+                    "max_ms": (h.max or 0) / 1000.0,
+                }
+        return ret
+
+    def top(self, n=10, field="seconds"):
+        """return the n (prefix, command) pairs with the highest field, by
+        default the ones that spent the most time in redis
+
+        :returns: list[tuple], ((prefix, command), stats) tuples
+        """
+        snapshot = self.snapshot()
+        return sorted(
+            snapshot.items(),
+            key=lambda item: item[1][field],
+            reverse=True
+        )[:n]
+
+
+class PrometheusMetrics(Metrics):
+    """Export the metrics with prometheus_client, which has to be installed
+
+    https://github.com/prometheus/client_python
+    """
+    def __init__(self, namespace="caches", registry=None):
+        import prometheus_client
+
+        kwargs = {"namespace": namespace}
+        if registry is not None:
+            kwargs["registry"] = registry
+
+        labels = ["prefix", "command"]
+        self.latency = prometheus_client.Histogram(
+            "command_seconds",
+            "Redis command latency",
+            labels,
+            **kwargs
+        )
+        self.bytes_out = prometheus_client.Counter(
+            "command_bytes_out",
+            "Bytes sent to redis",
+            labels,
+            **kwargs
+        )
+        self.bytes_in = prometheus_client.Counter(
+            "command_bytes_in",
+            "Bytes received from redis",
+            labels,
+            **kwargs
+        )
+
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        self.latency.labels(prefix, command).observe(latency)
+        self.bytes_out.labels(prefix, command).inc(bytes_out)
+        self.bytes_in.labels(prefix, command).inc(bytes_in)
+
+
+class StatsdMetrics(Metrics):
+    """Send the metrics to a StatsD server over UDP
+
+    Every command sends one packet with a timer and two counters named
+    <namespace>.<prefix>.<command>.<metric>
+
+    https://github.com/statsd/statsd/blob/master/docs/metric_types.md
+    """
+    def __init__(self, host="localhost", port=8125, namespace="caches"):
+        self.address = (host, int(port))
+        self.namespace = namespace
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def name(self, prefix, command):
+        parts = [self.namespace, prefix or "none", command]
+        return ".".join(
+            String(p).replace(" ", "_").replace(".", "_").replace(":", "_")
+            for p in parts
+        )
+
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        name = self.name(prefix, command)
+        packet = "\n".join([
+            "{}.time:{:.3f}|ms".format(name, latency * 1000.0),
+            "{}.bytes_out:{}|c".format(name, bytes_out),
+            "{}.bytes_in:{}|c".format(name, bytes_in),
+        ])
+        try:
+            self.socket.sendto(packet.encode("utf-8"), self.address)
+
+        except OSError:
+            # metrics should never break caching
+            pass
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Sample a redis server with MONITOR and print its hottest and biggest keys
+
+    python -m caches.monitor --dsn redis://localhost/0 --seconds 10
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import sys
+import time
+import argparse
+
+import redis
+
+from .compat import *
+from .dsn import DSN
+from .metrics import HotKeys, command_key, payload_size, no_key
+
+
+def monitor(interface, sampler, seconds=10):
+    """Feed every command the redis server runs for seconds into sampler
+
+    This uses MONITOR so it sees the commands of every client, not just this
+    process, but MONITOR slows the server down so only run it for a short time
+
+    redis-py's Monitor joins a command's arguments with spaces, so a key that
+    contains a space is only sampled up to the space
+
+    https://redis.io/commands/monitor/
+
+    :param interface: Redis, an idle server is waited on for up to its
+        socket_timeout before checking if seconds have passed
+    :param sampler: HotKeys
+    :param seconds: float
+    """
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        try:
+            with interface.monitor() as m:
+                for command in m.listen():
+                    if command:
+                        sample(sampler, command["command"])
+
+                    if time.monotonic() >= stop:
+                        break
+
+        except redis.TimeoutError:
+            # the server was idle for socket_timeout seconds, redis-py closes
+            # a connection whose read timed out so MONITOR has to start over
+            pass
+
+
+def sample(sampler, command):
+    """add the key of a command MONITOR printed to sampler
+
+    :param sampler: HotKeys
+    :param command: str, the command and its arguments separated by spaces
+    """
+    args = command.split(" ")
+    if not args[0]:
+        return
+
+    args[0] = args[0].upper()
+    if " ".join(args[:2]).upper() in no_key:
+        return
+
+    try:
+        key = command_key(args)
+
+    except (ValueError, IndexError):
+        return
+
+    if key is not None:
+        sampler.add(key, payload_size(args[1:]))
+
+
+def main(argv=None):
+    """Dump the hottest and biggest keys of a redis server"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "--dsn",
+        default=os.environ.get("CACHES_DSN", "redis://localhost/0"),
+        help="the server to sample, defaults to CACHES_DSN",
+    )
+    parser.add_argument("--seconds", type=float, default=10, help="how long to sample")
+    parser.add_argument("--top", type=int, default=20, help="how many keys to print")
+    parser.add_argument("--capacity", type=int, default=10000, help="how many keys to track")
+    args = parser.parse_args(argv)
+
+    interface = DSN(args.dsn).interface()
+    sampler = HotKeys(capacity=args.capacity)
+    try:
+        monitor(interface, sampler, args.seconds)
+
+    except KeyboardInterrupt:
+        pass
+
+    top = sampler.top(args.top)
+    print("Hot keys (accesses)")
+    for key, count in top["hot"]:
+        print("{:>12}  {}".format(count, key))
+
+    print("")
+    print("Big keys (bytes sent)")
+    for key, size in top["big"]:
+        print("{:>12}  {}".format(size, key))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
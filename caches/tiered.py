@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""A Redis interface that keeps copies of the values it reads closer to the
+process
+
+    caches.configure("redis+tiered://localhost/0?disk_path=/var/cache/caches")
+
+GET checks an in-process LRU, then a directory of files on the local disk,
+then Redis, and a value found in a lower tier is copied into the tiers above
+it. Every tier keeps the value's Redis TTL (capped by local_ttl) so values
+expire locally when they expire in Redis. Writes made through the interface
+remove the keys they touch from the local tiers, writes made by other
+processes are only seen once the local copies expire, so local_ttl should be
+as long as a stale value can be tolerated.
+
+The disk tier is read with mmap, so every process on the machine shares the
+page cache and values of at least mmap_size bytes are returned as a
+memoryview of the file instead of being copied
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import collections
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from redis.client import NEVER_DECODE
+
+from .compat import *
+from .interface import Redis, RedisPipeline, CommandKeysMixin
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTier(object):
+    """An LRU of values in this process, bounded by the size of the values"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.values = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now):
+        """returns a (value, expires) tuple or None"""
+        with self.lock:
+            item = self.values.get(key)
+            if item is not None:
+                if item[1] and item[1] <= now:
+                    self.pop(key)
+                    item = None
+
+                else:
+                    self.values.move_to_end(key)
+            return item
+
+    def set(self, key, value, expires):
+        """
+        :param expires: float, when the value expires, 0.0 means never
+        """
+        if len(value) > self.max_bytes:
+            return
+
+        with self.lock:
+            self.pop(key)
+            self.values[key] = (value, expires)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                k, (v, e) = self.values.popitem(last=False)
+                self.size -= len(v)
+
+    def delete(self, key):
+        with self.lock:
+            self.pop(key)
+
+    def pop(self, key):
+        item = self.values.pop(key, None)
+        if item is not None:
+            self.size -= len(item[0])
+
+    def clear(self):
+        with self.lock:
+            self.values = collections.OrderedDict()
+            self.size = 0
+
+
+class DiskTier(object):
+    """Values stored as files in a directory, the files are replaced
+    atomically so they can be shared by every process on the machine
+
+    Each file is a header (when the value expires and the size of the key),
+    the key, and then the value
+    """
+    header = struct.Struct(">dI")
+
+    def __init__(self, path, min_size=0, mmap_size=1024 * 1024):
+        """
+        :param path: str, the directory, it is created if it doesn't exist
+        :param min_size: int, smaller values aren't written to disk
+        :param mmap_size: int, values at least this big are returned as a
+            memoryview of the mapped file
+        """
+        self.path = path
+        self.min_size = min_size
+        self.mmap_size = mmap_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def filepath(self, key):
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest())
+
+    def get(self, key, now):
+        """returns a (value, expires) tuple or None"""
+        try:
+            with open(self.filepath(key), "rb") as f:
+                if os.fstat(f.fileno()).st_size < self.header.size + len(key):
+                    return None
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except (IOError, OSError, ValueError):
+            return None
+
+        expires, key_size = self.header.unpack_from(mm)
+        start = self.header.size + key_size
+        if mm[self.header.size:start] != key:
+            # two keys with the same hash, the other one is on disk
+            mm.close()
+            return None
+
+        if expires and expires <= now:
+            mm.close()
+            self.delete(key)
+            return None
+
+        if len(mm) - start >= self.mmap_size:
+            # the memoryview keeps the map open until it is garbage collected
+            value = memoryview(mm)[start:]
+
+        else:
+            value = mm[start:]
+            mm.close()
+
+        return value, expires
+
+    def set(self, key, value, expires):
+        """
+        :param expires: float, when the value expires, 0.0 means never
+        """
+        if len(value) < self.min_size:
+            return
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.header.pack(expires, len(key)))
+                f.write(key)
+                f.write(value)
+            os.replace(tmp, self.filepath(key))
+
+        except (IOError, OSError) as e:
+            # a full disk only makes the tier less useful, reads still work
+            logger.warning("Could not write {} to the disk tier: {}".format(
+                String(key),
+                e,
+            ))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self.filepath(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def prune(self, now=None):
+        """remove the expired files, returns how many were removed"""
+        now = now or time.time()
+        removed = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                with open(path, "rb") as f:
+                    header = f.read(self.header.size)
+                expires = self.header.unpack(header)[0]
+                if expires and expires <= now:
+                    os.remove(path)
+                    removed += 1
+
+            except (IOError, OSError, struct.error):
+                pass
+
+        return removed
+
+
+class TieredPipeline(RedisPipeline):
+    tiers = None
+    """the TieredRedis whose local tiers the pipeline's writes invalidate"""
+
+    def execute(self, raise_on_error=True):
+        commands = list(self.command_stack)
+        try:
+            return super(TieredPipeline, self).execute(raise_on_error)
+
+        finally:
+            if self.tiers:
+                for args, options in commands:
+                    if args[0] not in self.tiers.read_commands:
+                        self.tiers.invalidate(args)
+
+
+class TieredRedis(CommandKeysMixin, Redis):
+    """Redis interface that also keeps the values read with GET in this
+    process and on the local disk
+
+    https://en.wikipedia.org/wiki/Cache_hierarchy
+
+    :example:
+        redis+tiered://localhost/0?local_size=67108864&local_ttl=60
+        redis+tiered://localhost/0?disk_path=/var/cache/caches&local_ttl=0
+    """
+    interface_params = set([
+        "local_size",
+        "local_ttl",
+        "disk_path",
+        "disk_min_size",
+        "mmap_size",
+    ])
+    """the DSN query params that configure the interface instead of the
+    connection"""
+
+    pipeline_class = TieredPipeline
+
+    flush_commands = set(["FLUSHDB", "FLUSHALL"])
+
+    generation_slots = 1024
+    """how many invalidation counters the keys are hashed into, keys that
+    share a counter only cost each other a skipped fill"""
+
+    def __init__(
+        self,
+        local_size=64 * 1024 * 1024,
+        local_ttl=60,
+        disk_path=None,
+        disk_min_size=16 * 1024,
+        mmap_size=1024 * 1024,
+        **connection_config
+    ):
+        """
+        :param local_size: int, the most bytes the in-process tier holds, 0
+            turns the tier off
+        :param local_ttl: float, the most seconds a value is kept in the local
+            tiers, 0 means until the value expires in Redis
+        :param disk_path: str, the directory of the disk tier, None turns the
+            tier off
+        :param disk_min_size: int, smaller values aren't written to disk
+        :param mmap_size: int, values from disk at least this big are returned
+            as a memoryview of the file
+        :param **connection_config: passed through to Redis
+        """
+        super(TieredRedis, self).__init__(**connection_config)
+
+        self.local_ttl = float(local_ttl)
+        local_size = int(local_size)
+        self.local = LocalTier(local_size) if local_size else None
+        self.disk = None
+        if disk_path:
+            self.disk = DiskTier(disk_path, int(disk_min_size), int(mmap_size))
+
+        # bumped every time a key is invalidated, a read only fills the tiers
+        # if its key's counter didn't change while it was reading, otherwise
+        # the value it read might be older than the write that invalidated it
+        self.generations = [0] * self.generation_slots
+        self.generations_lock = threading.Lock()
+
+    def expires(self, now, pttl):
+        """return when a value read from Redis expires in the local tiers
+
+        :param pttl: int, the key's PTTL
+        :returns: float|None, 0.0 if it never expires, None if it shouldn't
+            be kept at all
+        """
+        if pttl == -2:
+            return None
+
+        expires = now + (pttl / 1000.0) if pttl >= 0 else 0.0
+        if self.local_ttl:
+            cap = now + self.local_ttl
+            expires = min(expires, cap) if expires else cap
+        return expires
+
+    def generation_slot(self, key):
+        return hash(key) % self.generation_slots
+
+    def fill(self, key, generation, item, disk=True):
+        """copy item into the local tiers unless key was invalidated since
+        generation was read
+
+        :param generation: int, key's generation from before the value was read
+        :param item: tuple, (value, expires)
+        :param disk: bool, False if the value came from the disk tier
+        """
+        with self.generations_lock:
+            if self.generations[self.generation_slot(key)] != generation:
+                return
+
+            if disk and self.disk:
+                self.disk.set(key, *item)
+            if self.local:
+                self.local.set(key, *item)
+
+    def get(self, name):
+        key = ByteString(name)
+        now = time.time()
+        generation = self.generations[self.generation_slot(key)]
+
+        item = self.local.get(key, now) if self.local else None
+        if item is None and self.disk:
+            item = self.disk.get(key, now)
+            if item is not None and self.local:
+                self.fill(key, generation, item, disk=False)
+
+        if item is None:
+            with super(TieredRedis, self).pipeline(transaction=False) as pipe:
+                pipe.execute_command("GET", name, **{NEVER_DECODE: True})
+                pipe.pttl(name)
+                value, pttl = pipe.execute()
+
+            if value is None:
+                return None
+
+            expires = self.expires(now, pttl)
+            item = (value, expires)
+            if expires is not None:
+                self.fill(key, generation, item)
+
+        return self.get_encoder().decode(item[0])
+
+    def execute_command(self, *args, **kwargs):
+        try:
+            return super(TieredRedis, self).execute_command(*args, **kwargs)
+
+        finally:
+            if args[0] not in self.read_commands:
+                self.invalidate(args)
+
+    def invalidate(self, args):
+        """remove the keys a write command touches from the local tiers"""
+        if args[0] in self.flush_commands:
+            self.clear_tiers()
+
+        else:
+            with self.generations_lock:
+                for k in self.command_keys(args):
+                    key = ByteString(k)
+                    self.generations[self.generation_slot(key)] += 1
+                    if self.local:
+                        self.local.delete(key)
+                    if self.disk:
+                        self.disk.delete(key)
+
+    def clear_tiers(self):
+        with self.generations_lock:
+            self.generations = [g + 1 for g in self.generations]
+            if self.local:
+                self.local.clear()
+            if self.disk:
+                self.disk.clear()
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipeline = super(TieredRedis, self).pipeline(transaction, shard_hint)
+        pipeline.tiers = self
+        return pipeline
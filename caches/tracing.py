@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+from .compat import *
+from . import metrics
+
+
+tracer = None
+"""the tracer set with set_tracer(), None when tracing is off"""
+
+local = threading.local()
+"""holds the stack of operation spans of the current thread"""
+
+
+def set_tracer(t):
+    """Trace the cache operations with t
+
+    Every logical cache operation (eg, DictCache.items) gets a span and every
+    redis round trip the operation makes gets a child span
+
+    :example:
+        from opentelemetry import trace
+        caches.set_tracer(trace.get_tracer("caches"))
+
+    :param t: opentelemetry.trace.Tracer|MemoryTracer, anything with a
+        start_span(name, context=None, attributes=None, start_time=None) method
+        that returns spans with set_attribute(key, value) and
+        end(end_time=None) methods, None turns tracing off
+    """
+    global tracer
+    tracer = t
+    metrics.set_hook("tracing", None if t is None else TracingMetrics())
+
+
+def get_tracer():
+    return tracer
+
+
+def current_span():
+    """return the span of the operation running in this thread, or None"""
+    stack = getattr(local, "stack", None)
+    return stack[-1][0] if stack else None
+
+
+def span_context(span):
+    """return the context that makes span the parent of a new span"""
+    if span is None or isinstance(span, MemorySpan):
+        return span
+
+    from opentelemetry import trace
+    return trace.set_span_in_context(span)
+
+
+def start_span(name, attributes=None, start_time=None):
+    """start a span that's a child of the current operation span, if there
+    is one, otherwise the tracer decides the parent"""
+    kwargs = {"attributes": attributes or {}}
+    parent = current_span()
+    if parent is not None:
+        kwargs["context"] = span_context(parent)
+    if start_time is not None:
+        kwargs["start_time"] = start_time
+    return tracer.start_span(name, **kwargs)
+
+
+class Operation(object):
+    """A running operation span and the counts of its round trips"""
+    def __init__(self, name, attributes):
+        self.span = start_span(name, attributes)
+        self.counts = {"commands": 0, "bytes_out": 0, "bytes_in": 0}
+
+    def push(self):
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = []
+            local.stack = stack
+        stack.append((self.span, self.counts))
+
+    def pop(self):
+        local.stack.pop()
+
+    def end(self, error=None):
+        # the operation that called this one also made these round trips
+        stack = getattr(local, "stack", None)
+        for k, v in self.counts.items():
+            self.span.set_attribute("caches.{}".format(k), v)
+            if stack:
+                stack[-1][1][k] += v
+        if error is not None:
+            self.span.set_attribute("error", True)
+            self.span.set_attribute("error.type", error.__class__.__name__)
+        self.span.end()
+
+
+@contextmanager
+def operation(name, attributes=None):
+    """Run the body of the with statement in an operation span, only use this
+    when there is a tracer
+
+    :example:
+        with operation("FooCache.foo", {"caches.key": key}) as span:
+            span.set_attribute("caches.hit", True)
+
+    :param name: str, the span name
+    :param attributes: dict
+    :returns: span, the tracer's span
+    """
+    op = Operation(name, attributes)
+    error = None
+    op.push()
+    try:
+        yield op.span
+
+    except Exception as e:
+        error = e
+        raise
+
+    finally:
+        op.pop()
+        op.end(error)
+
+
+def operation_attributes(instance):
+    attributes = {"caches.class": instance.__class__.__name__}
+    key = getattr(instance, "key", None)
+    if key is not None:
+        attributes["caches.key"] = String(key)
+    return attributes
+
+
+def traced(name=None):
+    """Decorator that gives every call of a cache method its own span named
+    <class>.<name>, generator methods keep their span open until they are
+    exhausted or closed
+
+    This only costs a global check when there isn't a tracer
+
+    :example:
+        class FooCache(Cache):
+            @traced()
+            def foo(self):
+                ...
+
+    :param name: str, defaults to the method name
+    """
+    def decorator(func):
+        op_name = name or func.__name__
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                if tracer is None:
+                    for v in func(self, *args, **kwargs):
+                        yield v
+                    return
+
+                op = Operation(
+                    "{}.{}".format(self.__class__.__name__, op_name),
+                    operation_attributes(self)
+                )
+                error = None
+                it = func(self, *args, **kwargs)
+                try:
+                    while True:
+                        # the operation is only current while the generator
+                        # runs, not while the caller has control
+                        op.push()
+                        try:
+                            v = next(it)
+
+                        except StopIteration:
+                            break
+
+                        finally:
+                            op.pop()
+
+                        yield v
+
+                except Exception as e:
+                    error = e
+                    raise
+
+                finally:
+                    it.close()
+                    op.end(error)
+
+        else:
+            @functools.wraps(func)
+            def wrapper(self, *args, **kwargs):
+                if tracer is None:
+                    return func(self, *args, **kwargs)
+
+                with operation(
+                    "{}.{}".format(self.__class__.__name__, op_name),
+                    operation_attributes(self)
+                ):
+                    return func(self, *args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+class TracingMetrics(metrics.Metrics):
+    """Adds a child span for every redis round trip to the current operation"""
+    def add_span(self, name, latency, attributes):
+        end = time.time_ns()
+        span = start_span(
+            name,
+            attributes=attributes,
+            start_time=end - int(latency * 1000000000),
+        )
+        span.end(end_time=end)
+
+        stack = getattr(local, "stack", None)
+        if stack:
+            counts = stack[-1][1]
+            counts["commands"] += attributes.get("caches.commands", 1)
+            counts["bytes_out"] += attributes["caches.bytes_out"]
+            counts["bytes_in"] += attributes["caches.bytes_in"]
+
+    def observe(self, command, prefix, latency, bytes_out, bytes_in, depth, key=None):
+        attributes = {
+            "db.system": "redis",
+            "db.operation": command,
+            "caches.bytes_out": bytes_out,
+            "caches.bytes_in": bytes_in,
+        }
+        if key is not None:
+            attributes["caches.key"] = String(key)
+        self.add_span(command, latency, attributes)
+
+    def observe_pipeline(self, commands, res, latency):
+        bytes_out = 0
+        bytes_in = 0
+        operations = []
+        for i, (args, options) in enumerate(commands):
+            operations.append(String(args[0]))
+            bytes_out += metrics.payload_size(args[1:])
+            if isinstance(res, list) and i < len(res):
+                bytes_in += metrics.payload_size(res[i])
+
+        self.add_span("PIPELINE", latency, {
+            "db.system": "redis",
+            "db.operation": " ".join(operations),
+            "caches.commands": len(commands),
+            "caches.bytes_out": bytes_out,
+            "caches.bytes_in": bytes_in,
+        })
+
+
+class MemorySpan(object):
+    """A finished or running span of MemoryTracer"""
+    def __init__(self, name, parent=None, attributes=None, start_time=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = start_time or time.time_ns()
+        self.end_time = None
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_time=None):
+        self.end_time = end_time or time.time_ns()
+
+    @property
+    def duration(self):
+        """seconds the span took"""
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1000000000.0
+
+    def __repr__(self):
+        return "<{} {} children={}>".format(
+            self.__class__.__name__,
+            self.name,
+            len(self.children),
+        )
+
+
+class MemoryTracer(object):
+    """Keeps every span in memory, handy for tests
+
+    :example:
+        t = MemoryTracer()
+        caches.set_tracer(t)
+        DictCache("foo").items()
+        t.roots[0].name # DictCache.items
+        t.roots[0].children[0].name # HGETALL
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        """every span in the order they were started"""
+
+    @property
+    def roots(self):
+        """the spans that don't have a parent"""
+        return [s for s in self.spans if s.parent is None]
+
+    def start_span(self, name, context=None, attributes=None, start_time=None):
+        span = MemorySpan(name, context, attributes, start_time)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def clear(self):
+        with self.lock:
+            self.spans = []
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import unittest
+
 from caches.compat import *
 import caches
 import caches.interface
@@ -25,3 +33,106 @@ class TestCase(BaseTestCase):
         caches.interface.interfaces = {}
         caches.configure_environ()
 
+
+
+class RedisServer(object):
+    """Start a local redis-server process for tests that need more than the
+    server CACHES_DSN points to (eg, sharding or cluster tests), the
+    benchmarks use it too"""
+    def __init__(self, *args, **kwargs):
+        """
+        :param *args: passed to redis-server (eg, "--cluster-enabled", "yes")
+        :param **kwargs:
+            config -- str, the contents of a config file (eg, for a sentinel)
+            path -- str, the redis-server binary, defaults to the one on PATH
+            unix_socket -- bool, True to listen on a unix socket instead of
+                a port
+        """
+        self.path = kwargs.get("path", None) or shutil.which("redis-server")
+        self.args = args
+        self.config = kwargs.get("config", None)
+        self.unix_socket = kwargs.get("unix_socket", False)
+        self.process = None
+
+        s = socket.socket()
+        s.bind(("localhost", 0))
+        self.port = s.getsockname()[1]
+        s.close()
+
+    @property
+    def dsn(self):
+        if self.unix_socket:
+            return "redis://localhost/0?unix_socket_path={}".format(self.socket_path)
+        return "redis://localhost:{}/0".format(self.port)
+
+    def start(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "redis.sock")
+        cmd = [self.path]
+        if self.config is not None:
+            config_path = os.path.join(self.directory, "redis.conf")
+            with open(config_path, "w") as f:
+                f.write(self.config)
+            cmd.append(config_path)
+
+        if self.unix_socket:
+            cmd.extend(["--port", "0", "--unixsocket", self.socket_path])
+        else:
+            cmd.extend(["--port", str(self.port)])
+
+        self.process = subprocess.Popen(
+            cmd + [
+                "--save", "",
+                "--appendonly", "no",
+                "--dir", self.directory,
+            ] + list(self.args),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        for _ in range(100):
+            try:
+                if self.unix_socket:
+                    s = socket.socket(socket.AF_UNIX)
+                    s.connect(self.socket_path)
+                    s.close()
+
+                else:
+                    socket.create_connection(("localhost", self.port), 0.1).close()
+                break
+
+            except OSError:
+                time.sleep(0.05)
+
+        return self
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ServersTestCase(TestCase):
+    """Starts server_count local redis-server processes, these tests will be
+    skipped if redis-server isn't installed"""
+    server_count = 2
+
+    server_args = []
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServersTestCase, cls).setUpClass()
+        if not shutil.which("redis-server"):
+            raise unittest.SkipTest("redis-server is not installed")
+
+        cls.servers = []
+        for _ in range(cls.server_count):
+            cls.servers.append(RedisServer(*cls.server_args).start())
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in getattr(cls, "servers", []):
+            server.stop()
+        super(ServersTestCase, cls).tearDownClass()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+
+from . import TestCase
+
+import caches
+from caches.compat import *
+from caches.bench import run, parse_mix
+
+
+class BenchTest(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual({"cache": 2.0, "dict": 1.0}, parse_mix("cache=2, dict"))
+        with self.assertRaises(ValueError):
+            parse_mix("foo=1")
+
+    def test_run(self):
+        r = run(
+            os.environ["CACHES_DSN"],
+            workers=2,
+            threads=2,
+            seconds=0.5,
+            mix="cache=1,dict=1,set=1,sortedset=1,cached=1",
+        )
+        self.assertEqual(2, r["finished"])
+        self.assertLess(0, r["throughput"])
+        self.assertLess(0, r["cpu_per_op"])
+        self.assertLessEqual(2, r["clients"]["max"])
+
+        latency = r["latency"]
+        self.assertEqual(
+            set(["cache", "dict", "set", "sortedset", "cached", "all"]),
+            set(latency.keys())
+        )
+        self.assertEqual(0, latency["all"]["errors"])
+        self.assertLessEqual(latency["all"]["p50"], latency["all"]["p99"])
+        self.assertEqual(
+            sum(l["count"] for k, l in latency.items() if k != "all"),
+            latency["all"]["count"]
+        )
@@ -23,3 +23,21 @@ class CachesTest(TestCase):
         c = Cache("foo", prefix="foo")
         self.assertFalse(c.exists())
 
+
+    def test_unsafe_clear_batches(self):
+        for i in range(25):
+            Cache(i, 1, prefix="batch")
+
+        self.assertEqual(25, caches.unsafe_clear("batch*", dry_run=True))
+        self.assertTrue(Cache(1, prefix="batch").exists())
+
+        batches = []
+        count = caches.unsafe_clear(
+            "batch*",
+            count=10,
+            callback=lambda name, count: batches.append(count),
+        )
+        self.assertEqual(25, count)
+        self.assertEqual(25, sum(batches))
+        self.assertLess(1, len(batches))
+        self.assertFalse(Cache(1, prefix="batch").exists())
@@ -2,7 +2,9 @@
 from __future__ import unicode_literals, division, print_function, absolute_import
 import sys
 import time
+import pickle
 import random
+import threading
 
 from datatypes import Version
 
@@ -13,8 +15,16 @@ from caches.core import (
     DictCache,
     SetCache,
     SortedSetCache,
+    ListCache,
     SentinelCache,
+    RateLimitCache,
+    LockCache,
+    HyperLogLogCache,
+    BloomCache,
+    BitmapCache,
+    StreamCache,
 )
+from caches.exception import LockError
 
 from . import TestCase
 
@@ -204,6 +214,165 @@ class CacheTest(TestCase):
         r = calculate("five")
         self.assertEqual("five", r)
 
+    def test_invalidate_namespace(self):
+        class GenCache(Cache):
+            generational = True
+            ttl = 60
+
+        c = GenCache("foo", data=1)
+        key = c.key
+        self.assertEqual(1, GenCache("foo").data)
+
+        gen = GenCache.invalidate_namespace()
+        self.assertLess(0, gen)
+
+        c = GenCache("foo")
+        self.assertNotEqual(key, c.key)
+        self.assertTrue("g{}".format(gen) in c.key)
+        self.assertIsNone(c.data)
+
+        c = GenCache("foo", prefix="other", data=2)
+        GenCache.invalidate_namespace("other")
+        self.assertIsNone(GenCache("foo", prefix="other").data)
+
+    def test_invalidate_namespace_connection(self):
+        other = caches.configure("memory://generations/0#generations")
+
+        class ConnGenCache(Cache):
+            generational = True
+
+        c = ConnGenCache("foo", connection_name="generations")
+        self.assertIs(other, c.interface)
+
+        gen = c.invalidate_namespace()
+        gen_key = ConnGenCache.get_namespace_key()
+        self.assertEqual(gen, int(other.get(gen_key)))
+        self.assertIsNone(ConnGenCache.interface.get(gen_key))
+        self.assertTrue(
+            "g{}".format(gen) in ConnGenCache("foo", connection_name="generations").key
+        )
+        caches.interface.interfaces.pop("generations")
+
+    def test_open(self):
+        c = Cache("open", ttl=100, stream_size=10)
+        with c.open("wb") as f:
+            for i in range(10):
+                f.write(b"0123456789")
+        self.assertLess(0, c.interface.ttl(c.key))
+        self.assertEqual(1, len(list(c.interface.scan_iter("*Cache.open*"))))
+
+        with c.open() as f:
+            self.assertEqual(b"0123", f.read(4))
+            f.seek(-3, 2)
+            self.assertEqual(b"789", f.read())
+        self.assertEqual(100, len(c.interface.get(c.key)))
+
+        with self.assertRaises(ValueError):
+            with c.open("wb") as f:
+                f.write(b"x" * 50)
+                raise ValueError()
+        self.assertEqual(100, len(c.interface.get(c.key)))
+        self.assertEqual(1, len(list(c.interface.scan_iter("*Cache.open*"))))
+
+        c = Cache("open.pickle")
+        with c.open("wb") as f:
+            pickle.dump({"foo": 1}, f)
+        self.assertEqual({"foo": 1}, Cache("open.pickle").data)
+
+        c = Cache("open.append", serialize=False)
+        with c.open("ab") as f:
+            f.write(b"foo")
+        with c.open("ab") as f:
+            f.write(b"bar")
+        self.assertEqual(b"foobar", c.data)
+
+        with self.assertRaises(KeyError):
+            Cache("open.missing").open()
+
+    def test_chunks(self):
+        c = Cache("chunks", chunk_size=50, ttl=100)
+        c.data = "x" * 100
+        chunks_key = c.get_chunks_key()
+        self.assertTrue(c.interface.get(c.key).startswith(b"\x00caches."))
+        self.assertLess(1, c.interface.hlen(chunks_key))
+        self.assertLess(0, c.interface.ttl(chunks_key))
+        self.assertEqual("x" * 100, Cache("chunks", chunk_size=50).data)
+
+        # the new value's chunks replace the old value's chunks
+        fields = set(c.interface.hkeys(chunks_key))
+        c.data = "y" * 100
+        self.assertFalse(fields & set(c.interface.hkeys(chunks_key)))
+        self.assertEqual("y" * 100, Cache("chunks", chunk_size=50).data)
+
+        c.data = "z"
+        self.assertEqual(0, c.interface.exists(chunks_key))
+        self.assertEqual("z", Cache("chunks", chunk_size=50).data)
+
+        c.data = "x" * 100
+        c.clear()
+        self.assertEqual(0, c.interface.exists(c.key, chunks_key))
+
+    def test_open_chunks(self):
+        value = b"".join(ByteString(i % 10) for i in range(120))
+        c = Cache("open.chunks", chunk_size=50, serialize=False, stream_size=10)
+        c.data = value
+        with c.open() as f:
+            self.assertEqual(value[:4], f.read(4))
+            f.seek(45)
+            self.assertEqual(value[45:57], f.read(12))
+            # only the chunk being read is in memory
+            self.assertEqual(50, len(f.raw.chunk[1]))
+            f.seek(-3, 2)
+            self.assertEqual(value[-3:], f.read())
+            self.assertEqual(120, f.tell())
+
+        # the offsets come from the chunks, not the reader's chunk_size
+        with Cache("open.chunks", chunk_size=30, serialize=False).open() as f:
+            self.assertEqual(value, f.read())
+
+        with c.open() as f:
+            f.read(10)
+            c.interface.delete(c.get_chunks_key())
+            with self.assertRaises(IOError):
+                f.read(50)
+
+        c.data = b"x" * 100
+
+        # appending rewrites the chunked value instead of appending to the
+        # manifest
+        with c.open("ab") as f:
+            f.write(b"y" * 10)
+        self.assertEqual(b"x" * 100 + b"y" * 10, Cache("open.chunks", chunk_size=50, serialize=False).data)
+        self.assertEqual(0, c.interface.exists(c.get_chunks_key()))
+        with c.open() as f:
+            self.assertEqual(b"x" * 100 + b"y" * 10, f.read())
+
+        c.data = b"z" * 100
+        with self.assertRaises(ValueError):
+            with c.open("ab") as f:
+                f.write(b"y")
+                raise ValueError()
+        self.assertEqual(b"z" * 100, Cache("open.chunks", chunk_size=50, serialize=False).data)
+
+        with c.open("wb") as f:
+            f.write(b"w" * 100)
+        self.assertEqual(b"w" * 100, Cache("open.chunks", chunk_size=50, serialize=False).data)
+        self.assertEqual(1, len(list(c.interface.scan_iter("*Cache.open.chunks*"))))
+
+        c = Cache("open.chunks.append", chunk_size=50, serialize=False)
+        with c.open("ab") as f:
+            f.write(b"foo")
+        with c.open("ab") as f:
+            f.write(b"bar")
+        self.assertEqual(b"foobar", c.data)
+
+        # the chunks are gone so the value is too
+        c = Cache("open.chunks.missing", chunk_size=50, serialize=False)
+        c.data = b"x" * 100
+        c.interface.delete(c.get_chunks_key())
+        with self.assertRaises(KeyError):
+            c.open()
+
     def test___del__(self):
         c = Cache('KeyCache.__del__')
         del(c.data)
@@ -281,6 +450,13 @@ class DictCacheTest(TestCase):
         self.assertEqual(2, d.pop("foo", 1))
         self.assertFalse("foo" in d)
 
+    def test_setdefault(self):
+        d = DictCache("setdefault", ttl=10)
+        self.assertEqual(1, d.setdefault("foo", 1))
+        self.assertEqual(1, d.setdefault("foo", 2))
+        self.assertEqual(1, d["foo"])
+        self.assertLess(0, d.interface.ttl(d.key))
+
     def test_popitem(self):
         d = DictCache("popitem")
 
@@ -294,6 +470,24 @@ class DictCacheTest(TestCase):
         self.assertEqual(("foo", 2), d.popitem())
         self.assertFalse("foo" in d)
 
+    def test_increment(self):
+        d = DictCache("increment", serialize=False, ttl=10)
+        self.assertEqual(1, d.increment("foo"))
+        self.assertEqual(6, d.increment("foo", 5))
+        self.assertEqual(6.5, d.increment("foo", 0.5))
+        self.assertLess(0, d.interface.ttl(d.key))
+
+        d = DictCache("increment.many", serialize=False)
+        self.assertEqual(
+            {"foo": 1, "bar": 2},
+            d.increment_many({"foo": 1, "bar": 2})
+        )
+        self.assertEqual({"foo": 0}, d.increment_many({"foo": -1}))
+
+        d = DictCache("increment.serialized")
+        with self.assertRaises(ValueError):
+            d.increment("foo")
+
     def test___iter__(self):
         d = DictCache("__iter__", data={"foo": 1, "bar": 2, "che": 3})
 
@@ -352,6 +546,46 @@ class DictCacheTest(TestCase):
         self.assertEqual(d, dc.get('che'))
         self.assertEqual(d, dc['che'])
 
+    def test_chunks(self):
+        d = DictCache("chunks", chunk_size=50, ttl=100)
+        chunks_key = d.get_chunks_key()
+        d["foo"] = "x" * 100
+        d["bar"] = "y" * 100
+        d["che"] = 1
+        self.assertLess(0, d.interface.ttl(chunks_key))
+        self.assertEqual("x" * 100, d["foo"])
+        self.assertEqual(
+            {"foo": "x" * 100, "bar": "y" * 100, "che": 1},
+            dict(d.items())
+        )
+
+        d["foo"] = 1
+        del d["bar"]
+        self.assertEqual(0, d.interface.exists(chunks_key))
+
+        self.assertEqual("z" * 100, d.setdefault("bar", "z" * 100))
+        self.assertEqual("z" * 100, d.setdefault("bar", "w" * 100))
+        self.assertEqual("z" * 100, d.pop("bar"))
+        self.assertEqual(0, d.interface.exists(chunks_key))
+
+        d["bar"] = "y" * 100
+        d.interface.delete(chunks_key)
+        with self.assertRaises(KeyError):
+            d["bar"]
+
+        # popitem skips the items whose chunks are gone
+        self.assertEqual(
+            set([("foo", 1), ("che", 1)]),
+            set([d.popitem(), d.popitem()])
+        )
+        with self.assertRaises(KeyError):
+            d.popitem()
+        self.assertEqual(0, d.interface.exists(d.key))
+
+        d["bar"] = "y" * 100
+        d.clear()
+        self.assertEqual(0, d.interface.exists(d.key, chunks_key))
+
 
 class SetCacheTest(TestCase):
     def test___init__(self):
@@ -538,6 +772,34 @@ class SortedSetCacheTest(TestCase):
         self.assertFalse(elem in s)
         self.assertLess(score_asc, score_desc)
 
+    def test_pop_timeout(self):
+        s = SortedSetCache("pop.timeout")
+
+        start = time.time()
+        with self.assertRaises(KeyError):
+            s.pop(timeout=0.1)
+        self.assertLess(0.09, time.time() - start)
+
+        # longer than the default socket timeout of 1.0
+        t = threading.Timer(1.2, lambda: s.add((5, "foo")))
+        t.start()
+        self.assertEqual((5, "foo"), s.pop(timeout=3))
+        t.join()
+
+        s.update([(1, "bar"), (2, "che")])
+        self.assertEqual((2, "che"), s.rpop(timeout=1))
+
+    def test_increment(self):
+        s = SortedSetCache("increment", ttl=10)
+        self.assertEqual(5, s.increment("foo", 5))
+        self.assertEqual(3, s.increment("foo", -2))
+        self.assertEqual(1, s.increment("bar"))
+        self.assertEqual((1, "bar"), s.pop())
+        self.assertLess(0, s.interface.ttl(s.key))
+
+        self.assertEqual([4, 2], s.increment_many([(1, "foo"), (2, "che")]))
+        self.assertEqual([(2, "che"), (4, "foo")], s.copy())
+
     def test_chunk(self):
         s = SortedSetCache("chunk")
         count = 1000
@@ -621,6 +883,49 @@ class SortedSetCacheTest(TestCase):
         self.assertEqual(2, len(c))
 
 
+class ListCacheTest(TestCase):
+    def test_fifo(self):
+        c = ListCache("fifo", data=[1, 2])
+        c.append(3)
+        c.extend([4, 5])
+        self.assertEqual(5, len(c))
+        self.assertEqual(1, c[0])
+        self.assertEqual(5, c[-1])
+
+        self.assertEqual(1, c.pop())
+        self.assertEqual(2, c.pop(timeout=0.5))
+        self.assertEqual([3, 4, 5], c.copy())
+
+        c.clear()
+        with self.assertRaises(IndexError):
+            c.pop()
+
+        with self.assertRaises(IndexError):
+            c.pop(timeout=0.1)
+
+    def test_pop_timeout(self):
+        c = ListCache("pop.timeout")
+        t = threading.Timer(0.2, lambda: c.append("foo"))
+        t.start()
+        self.assertEqual("foo", c.pop(timeout=2))
+        t.join()
+
+    def test_maxlen(self):
+        c = ListCache("maxlen", maxlen=3)
+        c.extend(range(10))
+        self.assertEqual([7, 8, 9], c.copy())
+
+        c.trim(1)
+        self.assertEqual([9], c.copy())
+
+    def test_chunk(self):
+        c = ListCache("chunk", data=range(100))
+        self.assertEqual(list(range(100)), list(c.chunk(chunk=7)))
+        self.assertEqual(list(range(10, 25)), list(c.chunk(limit=15, offset=10, chunk=4)))
+        self.assertFalse(ListCache("chunk.empty"))
+        self.assertTrue(c)
+
+
 class SentinelCacheTest(TestCase):
     def test_check(self):
         s = SentinelCache("check")
@@ -630,6 +935,341 @@ class SentinelCacheTest(TestCase):
         if not s:
             raise ValueError("This should not have been raised")
 
+    def test_ttl(self):
+        s = SentinelCache("ttl", ttl=10)
+        self.assertFalse(s)
+        self.assertTrue(s)
+        self.assertLess(0, s.interface.ttl(s.key))
+
+    def test_acquire(self):
+        s = SentinelCache("acquire", ttl=10)
+        self.assertTrue(s.acquire(ttl=100))
+        self.assertFalse(s.acquire())
+        self.assertLess(10, s.interface.ttl(s.key))
+
+        s = SentinelCache("acquire.forever")
+        self.assertTrue(s.acquire())
+        self.assertEqual(-1, s.interface.ttl(s.key))
+
+    def test_acquire_many(self):
+        SentinelCache("many.2").acquire()
+        self.assertEqual(
+            [True, False, True],
+            SentinelCache.acquire_many(["many.1", "many.2", "many.3"], ttl=10),
+        )
+        self.assertEqual(
+            [False, False, False],
+            SentinelCache.acquire_many(["many.1", "many.2", "many.3"]),
+        )
+        self.assertLess(0, SentinelCache("many.1").interface.ttl(SentinelCache("many.1").key))
+        self.assertEqual([], SentinelCache.acquire_many([]))
+
+    def test_acquire_many_connection(self):
+        other = caches.configure("memory://sentinels/0#sentinels")
+        other.unsafe_flush()
+        self.assertEqual(
+            [True, True],
+            SentinelCache.acquire_many(
+                ["many.conn.1", "many.conn.2"],
+                connection_name="sentinels",
+            ),
+        )
+        s = SentinelCache("many.conn.1")
+        self.assertEqual(1, other.exists(s.key))
+        self.assertEqual(0, s.interface.exists(s.key))
+        caches.interface.interfaces.pop("sentinels")
+
+
+class RateLimitCacheTest(TestCase):
+    def test_fixed(self):
+        r = RateLimitCache("fixed", limit=3, window=10)
+        self.assertEqual((True, 2, 0.0), r.check())
+        self.assertEqual((True, 0, 0.0), r.check(2))
+
+        res = r.check()
+        self.assertFalse(res.allowed)
+        self.assertEqual(0, res.remaining)
+        self.assertLess(9.0, res.retry_after)
+        self.assertLessEqual(res.retry_after, 10.0)
+
+    def test_sliding(self):
+        r = RateLimitCache("sliding", algorithm="sliding", limit=3, window=0.5)
+        for remaining in [2, 1, 0]:
+            self.assertEqual((True, remaining, 0.0), r.check())
+
+        res = r.check()
+        self.assertFalse(res.allowed)
+        self.assertLess(0.0, res.retry_after)
+        self.assertLessEqual(res.retry_after, 0.5)
+
+        time.sleep(res.retry_after + 0.05)
+        self.assertTrue(r.check().allowed)
+        self.assertFalse(r.check(10).allowed)
+
+    def test_token(self):
+        r = RateLimitCache("token", algorithm="token", limit=2, window=1)
+        self.assertTrue(r.check().allowed)
+        self.assertTrue(r.check().allowed)
+
+        res = r.check()
+        self.assertFalse(res.allowed)
+        self.assertLess(0.0, res.retry_after)
+        self.assertLessEqual(res.retry_after, 0.5)
+
+        time.sleep(res.retry_after + 0.05)
+        self.assertTrue(r.check().allowed)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            RateLimitCache("unknown", algorithm="foo", limit=1).check()
+
+
+class LockCacheTest(TestCase):
+    def test_acquire_release(self):
+        l1 = LockCache("acquire_release")
+        l2 = LockCache("acquire_release")
+
+        self.assertTrue(l1.acquire(blocking=False))
+        self.assertTrue(l1.locked())
+        self.assertFalse(l2.acquire(blocking=False))
+        self.assertFalse(l2.acquire(timeout=0.1))
+
+        # only the holder can release
+        self.assertFalse(l2.release())
+        self.assertTrue(l1.release())
+        self.assertFalse(l1.locked())
+
+        self.assertTrue(l2.acquire(blocking=False))
+        self.assertTrue(l2.release())
+
+    def test_fence(self):
+        l = LockCache("fence")
+        self.assertTrue(l.acquire())
+        fence = l.fence
+        l.release()
+
+        self.assertTrue(l.acquire())
+        self.assertEqual(fence + 1, l.fence)
+        l.release()
+
+    def test_fence_ttl(self):
+        with LockCache("fence_ttl", ttl=1) as l:
+            pttl = l.interface.pttl(l.fence_key)
+            self.assertLess(1000, pttl)
+            self.assertGreaterEqual(1000 * l.fence_ttl, pttl)
+
+            self.assertTrue(l.extend(2))
+            self.assertLess(1000 * l.fence_ttl, l.interface.pttl(l.fence_key))
+
+        self.assertFalse(l.locked())
+        self.assertLess(0, l.interface.pttl(l.fence_key))
+
+    def test_expire_extend(self):
+        l1 = LockCache("expire_extend", ttl=0.2)
+        self.assertTrue(l1.acquire())
+        self.assertTrue(l1.extend(1))
+        time.sleep(0.3)
+        self.assertTrue(l1.locked())
+        l1.release()
+
+        self.assertTrue(l1.acquire())
+        time.sleep(0.3)
+        self.assertFalse(l1.locked())
+
+        # someone else got it after our lease expired
+        l2 = LockCache("expire_extend", ttl=1)
+        self.assertTrue(l2.acquire(blocking=False))
+        self.assertLess(l1.fence, l2.fence)
+        self.assertFalse(l1.extend())
+        self.assertFalse(l1.release())
+        self.assertTrue(l2.locked())
+
+    def test_renew(self):
+        l = LockCache("renew", ttl=0.3, renew=True)
+        self.assertTrue(l.acquire())
+        time.sleep(0.6)
+        self.assertTrue(l.locked())
+        self.assertTrue(l.release())
+        self.assertFalse(l.locked())
+
+    def test_context(self):
+        l1 = LockCache("context", timeout=0.1)
+        with l1 as l:
+            self.assertTrue(l.locked())
+            with self.assertRaises(LockError):
+                with LockCache("context", timeout=0.1):
+                    pass
+
+        self.assertFalse(l1.locked())
+
+    def test_blocking(self):
+        l1 = LockCache("blocking")
+        self.assertTrue(l1.acquire())
+
+        def release():
+            time.sleep(0.2)
+            l1.release()
+
+        t = threading.Thread(target=release)
+        t.start()
+
+        l2 = LockCache("blocking")
+        self.assertTrue(l2.acquire(timeout=2))
+        t.join()
+        l2.release()
+
+
+class HyperLogLogCacheTest(TestCase):
+    def test_add_count(self):
+        c = HyperLogLogCache("add_count", ["foo", "bar"], chunk_size=50)
+        self.assertEqual(2, len(c))
+        self.assertFalse(c.add("foo"))
+
+        self.assertTrue(c.add(*range(100)))
+        self.assertLess(abs(len(c) - 102), 5)
+
+    def test_merge(self):
+        c1 = HyperLogLogCache("merge1", ["foo", "bar"])
+        c2 = HyperLogLogCache("merge2", ["bar", "che"])
+        self.assertEqual(3, c1.count(c2))
+
+        c3 = HyperLogLogCache("merge3", ttl=10)
+        c3.merge(c1, c2)
+        self.assertEqual(3, len(c3))
+        self.assertLess(0, c3.interface.ttl(c3.key))
+
+
+class BloomCacheTest(TestCase):
+    def test_size(self):
+        c = BloomCache("size", capacity=1000, error_rate=0.01)
+        self.assertEqual(9586, c.size)
+        self.assertEqual(7, c.hash_count)
+
+    def test_add_contains(self):
+        c = BloomCache("add_contains", capacity=1000, error_rate=0.01, ttl=10)
+        self.assertTrue(c.add("foo", "bar"))
+        self.assertFalse(c.add("foo"))
+        self.assertTrue("foo" in c)
+        self.assertTrue(b"bar" in c)
+        self.assertFalse("che" in c)
+        self.assertLess(0, c.interface.ttl(c.key))
+
+        c.update(range(1000))
+        res = c.contains_many(range(1000))
+        self.assertTrue(all(res))
+
+        # false positives should be near the error rate
+        res = c.contains_many(range(1000, 3000))
+        self.assertLess(sum(res), 100)
+
+
+class BitmapCacheTest(TestCase):
+    def test_bits(self):
+        c = BitmapCache("bits", ttl=10)
+        self.assertEqual(0, c[100])
+        c[100] = 1
+        c[7] = True
+        self.assertEqual(1, c[100])
+        self.assertEqual(2, c.count())
+        self.assertLess(0, c.interface.ttl(c.key))
+
+        self.assertEqual([0, 0, 1], c.set_many({1: 1, 2: 1, 7: 0}))
+        self.assertEqual([1, 1, 0, 1], c.get_many([1, 2, 7, 100]))
+
+    def test_width(self):
+        c = BitmapCache("width", [1, 2, 3], width=4)
+        self.assertEqual([1, 2, 3, 0], c.get_many(range(4)))
+        c[3] = 15
+        self.assertEqual(15, c[3])
+        self.assertEqual(2, c.interface.strlen(c.key))
+
+        c = BitmapCache("width_signed", width=8, signed=True)
+        c[0] = -5
+        self.assertEqual(-5, c[0])
+
+    def test_bitop(self):
+        c1 = BitmapCache("bitop1", {1: 1, 2: 1})
+        c2 = BitmapCache("bitop2", {2: 1, 3: 1})
+
+        c3 = BitmapCache("bitop3")
+        c3.bitop("AND", c1, c2)
+        self.assertEqual([0, 1, 0], c3.get_many([1, 2, 3]))
+
+        c3.bitop("OR", c1, c2)
+        self.assertEqual(3, c3.count())
+
+
+class StreamCacheTest(TestCase):
+    def test_append_read(self):
+        c = StreamCache("append_read", ttl=10)
+        ids = c.append_many([{"foo": 1}, {"bar": 2}, 3])
+        self.assertEqual(3, len(ids))
+        self.assertEqual(3, len(c))
+        self.assertLess(0, c.interface.ttl(c.key))
+
+        msgs = c.read(count=2)
+        self.assertEqual([(ids[0], {"foo": 1}), (ids[1], {"bar": 2})], msgs)
+
+        msgs = c.read(last_id=msgs[-1][0])
+        self.assertEqual([(ids[2], 3)], msgs)
+        self.assertEqual([], c.read(last_id=ids[2]))
+
+        self.assertEqual([(ids[1], {"bar": 2})], c.range(ids[1], ids[1]))
+        self.assertEqual([], c.append_many([]))
+
+    def test_maxlen(self):
+        c = StreamCache("maxlen", maxlen=10)
+        c.append_many(range(1000))
+        self.assertLess(len(c), 1000)
+
+    def test_read_timeout(self):
+        c = StreamCache("read_timeout")
+        start = time.time()
+        self.assertEqual([], c.read(last_id="$", timeout=0.2))
+        self.assertLess(0.15, time.time() - start)
+
+        def append():
+            time.sleep(0.1)
+            c.append("foo")
+
+        t = threading.Thread(target=append)
+        t.start()
+        msgs = c.read(last_id="$", timeout=2)
+        t.join()
+        self.assertEqual("foo", msgs[0][1])
+
+    def test_read_timeout_slices(self):
+        class SliceStreamCache(StreamCache):
+            def block(self, callback, timeout):
+                # the first wait times out, then an entry is added before the
+                # next wait starts
+                callback(0.05)
+                self.append("between")
+                return callback(0.05)
+
+        c = SliceStreamCache("read_timeout_slices")
+        c.append("before")
+        msgs = c.read(last_id="$", timeout=1)
+        self.assertEqual(["between"], [v for _, v in msgs])
+
+    def test_group(self):
+        c = StreamCache("group")
+        self.assertTrue(c.create_group("g", last_id="0"))
+        self.assertFalse(c.create_group("g"))
+
+        c.append_many(range(10))
+        msgs = c.read_group("g", "c1", count=6)
+        self.assertEqual(list(range(6)), [v for _, v in msgs])
+
+        msgs2 = c.read_group("g", "c2", count=6, timeout=0.1)
+        self.assertEqual(list(range(6, 10)), [v for _, v in msgs2])
+
+        self.assertEqual(2, c.ack("g", *[msg_id for msg_id, _ in msgs[:2]]))
+        pending = c.read_group("g", "c1", pending=True)
+        self.assertEqual(list(range(2, 6)), [v for _, v in pending])
+
+        self.assertEqual([], c.read_group("g", "c1", timeout=0.1))
+
 
 # class StateCacheData(object): pass
 # class StateCacheTest(TestCase):
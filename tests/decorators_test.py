@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import functools
+import threading
+import time
 
 from . import TestCase
 
@@ -123,3 +125,20 @@ class DecoratorsTest(TestCase):
         self.assertFalse(self.called)
         self.assertEqual(6, v)
 
+    def test_cached_lock(self):
+        calls = []
+        @cached(Cache, key="cached_lock", lock=True)
+        def foo():
+            calls.append(1)
+            time.sleep(0.2)
+            return 5
+
+        ts = [threading.Thread(target=foo) for _ in range(5)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(5, foo())
+        self.assertEqual(1, len(calls))
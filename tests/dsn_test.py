@@ -4,6 +4,8 @@ import sys
 import time
 import random
 
+import testdata
+
 from . import TestCase
 
 import caches
@@ -20,6 +22,9 @@ class DSNTest(TestCase):
         self.assertFalse("rediss" in dsn.scheme)
         self.assertTrue(dsn.connection_config()["ssl"])
 
+        dsn = DSN('memory://')
+        self.assertEqual("caches.memory.InMemory", dsn.scheme)
+
     def test_password(self):
         dsn = DSN('redis://password@host:1234/dbname')
         self.assertTrue("password", dsn.password)
@@ -41,6 +46,33 @@ class DSNTest(TestCase):
         self.assertEqual(6379, dsn.port)
         self.assertEqual(1.0, dsn.query_params["socket_timeout"])
 
+    def test_connection_pool(self):
+        dsn = DSN("redis://localhost/0?max_connections=5&health_check_interval=10")
+        i = dsn.interface()
+        self.assertEqual(5, i.connection_pool.max_connections)
+        self.assertEqual(10, i.connection_pool.connection_kwargs["health_check_interval"])
+
+        dsn = DSN("redis://localhost/0?pool_class=blocking&max_connections=5&pool_timeout=0.5&share_pool=false")
+        self.assertFalse(dsn.pool_options["share_pool"])
+        self.assertFalse("pool_timeout" in dsn.connection_config())
+
+        i = dsn.interface()
+        pool = i.connection_pool
+        self.assertTrue(isinstance(pool, caches.interface.redis.BlockingConnectionPool))
+        self.assertEqual(5, pool.max_connections)
+        self.assertEqual(0.5, pool.timeout)
+
+        dsn = DSN("rediss://localhost/0?pool_class=blocking")
+        pool = dsn.connection_pool()
+        self.assertEqual(caches.interface.redis.SSLConnection, pool.connection_class)
+
+    def test_pool_key(self):
+        dsn1 = DSN("redis://localhost/0#foo")
+        dsn2 = DSN("redis://localhost/0#bar")
+        dsn3 = DSN("redis://localhost/1#che")
+        self.assertEqual(dsn1.pool_key, dsn2.pool_key)
+        self.assertNotEqual(dsn1.pool_key, dsn3.pool_key)
+
 
 class ConfigureTest(TestCase):
     def test_configure(self):
@@ -54,3 +86,17 @@ class ConfigureTest(TestCase):
 
         caches.interface.interfaces = {}
 
+    def test_configure_environ_share_pool(self):
+        environ = {
+            "CACHES_TEST_DSN_1": "redis://localhost/0#share1",
+            "CACHES_TEST_DSN_2": "redis://localhost/0#share2",
+            "CACHES_TEST_DSN_3": "redis://localhost/0?share_pool=false#share3",
+        }
+        with testdata.environment(**environ):
+            dsns = caches.configure_environ("CACHES_TEST_DSN")
+
+        self.assertEqual(3, len(dsns))
+        inters = [caches.get_interface(dsn.connection_name) for dsn in dsns]
+        self.assertIs(inters[0].connection_pool, inters[1].connection_pool)
+        self.assertIsNot(inters[0].connection_pool, inters[2].connection_pool)
+
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import socket
+import threading
+import time
+
+import redis
+
+from . import TestCase, ServersTestCase, RedisServer
+
+from caches.compat import *
+import caches
+import caches.interface
+from caches.dsn import DSN
+from caches.exception import CacheError
+
+
+class RegistryTest(TestCase):
+    def test_lazy(self):
+        calls = []
+        def factory():
+            calls.append(1)
+            return DSN("redis://localhost/0").interface()
+
+        caches.set_interface_factory(factory, "lazy")
+        self.assertEqual(0, len(calls))
+
+        i = caches.get_interface("lazy")
+        self.assertEqual(1, len(calls))
+        self.assertIs(i, caches.get_interface("lazy"))
+        self.assertEqual(1, len(calls))
+
+        i2 = DSN("redis://localhost/0").interface()
+        caches.set_interface(i2, "lazy")
+        self.assertIs(i2, caches.get_interface("lazy"))
+        caches.interface.interfaces.pop("lazy")
+
+        with self.assertRaises(KeyError):
+            caches.get_interface("lazy")
+
+    def test_threads(self):
+        calls = []
+        def factory():
+            calls.append(1)
+            return DSN("redis://localhost/0").interface()
+
+        caches.set_interface_factory(factory, "threads")
+
+        ts = [
+            threading.Thread(target=caches.get_interface, args=("threads",))
+            for _ in range(10)
+        ]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        caches.interface.interface_factories.pop("threads")
+        caches.interface.interfaces.pop("threads")
+
+    def test_fork(self):
+        caches.set_interface_factory(
+            lambda: DSN("redis://localhost/0").interface(),
+            "fork"
+        )
+        i = caches.get_interface("fork")
+
+        pid = caches.interface.interfaces_pid
+        caches.interface.interfaces_pid = -1
+        i2 = caches.get_interface("fork")
+        self.assertIsNot(i, i2)
+        self.assertEqual(pid, caches.interface.interfaces_pid)
+        self.assertIs(i2, caches.get_interface("fork"))
+
+        caches.interface.interface_factories.pop("fork")
+        caches.interface.interfaces.pop("fork")
+
+
+class ScriptTest(TestCase):
+    def test_noscript(self):
+        i = caches.get_interface()
+        script = caches.interface.Script("test.noscript", """
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        """)
+        i.script_flush()
+        self.assertEqual(2, script(i, keys=["script.noscript"], args=[2]))
+        self.assertEqual([True], i.script_exists(script.sha))
+        self.assertEqual(4, script(i, keys=["script.noscript"], args=[2]))
+
+    def test_pipeline(self):
+        i = caches.get_interface()
+        script = caches.interface.Script("test.pipeline", """
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        """)
+        i.script_flush()
+        with i.pipeline() as pipe:
+            script(pipe, keys=["script.pipeline"], args=[1])
+            script(pipe, keys=["script.pipeline"], args=[1])
+            self.assertEqual([1, 2], pipe.execute())
+
+
+class HashRingTest(TestCase):
+    def test_hash_tag(self):
+        ring = caches.interface.HashRing({"foo": 1, "bar": 2})
+        self.assertEqual("che", ring.hash_tag("{che}.baz"))
+        self.assertEqual("che", ring.hash_tag(b"{che}:0"))
+        self.assertEqual("{}.che", ring.hash_tag("{}.che"))
+        self.assertEqual(ring.get_name("{che}.1"), ring.get_name("{che}.2"))
+
+    def test_distribution(self):
+        ring = caches.interface.HashRing({"foo": 1, "bar": 2, "che": 3})
+        counts = {}
+        for i in range(3000):
+            name = ring.get_name("key{}".format(i))
+            counts[name] = counts.get(name, 0) + 1
+
+        self.assertEqual(3, len(counts))
+        for count in counts.values():
+            self.assertLess(500, count)
+
+
+class ShardedRedisTest(ServersTestCase):
+    def get_interface(self):
+        dsn = DSN("redis+sharded://{}/0".format(
+            ",".join("localhost:{}".format(s.port) for s in self.servers)
+        ))
+        return dsn.interface()
+
+    def test_commands(self):
+        i = self.get_interface()
+        keys = ["shard{}".format(x) for x in range(50)]
+        for k in keys:
+            i.set(k, k)
+
+        for node in i.nodes:
+            self.assertLess(0, node.dbsize())
+
+        self.assertEqual([ByteString(k) for k in keys], i.mget(keys))
+        self.assertEqual(50, len(list(i.scan_iter(match="shard*"))))
+        self.assertEqual(50, i.delete(*keys))
+        self.assertEqual(0, i.exists(*keys))
+
+        with self.assertRaises(CacheError):
+            i.blpop(keys[0:10], 0.1)
+
+    def test_pipeline(self):
+        i = self.get_interface()
+        with i.pipeline() as pipe:
+            for x in range(20):
+                pipe.incrby("pipe{}".format(x), x)
+            pipe.get("pipe19")
+            res = pipe.execute()
+
+        self.assertEqual(list(range(20)) + [b"19"], res)
+
+        script = caches.interface.Script("test.sharded", """
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        """)
+        self.assertEqual(20, script(i, keys=["pipe1"], args=[19]))
+        with i.pipeline() as pipe:
+            for x in range(20):
+                script(pipe, keys=["pipe{}".format(x)], args=[1])
+            res = pipe.execute()
+        self.assertEqual(21, res[1])
+
+    def test_cache(self):
+        i = self.get_interface()
+        caches.set_interface(i, "sharded")
+
+        class ShardedCache(caches.DictCache):
+            connection_name = "sharded"
+            hash_tag = True
+            serialize = False
+
+        for x in range(10):
+            c = ShardedCache(x)
+            self.assertEqual({"foo": 1, "bar": 2}, c.increment_many({"foo": 1, "bar": 2}))
+
+        caches.interface.interfaces.pop("sharded")
+
+
+class RedisClusterTest(ServersTestCase):
+    server_count = 1
+
+    server_args = ["--cluster-enabled", "yes"]
+
+    def test_cluster(self):
+        port = self.servers[0].port
+        node = DSN("redis://localhost:{}".format(port)).interface()
+        node.execute_command("CLUSTER", "ADDSLOTS", *range(16384))
+        for _ in range(100):
+            if node.execute_command("CLUSTER", "INFO").find(b"cluster_state:ok") >= 0:
+                break
+            time.sleep(0.1)
+
+        i = DSN("redis+cluster://localhost:{}".format(port)).interface()
+        caches.set_interface(i, "cluster")
+
+        class ClusterCache(caches.Cache):
+            connection_name = "cluster"
+            ttl = 10
+
+        c = ClusterCache("foo", data="bar")
+        self.assertEqual("bar", ClusterCache("foo").data)
+        self.assertEqual(1, len(list(i.scan_iter(match="ClusterCache*"))))
+
+        i.unsafe_flush()
+        self.assertIsNone(ClusterCache("foo").data)
+
+        caches.interface.interfaces.pop("cluster")
+
+
+class ReplicaTest(ServersTestCase):
+    server_count = 1
+
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaTest, cls).setUpClass()
+        # the replica is writable so the tests can tell which server was read
+        cls.servers.append(RedisServer(
+            "--replicaof", "localhost", str(cls.servers[0].port),
+            "--replica-read-only", "no",
+        ).start())
+
+    def get_interface(self, **query):
+        query["replicas"] = "localhost:{}".format(self.servers[1].port)
+        dsn = DSN("redis://localhost:{}/0?{}".format(
+            self.servers[0].port,
+            "&".join("{}={}".format(k, v) for k, v in query.items())
+        ))
+        return dsn.interface()
+
+    def test_reads(self):
+        i = self.get_interface()
+        self.assertEqual(1, len(i.replicas))
+
+        i.replicas[0].set("foo", "replica")
+        self.assertEqual(b"replica", i.get("foo"))
+        self.assertEqual(b"replica", i.get("foo"))
+
+        with caches.read_your_writes():
+            self.assertEqual(b"replica", i.get("foo"))
+            i.set("bar", 1)
+            self.assertIsNone(i.get("foo"))
+
+        self.assertEqual(b"replica", i.get("foo"))
+
+    def test_latency(self):
+        i = self.get_interface(read_strategy="latency")
+        i.replicas[0].set("foo", "replica")
+        for _ in range(5):
+            self.assertEqual(b"replica", i.get("foo"))
+        self.assertLess(0.0, i.replica_latencies[id(i.replicas[0])])
+
+    def test_replica_down(self):
+        dsn = DSN("redis://localhost:{}/0?replicas=localhost:1".format(
+            self.servers[0].port,
+        ))
+        i = dsn.interface()
+        i.set("foo", "primary")
+        self.assertEqual(b"primary", i.get("foo"))
+
+    def test_replica_timeout(self):
+        # a replica that accepts connections but never answers
+        s = socket.socket()
+        s.bind(("localhost", 0))
+        s.listen(1)
+        try:
+            dsn = DSN("redis://localhost:{}/0?replicas=localhost:{}&socket_timeout=0.2&socket_connect_timeout=0.2".format(
+                self.servers[0].port,
+                s.getsockname()[1],
+            ))
+            i = dsn.interface()
+            i.set("foo", "primary")
+            self.assertEqual(b"primary", i.get("foo"))
+
+        finally:
+            s.close()
+
+    def test_sentinel(self):
+        sentinel = RedisServer(
+            "--sentinel",
+            config="sentinel monitor caches 127.0.0.1 {} 1\n".format(
+                self.servers[0].port
+            ),
+        ).start()
+
+        try:
+            for _ in range(50):
+                dsn = DSN("redis://localhost/0?sentinels=localhost:{}&service_name=caches".format(
+                    sentinel.port
+                ))
+                i = dsn.interface()
+                if i.connection_pool.sentinel_manager.discover_slaves("caches"):
+                    break
+                time.sleep(0.2)
+
+            # the primary is looked up when connecting so a failover is followed
+            self.assertEqual(
+                self.servers[0].port,
+                i.connection_pool.get_master_address()[1]
+            )
+            self.assertEqual(6379, dsn.port)
+            self.assertEqual(1, len(i.replicas))
+
+            with caches.read_your_writes():
+                i.set("foo", "primary")
+                self.assertEqual(b"primary", i.get("foo"))
+
+        finally:
+            sentinel.stop()
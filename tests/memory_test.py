@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import threading
+import time
+
+import redis
+
+from . import TestCase
+from . import core_test
+
+import caches
+from caches.compat import *
+from caches.core import Cache, DictCache, SortedSetCache
+from caches.interface import Script
+from caches.memory import InMemory, get_store, script
+
+
+class MemoryTestCase(TestCase):
+    """Runs the tests against the memory interface instead of CACHES_DSN"""
+    @classmethod
+    def setUpClass(cls):
+        super(MemoryTestCase, cls).setUpClass()
+        caches.configure("memory://")
+        caches.get_interface().unsafe_flush()
+
+
+class MemoryTest(MemoryTestCase):
+    def test_configure(self):
+        i = caches.get_interface()
+        self.assertTrue(isinstance(i, InMemory))
+
+        i2 = caches.configure("memory:///1?pool_class=blocking#memory_test")
+        self.assertTrue(isinstance(i2, InMemory))
+        self.assertIs(i.store, i2.store)
+
+        i.set("foo", 1)
+        self.assertEqual(b"1", i.get("foo"))
+        self.assertIsNone(i2.get("foo"))
+
+    def test_ttl(self):
+        i = caches.get_interface()
+        i.set("ttl", 1, px=100)
+        self.assertLess(0, i.pttl("ttl"))
+        time.sleep(0.15)
+        self.assertIsNone(i.get("ttl"))
+        self.assertEqual(-2, i.ttl("ttl"))
+
+        i.hset("ttl", "foo", 1)
+        self.assertEqual(-1, i.ttl("ttl"))
+        i.expire("ttl", 10)
+        i.hset("ttl", "bar", 2)
+        self.assertEqual(10, i.ttl("ttl"))
+        i.set("ttl", 1)
+        self.assertEqual(-1, i.ttl("ttl"))
+
+    def test_types(self):
+        i = caches.get_interface()
+        i.sadd("types", 1)
+        with self.assertRaises(redis.ResponseError):
+            i.hget("types", "foo")
+
+        i.hset("types2", "foo", 1)
+        i.hdel("types2", "foo")
+        self.assertEqual(0, i.exists("types2"))
+
+    def test_pipeline(self):
+        i = caches.get_interface()
+        with i.pipeline() as pipe:
+            pipe.set("pipeline", 1)
+            pipe.incr("pipeline")
+            pipe.hget("pipeline", "foo")
+            pipe.get("pipeline")
+            res = pipe.execute(raise_on_error=False)
+
+        self.assertEqual(True, res[0])
+        self.assertEqual(2, res[1])
+        self.assertTrue(isinstance(res[2], redis.ResponseError))
+        self.assertEqual(b"2", res[3])
+
+        with i.pipeline(transaction=False) as pipe:
+            pipe.rpush("pipeline2", 1, 2, 3)
+            pipe.lrange("pipeline2", 0, -1)
+            self.assertEqual([3, [b"1", b"2", b"3"]], pipe.execute())
+
+    def test_scan(self):
+        i = caches.get_interface()
+        for x in range(10):
+            i.set("scan.{}".format(x), x)
+        i.set("other", 1)
+        self.assertEqual(10, len(list(i.scan_iter("scan.*"))))
+
+    def test_blocking(self):
+        s = SortedSetCache("blocking")
+
+        def add():
+            time.sleep(0.1)
+            SortedSetCache("blocking").add((1, "foo"))
+
+        t = threading.Thread(target=add)
+        t.start()
+        start = time.time()
+        self.assertEqual((1, "foo"), s.pop(timeout=2))
+        self.assertLess(time.time() - start, 1)
+        t.join()
+
+    def test_threads(self):
+        def incr():
+            for _ in range(100):
+                Cache("threads", serialize=False).increment(1)
+
+        ts = [threading.Thread(target=incr) for _ in range(5)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual(500, int(Cache("threads", serialize=False).data))
+
+    def test_script(self):
+        i = caches.get_interface()
+        lua = Script("memory_test.lua", "return redis.call('GET', KEYS[1])")
+        with self.assertRaises(redis.ResponseError):
+            lua(i, keys=["foo"])
+
+        s = Script("memory_test.python", "return redis.call('INCR', KEYS[1])")
+
+        @script("memory_test.python")
+        def incr(call, keys, args):
+            return call("INCR", keys[0])
+
+        self.assertEqual(1, s(i, keys=["script"]))
+        self.assertEqual(2, s(i, keys=["script"]))
+
+
+class MemoryCacheTest(MemoryTestCase, core_test.CacheTest): pass
+
+
+class MemoryDictCacheTest(MemoryTestCase, core_test.DictCacheTest): pass
+
+
+class MemorySetCacheTest(MemoryTestCase, core_test.SetCacheTest): pass
+
+
+class MemorySortedSetCacheTest(MemoryTestCase, core_test.SortedSetCacheTest): pass
+
+
+class MemoryListCacheTest(MemoryTestCase, core_test.ListCacheTest): pass
+
+
+class MemorySentinelCacheTest(MemoryTestCase, core_test.SentinelCacheTest): pass
+
+
+class MemoryRateLimitCacheTest(MemoryTestCase, core_test.RateLimitCacheTest): pass
+
+
+class MemoryLockCacheTest(MemoryTestCase, core_test.LockCacheTest): pass
+
+
+class MemoryHyperLogLogCacheTest(MemoryTestCase, core_test.HyperLogLogCacheTest): pass
+
+
+class MemoryBloomCacheTest(MemoryTestCase, core_test.BloomCacheTest): pass
+
+
+class MemoryBitmapCacheTest(MemoryTestCase, core_test.BitmapCacheTest): pass
+
+
+class MemoryStreamCacheTest(MemoryTestCase, core_test.StreamCacheTest): pass
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import socket
+import threading
+import time
+
+from . import TestCase
+
+from caches.compat import *
+import caches
+from caches.core import Cache, DictCache
+from caches.metrics import (
+    Histogram,
+    HistogramMetrics,
+    StatsdMetrics,
+    key_prefix,
+    command_key,
+    SpaceSaving,
+    HotKeys,
+)
+from caches.monitor import monitor
+
+
+class MetricsTest(TestCase):
+    def tearDown(self):
+        caches.set_metrics(None)
+        caches.enable_stats(False)
+        caches.enable_hotkeys(False)
+
+    def test_key_prefix(self):
+        self.assertEqual("DictCache", key_prefix("DictCache.foo.bar"))
+        self.assertEqual("DictCache", key_prefix(b"{DictCache.foo}"))
+        self.assertEqual("Cache", key_prefix("Cache:gen"))
+        self.assertEqual("foo", key_prefix("foo"))
+        self.assertEqual("", key_prefix(None))
+
+        self.assertEqual("foo", command_key(("GET", "foo")))
+        self.assertEqual("foo", command_key(("EVALSHA", "sha", 1, "foo", "bar")))
+        self.assertEqual(None, command_key(("EVALSHA", "sha", 0)))
+        self.assertEqual("foo", command_key(("XREAD", "COUNT", 1, "STREAMS", "foo", "0")))
+        self.assertEqual(None, command_key(("PING",)))
+
+    def test_histogram(self):
+        h = Histogram()
+        for v in range(1, 10001):
+            h.record(v)
+
+        self.assertEqual(10000, h.count)
+        self.assertEqual(1, h.min)
+        self.assertEqual(10000, h.max)
+        for p in [50, 90, 99]:
+            expected = p * 100
+            self.assertLess(abs(h.percentile(p) - expected) / expected, 0.04)
+
+        for v in [0, 1, 31, 32, 33, 1000, 123456789]:
+            i = h.index(v)
+            self.assertLessEqual(h.value(i), v)
+            self.assertLess(v, h.value(i + 1))
+
+        h2 = Histogram()
+        h2.record(20000)
+        h2.merge(h)
+        self.assertEqual(10001, h2.count)
+        self.assertEqual(1, h2.min)
+        self.assertEqual(20000, h2.max)
+
+    def test_histogram_metrics(self):
+        m = HistogramMetrics()
+        caches.set_metrics(m)
+
+        c = Cache("histogram_metrics")
+        c.data = "foo"
+        Cache("histogram_metrics").data
+
+        d = DictCache("histogram_metrics", ttl=10)
+        d["foo"] = "x" * 1000
+
+        s = m.snapshot()
+        self.assertEqual(1, s[("Cache", "SET")]["count"])
+        self.assertEqual(1, s[("Cache", "GET")]["count"])
+        self.assertEqual(0, s[("Cache", "GET")]["pipelined"])
+        self.assertLess(0, s[("Cache", "GET")]["bytes_in"])
+        self.assertLess(0, s[("Cache", "GET")]["p99_ms"])
+
+        self.assertEqual(1, s[("DictCache", "HSET")]["pipelined"])
+        self.assertLess(1000, s[("DictCache", "HSET")]["bytes_out"])
+        self.assertEqual(1, s[("DictCache", "EXPIRE")]["count"])
+
+        top = m.top(1, "bytes_out")
+        self.assertEqual(("DictCache", "HSET"), top[0][0])
+
+        m.reset()
+        self.assertEqual({}, m.snapshot())
+
+        caches.set_metrics(None)
+        Cache("histogram_metrics").data
+        self.assertEqual({}, m.snapshot())
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("localhost", 0))
+        server.settimeout(2)
+
+        caches.set_metrics(StatsdMetrics(port=server.getsockname()[1]))
+        Cache("statsd").data
+
+        packet = String(server.recv(65535))
+        server.close()
+        self.assertTrue(packet.startswith("caches.Cache.GET.time:"))
+        self.assertTrue("caches.Cache.GET.bytes_in:0|c" in packet)
+
+    def test_stats(self):
+        Cache("stats").data
+        self.assertEqual({"classes": {}, "functions": {}}, caches.stats())
+
+        caches.enable_stats()
+
+        class StatsCache(Cache): pass
+        StatsCache("stats").data
+        StatsCache("stats").data = "foo"
+        StatsCache("stats").data
+
+        d = DictCache("stats")
+        d["foo"] = 1
+        d["foo"]
+        with self.assertRaises(KeyError):
+            d["bar"]
+
+        s = caches.stats()["classes"]
+        self.assertEqual(1, s["StatsCache"]["hits"])
+        self.assertEqual(1, s["StatsCache"]["misses"])
+        self.assertEqual(1, s["StatsCache"]["sets"])
+        self.assertEqual(0.5, s["StatsCache"]["hit_rate"])
+        self.assertLess(0, s["StatsCache"]["bytes_read"])
+        self.assertLess(0, s["StatsCache"]["bytes_written"])
+        self.assertLess(0, s["StatsCache"]["deserialize_seconds"])
+        self.assertEqual(1, s["DictCache"]["hits"])
+        self.assertEqual(1, s["DictCache"]["misses"])
+
+        caches.reset_stats()
+        self.assertEqual({}, caches.stats()["classes"])
+
+    def test_stats_cached(self):
+        caches.enable_stats()
+
+        @caches.cached(Cache, key="stats_cached")
+        def foo():
+            return 1
+
+        foo()
+        foo()
+        foo()
+
+        s = caches.stats()["functions"]
+        name = "{}.{}".format(__name__, foo.__qualname__)
+        self.assertEqual(2, s[name]["hits"])
+        self.assertEqual(1, s[name]["misses"])
+        self.assertLess(0, s[name]["recompute_seconds"])
+
+    def test_hotkeys(self):
+        self.assertEqual({"hot": [], "big": []}, caches.hotkeys())
+
+        caches.enable_hotkeys(capacity=10)
+        m = HistogramMetrics()
+        caches.set_metrics(m)
+
+        for i in range(20):
+            Cache("hot").data
+        Cache("big").data = "x" * 10000
+        for i in range(30):
+            Cache(["cold", i]).data
+
+        top = caches.hotkeys(2)
+        self.assertEqual("Cache.hot", top["hot"][0][0])
+        self.assertLessEqual(20, top["hot"][0][1])
+        self.assertEqual("Cache.big", top["big"][0][0])
+        self.assertLess(10000, top["big"][0][1])
+        self.assertEqual(2, len(top["hot"]))
+
+        # the user metrics still get every command
+        self.assertEqual(50, m.snapshot()[("Cache", "GET")]["count"])
+
+        caches.enable_hotkeys(False)
+        self.assertIs(m, caches.metrics.hook)
+        caches.set_metrics(None)
+        self.assertIsNone(caches.metrics.hook)
+
+    def test_space_saving(self):
+        s = SpaceSaving(3)
+        for k in ("a" * 10) + ("b" * 6) + "cdefg" + "aa":
+            s.add(k)
+
+        top = s.top(2)
+        self.assertEqual("a", top[0][0])
+        self.assertEqual(12, top[0][1])
+        self.assertEqual("b", top[1][0])
+        self.assertEqual(3, len(s.counts))
+
+        s = SpaceSaving(10)
+        for i in range(1000):
+            s.add("hot")
+            s.add(i)
+        self.assertEqual(("hot", 1000, 0), s.top(1)[0])
+        self.assertEqual(10, len(s.counts))
+        self.assertGreaterEqual(20, len(s.heap.entries))
+
+    def test_hotkeys_big(self):
+        h = HotKeys(capacity=3)
+        for size in (10, 20, 30, 40, 5, 1, 50, 35):
+            h.add("k{}".format(size), size)
+        h.add("k10", 100)
+
+        self.assertEqual(
+            [("k10", 100), ("k50", 50), ("k40", 40)],
+            h.top()["big"],
+        )
+        self.assertEqual(3, len(h.big))
+        self.assertGreaterEqual(6, len(h.big_heap.entries))
+
+    def test_monitor(self):
+        sampler = HotKeys()
+        i = caches.get_interface()
+
+        def write():
+            time.sleep(0.2)
+            for _ in range(5):
+                Cache("monitor").data = "foo"
+
+        t = threading.Thread(target=write)
+        t.start()
+        monitor(i, sampler, 1)
+        t.join()
+
+        top = sampler.top(1)
+        self.assertEqual([("Cache.monitor", 5)], top["hot"])
+
+    def test_monitor_idle(self):
+        sampler = HotKeys()
+        i = caches.configure(
+            "redis://localhost/0?socket_timeout=0.2#monitor_idle"
+        )
+
+        def write():
+            # longer than the socket timeout so MONITOR has to start over
+            time.sleep(0.5)
+            for _ in range(3):
+                Cache("monitor.idle").data = "foo"
+
+        t = threading.Thread(target=write)
+        t.start()
+        start = time.monotonic()
+        monitor(i, sampler, 1)
+        t.join()
+
+        self.assertGreater(1.5, time.monotonic() - start)
+        self.assertEqual([("Cache.monitor.idle", 3)], sampler.top(1)["hot"])
+        caches.interface.interfaces.pop("monitor_idle")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import shutil
+import tempfile
+import threading
+import time
+
+from . import TestCase
+
+import caches
+from caches.compat import *
+from caches.core import Cache, DictCache
+from caches.tiered import TieredRedis, LocalTier, DiskTier
+
+
+class TieredTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        caches.interface.interfaces = {}
+        caches.configure_environ()
+
+    def get_interface(self, **params):
+        params.setdefault("disk_path", self.path)
+        params.setdefault("disk_min_size", 0)
+        dsn = "redis+tiered://localhost/0?{}".format(
+            "&".join("{}={}".format(k, v) for k, v in params.items())
+        )
+        return caches.configure(dsn)
+
+    def test_configure(self):
+        i = self.get_interface(local_ttl=5, mmap_size=10)
+        self.assertTrue(isinstance(i, TieredRedis))
+        self.assertEqual(5.0, i.local_ttl)
+        self.assertEqual(10, i.disk.mmap_size)
+
+    def test_promotion(self):
+        i = self.get_interface(mmap_size=100)
+        c = Cache("tiered.promotion", ttl=10)
+        c.data = "x" * 1000
+
+        key = ByteString(c.key)
+        self.assertEqual("x" * 1000, Cache("tiered.promotion").data)
+        self.assertIsNotNone(i.local.get(key, time.time()))
+
+        # the disk tier doesn't need redis
+        i.local.clear()
+        caches.interface.Redis(host="localhost", db=0).delete(c.key)
+        value, expires = i.disk.get(key, time.time())
+        self.assertTrue(isinstance(value, memoryview))
+        self.assertLess(time.time() + 9, expires)
+        self.assertEqual("x" * 1000, Cache("tiered.promotion").data)
+        self.assertIsNotNone(i.local.get(key, time.time()))
+
+    def test_invalidate(self):
+        i = self.get_interface()
+        c = Cache("tiered.invalidate")
+        c.data = 1
+        self.assertEqual(1, Cache("tiered.invalidate").data)
+
+        Cache("tiered.invalidate").data = 2
+        self.assertEqual(2, Cache("tiered.invalidate").data)
+
+        del Cache("tiered.invalidate").data
+        self.assertIsNone(Cache("tiered.invalidate").data)
+
+        c.data = 3
+        self.assertEqual(3, Cache("tiered.invalidate").data)
+        with i.pipeline() as pipe:
+            pipe.set(c.key, c.to_interface(4))
+            pipe.execute()
+        self.assertEqual(4, Cache("tiered.invalidate").data)
+
+        d = DictCache("tiered.invalidate", {"foo": 1})
+        self.assertEqual(1, d["foo"])
+
+    def test_invalidate_during_read(self):
+        i = self.get_interface()
+        c = Cache("tiered.race")
+        c.data = 1
+
+        # another thread writes after the value was read from redis but
+        # before it is copied into the local tiers
+        expires = i.expires
+        def write_then_expires(*args, **kwargs):
+            t = threading.Thread(target=lambda: setattr(c, "data", 2))
+            t.start()
+            t.join()
+            return expires(*args, **kwargs)
+        i.expires = write_then_expires
+
+        self.assertEqual(1, Cache("tiered.race").data)
+        i.expires = expires
+
+        key = ByteString(c.key)
+        self.assertIsNone(i.local.get(key, time.time()))
+        self.assertIsNone(i.disk.get(key, time.time()))
+        self.assertEqual(2, Cache("tiered.race").data)
+        self.assertIsNotNone(i.local.get(key, time.time()))
+
+    def test_ttl(self):
+        i = self.get_interface(local_ttl=0.2)
+        c = Cache("tiered.ttl")
+        c.data = 1
+        self.assertEqual(1, Cache("tiered.ttl").data)
+
+        # another process changes the value
+        r = caches.interface.Redis(host="localhost", db=0)
+        r.set(c.key, c.to_interface(2))
+        self.assertEqual(1, Cache("tiered.ttl").data)
+        time.sleep(0.25)
+        self.assertEqual(2, Cache("tiered.ttl").data)
+
+        c = Cache("tiered.ttl.redis", ttl=1)
+        c.data = 1
+        self.assertEqual(1, Cache("tiered.ttl.redis").data)
+        time.sleep(1.1)
+        self.assertIsNone(Cache("tiered.ttl.redis").data)
+
+    def test_local_tier(self):
+        t = LocalTier(10)
+        t.set(b"foo", b"12345", 0.0)
+        t.set(b"bar", b"12345", 0.0)
+        t.get(b"foo", time.time())
+        t.set(b"che", b"12345", 0.0)
+        self.assertIsNone(t.get(b"bar", time.time()))
+        self.assertIsNotNone(t.get(b"foo", time.time()))
+        self.assertEqual(10, t.size)
+
+        t.set(b"big", b"x" * 11, 0.0)
+        self.assertIsNone(t.get(b"big", time.time()))
+
+        t.set(b"expired", b"1", time.time() - 1)
+        self.assertIsNone(t.get(b"expired", time.time()))
+
+    def test_disk_tier(self):
+        t = DiskTier(self.path, min_size=2)
+        t.set(b"small", b"1", 0.0)
+        self.assertIsNone(t.get(b"small", time.time()))
+
+        t.set(b"foo", b"123", 0.0)
+        self.assertEqual((b"123", 0.0), t.get(b"foo", time.time()))
+
+        t.set(b"expired", b"123", time.time() - 1)
+        self.assertEqual(1, t.prune())
+        self.assertIsNone(t.get(b"expired", time.time()))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+
+from . import TestCase
+
+from caches.compat import *
+import caches
+from caches.core import Cache, DictCache, SetCache
+from caches.tracing import MemoryTracer, traced
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        self.tracer = MemoryTracer()
+        caches.set_tracer(self.tracer)
+
+    def tearDown(self):
+        caches.set_tracer(None)
+
+    def test_operation(self):
+        c = Cache("operation")
+        c.data = "foo"
+        Cache("operation").data
+
+        roots = self.tracer.roots
+        self.assertEqual(["Cache.data.set", "Cache.data.get"], [s.name for s in roots])
+
+        span = roots[1]
+        self.assertEqual("Cache", span.attributes["caches.class"])
+        self.assertEqual(c.key, span.attributes["caches.key"])
+        self.assertEqual(1, span.attributes["caches.commands"])
+        self.assertLess(0, span.attributes["caches.bytes_in"])
+        self.assertEqual(["GET"], [s.name for s in span.children])
+        self.assertEqual("redis", span.children[0].attributes["db.system"])
+        self.assertLessEqual(span.start_time, span.children[0].start_time)
+        self.assertLessEqual(span.children[0].end_time, span.end_time)
+
+    def test_pipeline(self):
+        d = DictCache("pipeline", ttl=10)
+        d["foo"] = 1
+
+        span = self.tracer.roots[0]
+        self.assertEqual("DictCache.__setitem__", span.name)
+        self.assertEqual(["PIPELINE"], [s.name for s in span.children])
+        self.assertEqual("HSET EXPIRE", span.children[0].attributes["db.operation"])
+        self.assertEqual(2, span.attributes["caches.commands"])
+
+    def test_generator(self):
+        d = DictCache("generator", {"foo": 1, "bar": 2})
+        self.tracer.clear()
+
+        it = d.items()
+        self.assertEqual([], self.tracer.spans)
+        next(it)
+
+        # the caller's own commands aren't children of the unfinished items()
+        Cache("generator").data
+        list(it)
+
+        roots = self.tracer.roots
+        self.assertEqual(["DictCache.items", "Cache.data.get"], [s.name for s in roots])
+        self.assertEqual(["HGETALL"], [s.name for s in roots[0].children])
+        self.assertIsNotNone(roots[0].end_time)
+
+    def test_nested(self):
+        d = DictCache("nested")
+        with self.assertRaises(KeyError):
+            d["foo"]
+
+        span = self.tracer.roots[0]
+        self.assertEqual("DictCache.__getitem__", span.name)
+        self.assertEqual(
+            ["HGET", "DictCache.__contains__"],
+            [s.name for s in span.children]
+        )
+        self.assertEqual(2, span.attributes["caches.commands"])
+        self.assertTrue(span.attributes["error"])
+        self.assertEqual("KeyError", span.attributes["error.type"])
+
+    def test_cached(self):
+        @caches.cached(Cache, key="tracing_cached")
+        def foo():
+            return 1
+
+        foo()
+        foo()
+
+        roots = self.tracer.roots
+        self.assertTrue(roots[0].name.startswith("cached."))
+        self.assertFalse(roots[0].attributes["caches.hit"])
+        self.assertTrue(roots[1].attributes["caches.hit"])
+        self.assertEqual(
+            ["Cache.data.get", "Cache.data.set"],
+            [s.name for s in roots[0].children]
+        )
+        self.assertEqual(2, roots[0].attributes["caches.commands"])
+
+    def test_off(self):
+        caches.set_tracer(None)
+        s = SetCache("off", [1, 2])
+        self.assertEqual([1, 2], sorted(s))
+        self.assertEqual([], self.tracer.spans)
+
+    def test_traced(self):
+        class TracedCache(Cache):
+            @traced()
+            def foo(self):
+                return self.data
+
+        TracedCache("traced").foo()
+        span = self.tracer.roots[0]
+        self.assertEqual("TracedCache.foo", span.name)
+        self.assertEqual(["TracedCache.data.get"], [s.name for s in span.children])